@@ -0,0 +1,187 @@
+package edu.berkeley.cs.jqf.fuzz.llmfuzz;
+
+import com.alibaba.fastjson2.JSONObject;
+import edu.univ.lab.entity.json.MethodJson;
+import org.apache.commons.lang3.tuple.ImmutablePair;
+import org.apache.commons.lang3.tuple.Pair;
+import org.apache.commons.lang3.tuple.Triple;
+
+import java.io.File;
+import java.util.*;
+import java.util.concurrent.ConcurrentHashMap;
+import java.util.concurrent.ExecutorService;
+import java.util.concurrent.Executors;
+import java.util.concurrent.TimeUnit;
+import java.util.function.Consumer;
+
+/**
+ * Compiles the cases streamed by llm-seed-generator while the generator is still running,
+ * so javac overlaps with the LLM calls and the cases and imports javac rejects are known
+ * before the driver with all the cases is compiled.
+ * The cases that arrived since the last compilation are compiled together in one driver,
+ * every case and import javac reports an error in is dropped and the others are compiled again,
+ * so the number of javac runs grows with the batches, not with the cases.
+ * Like in that driver, the cases are compiled with the imports of all the cases streamed so far;
+ * a case rejected before the last imports arrived is compiled again with all of them in {@link #filter}.
+ */
+public class CasePrecompiler implements Consumer<JSONObject> {
+    private final ExecutorService executor = Executors.newSingleThreadExecutor();
+    private final LLMFuzzGuidanceImpl checker = new LLMFuzzGuidanceImpl();
+    private final String signature;
+    private final MethodJson methodJson;
+    private final String jarPath;
+    private final Set<String> seenImports = new LinkedHashSet<>();
+    // cases streamed but not compiled yet
+    private final List<Pair<String, String>> pending = new ArrayList<>();
+    private final Set<Pair<String, String>> rejectedCases = ConcurrentHashMap.newKeySet();
+    private final Set<String> rejectedImports = ConcurrentHashMap.newKeySet();
+    // case -> number of imports seen when it failed to compile
+    private final Map<Pair<String, String>, Integer> failedCases = new ConcurrentHashMap<>();
+    private int checked = 0;
+    private int compilations = 0;
+
+    public CasePrecompiler(String signature, MethodJson methodJson, String jarPath) {
+        this.signature = signature;
+        this.methodJson = methodJson;
+        this.jarPath = jarPath;
+    }
+
+    @Override
+    public void accept(JSONObject aCase) {
+        Pair<String, String> input = new ImmutablePair<>(aCase.getString("input"), aCase.getString("receiver"));
+        List<String> imports = aCase.getList("imports", String.class);
+        synchronized (seenImports) {
+            seenImports.add("import " + methodJson.getClassName() + ";");
+            if (imports != null)
+                seenImports.addAll(imports);
+        }
+        boolean idle;
+        synchronized (pending) {
+            idle = pending.isEmpty();
+            pending.add(input);
+        }
+        // a batch already waiting for the compiler takes this case too
+        if (idle)
+            executor.submit(this::check);
+    }
+
+    private int seenImportCount() {
+        synchronized (seenImports) {
+            return seenImports.size();
+        }
+    }
+
+    private void check() {
+        List<Pair<String, String>> batch;
+        synchronized (pending) {
+            batch = new ArrayList<>(pending);
+            pending.clear();
+        }
+        if (batch.isEmpty())
+            return;
+        int seen = seenImportCount();
+        for (Pair<String, String> input : compiles(batch))
+            failedCases.put(input, seen);
+        checked += batch.size();
+    }
+
+    /**
+     * Compiles cases in one driver with the imports seen so far, dropping the imports and cases javac rejects
+     * until the others compile
+     * @return the cases that do not compile
+     */
+    private List<Pair<String, String>> compiles(List<Pair<String, String>> inputs) {
+        Set<String> imports;
+        synchronized (seenImports) {
+            imports = new LinkedHashSet<>(seenImports);
+        }
+        imports.removeAll(rejectedImports);
+        List<Pair<String, String>> cases = new ArrayList<>(inputs);
+        List<Pair<String, String>> failed = new ArrayList<>();
+        while (!cases.isEmpty()) {
+            Triple<List<Pair<Integer, Integer>>, Map<Integer, String>, String> driver = checker.initDriver(signature, cases, imports, methodJson);
+            SortedSet<Integer> errors = checker.compileDriverErrors(jarPath, driver.getRight());
+            compilations++;
+            if (errors.isEmpty()) {
+                delete(driver.getRight());
+                break;
+            }
+            List<Pair<Integer, Integer>> ranges = driver.getLeft();
+            Set<Pair<String, String>> wrong = new HashSet<>();
+            boolean attributed = true;
+            for (int line : errors) {
+                if (line < ranges.get(0).getLeft() && driver.getMiddle().containsKey(line)) {
+                    // a wrong import, try the cases again without it
+                    String importInfo = driver.getMiddle().get(line);
+                    rejectedImports.add(importInfo);
+                    imports.remove(importInfo);
+                    continue;
+                }
+                int i = 0;
+                while (i < ranges.size() && !(ranges.get(i).getLeft() <= line && line <= ranges.get(i).getRight()))
+                    i++;
+                if (i < ranges.size())
+                    wrong.add(cases.get(i));
+                else
+                    attributed = false;
+            }
+            if (!attributed && wrong.isEmpty() && errors.stream().noneMatch(driver.getMiddle()::containsKey)) {
+                // an error outside the cases, only compiling them one by one tells which are wrong
+                if (cases.size() == 1) {
+                    failed.addAll(cases);
+                    break;
+                }
+                for (Pair<String, String> input : cases)
+                    failed.addAll(compiles(List.of(input)));
+                break;
+            }
+            failed.addAll(wrong);
+            cases.removeAll(wrong);
+        }
+        return failed;
+    }
+
+    /**
+     * Deletes a compiled driver and its classes, the final driver reuses its name
+     */
+    private static void delete(String driverURL) {
+        File source = new File(driverURL);
+        String name = source.getName().substring(0, source.getName().length() - ".java".length());
+        File[] classes = source.getParentFile().listFiles((dir, file) -> file.equals(name + ".class") || file.startsWith(name + "$"));
+        if (classes != null)
+            for (File file : classes)
+                file.delete();
+        source.delete();
+    }
+
+    /**
+     * Waits for the pending cases and removes the rejected cases and imports from the parsed result
+     */
+    public void filter(Pair<List<Pair<String, String>>, Set<String>> inputs) {
+        shutdown();
+        int seen = seenImportCount();
+        List<Pair<String, String>> retried = new ArrayList<>();
+        for (Map.Entry<Pair<String, String>, Integer> failed : failedCases.entrySet()) {
+            // an import of a later case may be what it was missing
+            if (failed.getValue() == seen)
+                rejectedCases.add(failed.getKey());
+            else
+                retried.add(failed.getKey());
+        }
+        if (!retried.isEmpty())
+            rejectedCases.addAll(compiles(retried));
+        int before = inputs.getLeft().size();
+        inputs.getLeft().removeIf(rejectedCases::contains);
+        inputs.getRight().removeAll(rejectedImports);
+        System.out.println("Precompiled " + checked + " cases in " + compilations + " compilations, rejected " + (before - inputs.getLeft().size()) + " cases and " + rejectedImports.size() + " imports.");
+    }
+
+    public void shutdown() {
+        executor.shutdown();
+        try {
+            executor.awaitTermination(Long.MAX_VALUE, TimeUnit.MILLISECONDS);
+        } catch (InterruptedException e) {
+            throw new RuntimeException(e);
+        }
+    }
+}
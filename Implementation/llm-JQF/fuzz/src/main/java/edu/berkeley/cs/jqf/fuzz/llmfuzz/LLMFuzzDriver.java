@@ -45,9 +45,15 @@ public class LLMFuzzDriver {
                     continue;
                 }
 
+                // compile the cases streamed by the generator while it is still running
+                CasePrecompiler precompiler = null;
+                if (Boolean.parseBoolean(System.getProperty("jqf.llm.stream", "true")))
+                    precompiler = new CasePrecompiler(methodSignature, json, packageInfo.getLeft());
                 try {
-                    LLMFuzzGuidanceImpl.initInputs();
+                    LLMFuzzGuidanceImpl.initInputs(precompiler);
                 } catch (RuntimeException e) {
+                    if (precompiler != null)
+                        precompiler.shutdown();
                     LLMFuzzGuidanceImpl.writeResult(new ResultInfo(methodSignature, 0, 0, 0, 0.0, 0, 0, 0.0, "Cannot generate inputs."));
                     continue;
                 }
@@ -55,6 +61,8 @@ public class LLMFuzzDriver {
                 LLMFuzzGuidanceImpl guidance = new LLMFuzzGuidanceImpl();
                 Pair<List<Pair<String, String>>, Set<String>> listStringPair = guidance.parseResult();
                 listStringPair.getRight().add("import " + json.getClassName() + ";");
+                if (precompiler != null)
+                    precompiler.filter(listStringPair);
                 String driverURL = null;
                 while (!listStringPair.getLeft().isEmpty()) {
                     Triple<List<Pair<Integer, Integer>>, Map<Integer, String>, String> casesInterval = guidance.initDriver(methodSignature, listStringPair.getLeft(), listStringPair.getRight(), json);
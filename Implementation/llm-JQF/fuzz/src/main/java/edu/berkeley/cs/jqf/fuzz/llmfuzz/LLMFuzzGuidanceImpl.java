@@ -1,5 +1,7 @@
 package edu.berkeley.cs.jqf.fuzz.llmfuzz;
 
+import com.alibaba.fastjson2.JSON;
+import com.alibaba.fastjson2.JSONObject;
 import edu.berkeley.cs.jqf.fuzz.guidance.GuidanceException;
 import edu.berkeley.cs.jqf.fuzz.guidance.Result;
 import edu.berkeley.cs.jqf.fuzz.util.Coverage;
@@ -32,6 +34,8 @@ import java.util.*;
 import java.util.concurrent.TimeUnit;
 import java.util.concurrent.atomic.AtomicInteger;
 import java.util.function.Consumer;
+import java.util.regex.Matcher;
+import java.util.regex.Pattern;
 import java.util.stream.Collectors;
 
 import static edu.berkeley.cs.jqf.instrument.tracing.ThreadTracer.instructionMethod;
@@ -307,11 +311,32 @@ public class LLMFuzzGuidanceImpl implements LLMFuzzGuidance {
     }
 
     public static void initInputs() {
+        initInputs(null);
+    }
+
+    /**
+     * Runs llm-seed-generator for the current method.
+     *
+     * @param onCase if it is not null, main.py streams every case as a JSON line on its stdout
+     *               and onCase gets the cases while the generation continues
+     */
+    public static void initInputs(Consumer<JSONObject> onCase) {
         boolean logGenerate = Boolean.getBoolean("jqf.llm.logGenerate");
         try {
             ArrayList<String> list = new ArrayList<>();
             list.add("python3");
-            list.add("../llm-seed-generator/main.py");
+            // use the resident seed generator if there is one
+            String server = System.getProperty("jqf.llm.server");
+            if (server != null) {
+                list.add("../llm-seed-generator/client.py");
+                list.add("--socket");
+                list.add(server);
+            } else {
+                list.add("../llm-seed-generator/main.py");
+            }
+            boolean stream = onCase != null && server == null;
+            if (stream)
+                list.add("--stream");
             String skip = System.getProperty("jqf.llm.skip");
             if (skip != null)
                 switch (skip) {
@@ -325,11 +350,27 @@ public class LLMFuzzGuidanceImpl implements LLMFuzzGuidance {
                         list.add("basic");
                         break;
                 }
+            // repetitions of every equivalence class, main.py and client.py both take --times
+            String times = System.getProperty("jqf.llm.times");
+            if (times != null) {
+                list.add("--times");
+                list.add(times);
+            }
 
             ProcessBuilder processBuilder = new ProcessBuilder(list);
-            if (logGenerate)
+            if (stream)
+                processBuilder.redirectError(logGenerate ? ProcessBuilder.Redirect.INHERIT : ProcessBuilder.Redirect.DISCARD);
+            else if (logGenerate)
                 processBuilder.inheritIO();
             Process process = processBuilder.start();
+            if (stream) {
+                try (BufferedReader reader = new BufferedReader(new InputStreamReader(process.getInputStream()))) {
+                    String line;
+                    while ((line = reader.readLine()) != null)
+                        if (line.startsWith("{"))
+                            onCase.accept(JSON.parseObject(line));
+                }
+            }
             try {
                 int code = process.waitFor();
                 if (code != 0) {
@@ -345,10 +386,40 @@ public class LLMFuzzGuidanceImpl implements LLMFuzzGuidance {
     }
 
     public Pair<List<Pair<String, String>>, Set<String>> parseResult() {
-        String inputsInfo = FileUtils.readFile("../input_generator");
-        String[] cases = inputsInfo.split("---------------");
+        return parseResult("../input_generator");
+    }
+
+    /**
+     * Reads the cases written by llm-seed-generator, either JSON Lines (one case per line,
+     * with "input", "receiver" and "imports") or the old Part1/Part2/Part3 text format.
+     */
+    public Pair<List<Pair<String, String>>, Set<String>> parseResult(String path) {
         ArrayList<Pair<String, String>> left = new ArrayList<>();
         Set<String> right = new LinkedHashSet<>();
+        try (BufferedReader reader = new BufferedReader(new FileReader(path))) {
+            String line = reader.readLine();
+            if (line != null && line.startsWith("{")) {
+                for (; line != null; line = reader.readLine()) {
+                    if (line.isBlank())
+                        continue;
+                    JSONObject aCase = JSON.parseObject(line);
+                    left.add(new ImmutablePair<>(aCase.getString("input"), aCase.getString("receiver")));
+                    right.addAll(aCase.getList("imports", String.class));
+                }
+            } else if (line != null) {
+                StringBuilder inputsInfo = new StringBuilder(line);
+                for (line = reader.readLine(); line != null; line = reader.readLine())
+                    inputsInfo.append("\n").append(line);
+                parseTextResult(inputsInfo.toString(), left, right);
+            }
+        } catch (IOException e) {
+            System.out.println("Cannot read generated inputs: " + e.getMessage());
+        }
+        return new ImmutablePair<>(left, right);
+    }
+
+    private static void parseTextResult(String inputsInfo, List<Pair<String, String>> left, Set<String> right) {
+        String[] cases = inputsInfo.split("---------------");
         for (String aCase : cases) {
             if (!aCase.contains("Part1:"))
                 continue;
@@ -361,7 +432,6 @@ public class LLMFuzzGuidanceImpl implements LLMFuzzGuidance {
             left.add(new ImmutablePair<>(part1, part2));
             right.addAll(Arrays.stream(part3).map(String::trim).collect(Collectors.toList()));
         }
-        return new ImmutablePair<>(left, right);
     }
 
     public Triple<List<Pair<Integer, Integer>>, Map<Integer, String>, String> initDriver(String signature, List<Pair<String, String>> inputsInfo, Set<String> importsInfo, MethodJson methodJson) {
@@ -428,6 +498,14 @@ public class LLMFuzzGuidanceImpl implements LLMFuzzGuidance {
     }
 
     public int compileDriver(String jarPath, String driverURL) {
+        SortedSet<Integer> errors = compileDriverErrors(jarPath, driverURL);
+        return errors.isEmpty() ? 0 : errors.first();
+    }
+
+    /**
+     * Compiles a driver and returns the lines of all the errors javac reports, none if it compiles
+     */
+    public SortedSet<Integer> compileDriverErrors(String jarPath, String driverURL) {
         boolean logGenerate = Boolean.getBoolean("jqf.llm.logGenerate");
         StringBuilder result = new StringBuilder();
         try {
@@ -452,7 +530,7 @@ public class LLMFuzzGuidanceImpl implements LLMFuzzGuidance {
                 while ((line = bufferedReader.readLine()) != null)
                     result.append("\n").append(line);
                 if (logGenerate) System.out.println(result);
-                return 0;
+                return new TreeSet<>();
             } else {
                 InputStream inputStream = process.getErrorStream();
                 BufferedReader bufferedReader = new BufferedReader(new InputStreamReader(inputStream));
@@ -461,9 +539,16 @@ public class LLMFuzzGuidanceImpl implements LLMFuzzGuidance {
                     result.append("\n").append(line);
                 if (logGenerate) System.out.println(result);
                 new File(driverURL).delete();
-                int i1 = result.indexOf(".java:") + 6;
-                int i2 = result.indexOf(":", i1);
-                return Integer.parseInt(result.substring(i1, i2));
+                SortedSet<Integer> errors = new TreeSet<>();
+                Matcher matcher = Pattern.compile("\\.java:(\\d+): error:").matcher(result);
+                while (matcher.find())
+                    errors.add(Integer.parseInt(matcher.group(1)));
+                if (errors.isEmpty()) {
+                    int i1 = result.indexOf(".java:") + 6;
+                    int i2 = result.indexOf(":", i1);
+                    errors.add(Integer.parseInt(result.substring(i1, i2)));
+                }
+                return errors;
             }
         } catch (IOException | InterruptedException e) {
             throw new RuntimeException("Unknown Exception");
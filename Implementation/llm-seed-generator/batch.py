@@ -0,0 +1,133 @@
+"""
+Batch mode of llm-seed-generator, started by `python3 main.py --batch PATH [--out-dir DIR] [--workers N]`.
+
+PATH is either a directory of method-graph JSON files, a manifest,
+i.e. a text file with one method-graph path per line (relative paths are
+resolved against the manifest), or a snapshot of a whole library (see util/snapshot.py),
+whose methods are all processed. Every graph gets its own output file
+`<out-dir>/<graph name>.input_generator` (`<n>.input_generator` for the n-th method of a snapshot);
+graphs with the same file name, e.g. several `graph.json`, are named after their path instead, see `output_names`.
+`<out-dir>/summary.json`
+records the status, timing and token usage of each method (`<output>.usage.json` has every call).
+"""
+import glob
+import json
+import os
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import util.file_util
+import util.mg_util
+from driver.compile_validator import case_validators
+from util.snapshot import is_snapshot, open_snapshot
+
+
+def output_names(paths: List[str]) -> List[str]:
+    """
+    :return: the output name of every graph, its file name without extension, or its path relative
+             to the directory of all graphs if the file name is not unique, e.g. `a/graph.json` -> `a_graph`
+    """
+    stems = [os.path.splitext(os.path.basename(p))[0] for p in paths]
+    counts = Counter(stems)
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths]) if paths else ""
+    names = []
+    for (p, stem) in zip(paths, stems):
+        name = stem if counts[stem] == 1 \
+            else os.path.splitext(os.path.relpath(os.path.abspath(p), root))[0].replace(os.sep, "_")
+        # e.g. the same graph listed twice
+        unique = name
+        while unique in names:
+            unique = f"{name}-{len(names)}"
+        names.append(unique)
+    return names
+
+
+def collect_graphs(path: str) -> List[Tuple[str, Optional[str], str]]:
+    """
+    :return: (graph path, signature in the snapshot or None, output name) of every method graph
+    """
+    if os.path.isdir(path):
+        paths = sorted(glob.glob(os.path.join(path, "*.json")))
+    elif is_snapshot(path):
+        return [(path, signature, str(i)) for (i, signature) in enumerate(open_snapshot(path).signatures())]
+    else:
+        base = os.path.dirname(os.path.abspath(path))
+        with open(path, "r") as f:
+            lines = [line.strip() for line in f]
+        paths = [os.path.join(base, line) for line in lines if line and not line.startswith("#")]
+    return [(p, None, name) for (p, name) in zip(paths, output_names(paths))]
+
+
+def generate_one(generator, graph: Tuple[str, Optional[str], str], out_dir: str, skip=None,
+                 output_format: str = "jsonl", validate: bool = True, compile_service=None,
+                 generate_times: int = 1) -> dict:
+    (graph_path, signature, name) = graph
+    output_path = os.path.join(out_dir, name + ".input_generator")
+    record = {"graph": graph_path, "output": output_path}
+    if signature is not None:
+        record["signature"] = signature
+    start = time.time()
+    try:
+        mg_dict = util.file_util.read_graph(graph_path, signature)
+        record["className"] = mg_dict.get("className")
+        record["methodName"] = mg_dict.get("methodName")
+        util.mg_util.check_class_object(mg_dict)
+        validators = case_validators(mg_dict, validate, compile_service)
+        with util.file_util.CaseWriter(output_path, mg_dict["static"], output_format,
+                                       validators=validators, examples=generator.examples) as writer:
+            generator.generate_by_mode(mg_dict, skip, on_result=writer.write_partition,
+                                       generate_times=generate_times)
+        record["status"] = "ok"
+        record["cases"] = writer.cases
+        record["usage"] = generator.account(mg_dict, output_path)
+        record["validation"] = {type(validator).__name__: validator.stats() for validator in validators}
+    except Exception as e:
+        traceback.print_exc()
+        record["status"] = "error"
+        record["message"] = str(e)
+    record["elapsed"] = time.time() - start
+    return record
+
+
+def summarize_usage(records: List[dict]) -> dict:
+    """
+    Used to add up the token usage of all methods of a batch
+    """
+    usage = {}
+    for record in records:
+        for (key, value) in record.get("usage", {}).get("total", {}).items():
+            usage[key] = usage.get(key, 0) + value
+    return usage
+
+
+def run_batch(generator, path: str, out_dir: str, workers: int = 1, skip=None, output_format: str = "jsonl",
+              validate: bool = True, compile_service=None, generate_times: int = 1) -> dict:
+    """
+    Used to generate seeds for many method graphs with one warmed generator
+    :param workers: maximum number of methods processed at the same time
+    :param output_format: see `util.file_util.write_dict`
+    :param validate: drop the cases `driver.snippet_validator` rejects
+    :param compile_service: if given, also drop the cases javac rejects, see `driver.compile_validator`
+    :param generate_times: see `LLMGenerator.generate_by_mode`
+    :return the summary, which is also written into `<out_dir>/summary.json`
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    graphs = collect_graphs(path)
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        records = list(executor.map(lambda g: generate_one(generator, g, out_dir, skip, output_format, validate,
+                                                                compile_service, generate_times), graphs))
+    summary = {
+        "total": len(records),
+        "ok": sum(1 for record in records if record["status"] == "ok"),
+        "error": sum(1 for record in records if record["status"] != "ok"),
+        "elapsed": time.time() - start,
+        "usage": summarize_usage(records),
+        "methods": records
+    }
+    with open(os.path.join(out_dir, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
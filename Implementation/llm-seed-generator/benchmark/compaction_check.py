@@ -0,0 +1,104 @@
+"""
+Run `python3 -m benchmark.compaction_check [--max-lines N] [GRAPH ...]` in llm-seed-generator
+to check the prompt compaction (prompt/compaction.py) on the method graphs of benchmark/corpus
+and benchmark/corpus/compaction, without an endpoint.
+
+Reported per method graph: the tokens of the method code and of the parameter information
+(as rendered by `mg_util.parameter_info`) before and after compaction, i.e. the tokens saved in every prompt
+carrying the method and in the prompts also carrying its parameter information.
+
+A compacted prompt must still be complete, the check fails if
+* the method name, a parameter name or the simple name of a parameter type is gone from the code,
+* a line of the branch structure (if, for, return, throw, ...) is gone from the code,
+* a parameter type, a type named in the code, a type a kept constructor needs or the field type of a kept type
+  is gone from the parameter information,
+* a kept sub class listing names a type that is gone.
+"""
+import argparse
+import contextlib
+import glob
+import io
+import os
+import sys
+
+from config import PROMPT_MAX_CODE_LINES
+from model.accounting import count_tokens
+from prompt.compaction import BRANCH, IDENTIFIER, SUB_CLASS_KEYS, PromptCompactor, simple_name, strip_comments, \
+    strip_whitespace
+from util.file_util import read_graph
+from util.mg_util import ParameterCache, parameter_info, parameters
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def check_code(mg: dict, compacted: dict) -> list:
+    code = compacted["code"]
+    identifiers = set(IDENTIFIER.findall(code))
+    problems = [f"{name} is missing" for name in [mg["methodName"], *mg["parameters"]] if name not in identifiers]
+    for typ in mg["parameters"].values():
+        name = simple_name(typ).rstrip("[]")
+        if name in mg["code"] and name not in code:
+            problems.append(f"parameter type {name} is missing")
+    kept = {line.strip() for line in code.split("\n")}
+    for line in strip_whitespace(strip_comments(mg["code"])).split("\n"):
+        if BRANCH.match(line) and line.strip() not in kept:
+            problems.append(f"branch line is missing: {line.strip()}")
+    return problems
+
+
+def check_types(mg: dict, compacted: dict, before: dict, after: dict) -> list:
+    referenced = set(IDENTIFIER.findall(compacted["code"]))
+    problems = []
+    for (name, info) in before.items():
+        if name in after:
+            continue
+        if name in mg["parameters"].values():
+            problems.append(f"parameter type {name} is missing")
+        elif simple_name(name) in referenced:
+            problems.append(f"type {name} named in the code is missing")
+    for (name, info) in after.items():
+        for key in SUB_CLASS_KEYS:
+            for sub_class in (info.get(key) or {}).values():
+                if sub_class in before and sub_class not in after:
+                    problems.append(f"sub class {sub_class} of {name} is missing")
+        for params in (info.get("constructors") or {}).values():
+            for typ in params.values():
+                if typ in before and typ not in after:
+                    problems.append(f"constructor parameter type {typ} of {name} is missing")
+        for typ in ((mg["nodes"].get(name) or {}).get("fields") or {}).values():
+            if typ in before and typ not in after:
+                problems.append(f"field type {typ} of {name} is missing")
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("graphs", nargs="*")
+    parser.add_argument("--max-lines", type=int, default=PROMPT_MAX_CODE_LINES)
+    args = parser.parse_args()
+
+    paths = args.graphs or sorted(glob.glob(os.path.join(ROOT, "corpus", "*.json"))
+                                  + glob.glob(os.path.join(ROOT, "corpus", "compaction", "*.json")))
+    compactor = PromptCompactor(max_lines=args.max_lines)
+    failed = 0
+    print(f"{'method':<16}{'code':>14}{'parameter info':>18}")
+    for path in paths:
+        mg = read_graph(path)
+        # both print what they do
+        with contextlib.redirect_stdout(io.StringIO()):
+            compacted = compactor.graph(mg)
+            cache = ParameterCache(compactor=compactor)
+            (info_before, info_after) = (parameter_info(mg, layer=10), parameter_info(compacted, layer=10, cache=cache))
+        problems = check_code(mg, compacted) + check_types(mg, compacted, parameters(mg, layer=10),
+                                                           parameters(compacted, layer=10, cache=cache))
+        code = f"{count_tokens(mg['code'])} -> {count_tokens(compacted['code'])}"
+        info = f"{count_tokens(info_before)} -> {count_tokens(info_after)}"
+        print(f"{mg['methodName']:<16}{code:>14}{info:>18}")
+        for problem in problems:
+            print(f"\033[31m    {problem}\033[0m")
+        failed += bool(problems)
+    stats = compactor.stats()
+    print(f"> saved {stats['code']['saved']} tokens of code, {stats['types']['saved']} of parameter information")
+    if failed:
+        print(f"\033[31m> {failed} of {len(paths)} method graphs lost information\033[0m")
+        sys.exit(1)
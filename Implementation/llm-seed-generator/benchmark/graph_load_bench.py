@@ -0,0 +1,68 @@
+"""
+Run `python3 -m benchmark.graph_load_bench [--nodes N] [--layer N]` in llm-seed-generator to compare
+`util.graph_loader.load_graph` with reading the whole file, stripping newlines and `json.loads`.
+
+The synthetic graph of `benchmark.mg_bench` is written like the Java side writes it,
+with raw newlines inside the code of the method. Each loader is measured on loading
+plus a parameter closure, which decodes only the nodes the BFS reaches.
+Both loaders must return the same graph.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmark.mg_bench import synthetic_graph
+from util.graph_loader import load_graph
+from util.mg_util import parameters
+
+
+def legacy_read_graph(path: str) -> dict:
+    file = open(path, "r")
+    file_content = file.read()
+    file.close()
+    return json.loads(file_content.replace("\n", ""))
+
+
+def measure(read, path: str, layer: int) -> dict:
+    start = time.perf_counter()
+    mg = read(path)
+    loaded = time.perf_counter() - start
+    types = parameters(mg, layer=layer)
+    elapsed = time.perf_counter() - start
+    # tracemalloc slows allocations down, so the peak is taken in a second run
+    tracemalloc.start()
+    parameters(read(path), layer=layer)
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"load": loaded, "total": elapsed, "peak": peak, "types": len(types)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=50000)
+    parser.add_argument("--layer", type=int, default=3)
+    args = parser.parse_args()
+
+    mg = synthetic_graph(args.nodes)
+    mg.update({"className": mg["parameters"]["arg0"], "methodName": "m", "static": True,
+               "code": "{\n    // a comment\n    return a.equals(\"x\");\n}"})
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "graph.json")
+        with open(path, "w") as f:
+            # escaped newlines become raw ones, as in the graphs written by the Java side
+            f.write(json.dumps(mg, indent=1).replace("\\n", "\n"))
+        print(f"graph.json: {os.path.getsize(path) / 2 ** 20:.1f} MiB, {len(mg['nodes'])} nodes")
+
+        expected = legacy_read_graph(path)
+        lazy = load_graph(path)
+        assert {**lazy, "nodes": lazy["nodes"].to_dict()} == expected, "different graph"
+        assert parameters(load_graph(path), layer=10) == parameters(expected, layer=10)
+
+        print(f"{'loader':<10}{'load(s)':>10}{'total(s)':>10}{'peak(MiB)':>12}{'types':>8}")
+        for (name, read) in [("legacy", legacy_read_graph), ("lazy", load_graph)]:
+            result = measure(read, path, args.layer)
+            print(f"{name:<10}{result['load']:>10.3f}{result['total']:>10.3f}"
+                  f"{result['peak'] / 2 ** 20:>12.1f}{result['types']:>8}")
@@ -0,0 +1,198 @@
+"""
+Run `python3 -m benchmark.mg_bench [--nodes N] [--runs N]` in llm-seed-generator to compare
+`util.mg_util.parameters` with the queue-based implementation it replaced.
+
+The graph is synthetic: every class has a few constructors, fields and subclasses
+pointing at random other types, and a part of the types are jdk-builtin (empty nodes).
+Both implementations must return identical results for every layer that is measured.
+
+The second table is the pattern of one generation run: every chain and equivalence
+class asks for the same closures of the same graph, with and without a `ParameterCache`.
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from queue import Queue
+from typing import Dict
+
+from util.mg_util import OBTAIN_ALL_PARAM_INFO, MethodGraph, ParameterCache, parameter_info, parameters
+
+def legacy_parameters(mg: dict, layer: int = OBTAIN_ALL_PARAM_INFO, max_sub_num: int = sys.maxsize) -> Dict[str, Dict]:
+    """
+    `util.mg_util.parameters` before the `MethodGraph` index, kept as the reference
+    """
+    types: Dict[str, Dict] = {}
+    q1, q2, current_layer = Queue(), Queue(), 0
+    s = set()
+    # initialize, q1 and q2 are both used to do bfs.
+    # q1 is used to pop, while q2 is used to load types of new layer
+    [q1.put_nowait(param_type) for (param_name, param_type) in mg["parameters"].items()]
+    while not q1.empty():
+        typ = q1.get_nowait()
+        if typ in mg["nodes"]:
+
+            t_node = mg["nodes"][typ]
+            if typ not in s:
+                s.add(typ)
+                if not t_node:
+                    # it means that it's a jdk-builtin type
+                    types[typ] = types.get(typ, dict())
+                    types[typ].update({"__is_jdk_type__": True})
+                else:
+                    types[typ] = types.get(typ, dict())
+                    types[typ] = {**types[typ], "classType": t_node.get("classType")}
+                    node = types[typ]
+                    if t_node.get("classType") == "class":
+                        node["constructors"] = node.get("constructors", dict())
+                        node["constructors"] = {**node["constructors"],
+                                                **t_node.get("constructors", dict())}
+                    if t_node.get("subClassName"):
+                        if current_layer < layer:
+                            size = max_sub_num if len(t_node.get("subClassName")) > max_sub_num else len(
+                                t_node.get("subClassName"))
+                            node["subClassName"] = node.get("subClassName", dict())
+
+                            # key = random.choice(list(t_node.get("subClassName")))
+                            # node["subClassName"] = {**node["subClassName"], "subClass0": key}
+                            # q2.put_nowait(key)
+
+                            for subClass_t in t_node["subClassName"]:
+                                size -= 1
+                                if not types.get(subClass_t):
+                                    node["subClassName"] = node.get("subClassName", dict())
+                                    node["subClassName"] = {**node["subClassName"],
+                                                            "subClass" + str(max_sub_num - size): subClass_t}
+                                    q2.put_nowait(subClass_t)
+                                if size == 0:
+                                    break
+                    if t_node.get("implementedClassName"):
+                        if current_layer < layer:
+                            size = max_sub_num if len(t_node.get("implementedClassName")) > max_sub_num else len(
+                                t_node.get("implementedClassName"))
+                            node["implementedClassName"] = node.get("implementedClassName", dict())
+
+                            # key = random.choice(list(t_node.get("subClassName")))
+                            # node["subClassName"] = {**node["subClassName"], "subClass0": key}
+                            # q2.put_nowait(key)
+
+                            for subInterface_t in t_node["implementedClassName"]:
+                                size -= 1
+                                if not types.get(subInterface_t):
+                                    node["implementedClassName"] = node.get("implementedClassName", dict())
+                                    node["implementedClassName"] = {**node["implementedClassName"],
+                                                            "implementedClass" + str(max_sub_num - size): subInterface_t}
+                                    q2.put_nowait(subInterface_t)
+                                if size == 0:
+                                    break
+                    if t_node.get("subInterfaceName"):
+                        if current_layer < layer:
+                            size = max_sub_num if len(t_node.get("subInterfaceName")) > max_sub_num else len(
+                                t_node.get("subInterfaceName"))
+                            for sub_interface_t in t_node["subInterfaceName"]:
+                                size -= 1
+                                if not types.get(sub_interface_t):
+                                    node["subInterfaceName"] = node.get("subInterfaceName", dict())
+                                    node["subInterfaceName"] = {**node["subInterfaceName"],
+                                                                "subInterface" + str(max_sub_num - size): sub_interface_t}
+                                    q2.put_nowait(sub_interface_t)
+                                if size == 0:
+                                    break
+                    if t_node.get("fields"):
+                        for field_t in t_node["fields"].values():
+                            q2.put_nowait(field_t)
+                    if t_node.get("constructors"):
+                        if t_node.get("classType") == "class":
+                            for constructor_params in t_node["constructors"].values():
+                                for param_t in constructor_params.values():
+                                    q2.put_nowait(param_t)
+        # since q1.get_nowait might pop the last element in queue,
+        # to avoid jumping out this loop when q2 is not empty,
+        # push all the elements of q2 into q1
+        if q1.empty():
+            if layer != OBTAIN_ALL_PARAM_INFO and current_layer >= layer:
+                return types
+            current_layer += 1
+            while not q2.empty():
+                q1.put_nowait(q2.get_nowait())
+    return types
+
+
+def synthetic_graph(size: int, seed: int = 0) -> dict:
+    rnd = random.Random(seed)
+    names = [f"com.example.pkg{i % 97}.Type{i}" for i in range(size)]
+    jdk = [f"java.lang.Jdk{i}" for i in range(size // 20)]
+    pick = lambda: rnd.choice(names) if rnd.random() < 0.8 else rnd.choice(jdk)
+    nodes = {name: {} for name in jdk}
+    for name in names:
+        class_type = rnd.choice(["class", "class", "class", "interface", "abstract class"])
+        node = {"classType": class_type}
+        if class_type == "class":
+            node["constructors"] = {
+                f"{name}({c})": {f"p{j}": pick() for j in range(rnd.randint(0, 3))} for c in range(rnd.randint(1, 3))
+            }
+        if rnd.random() < 0.5:
+            node["fields"] = {f"f{j}": pick() for j in range(rnd.randint(1, 4))}
+        if class_type != "class":
+            node["implementedClassName" if class_type == "interface" else "subClassName"] = \
+                rnd.sample(names, rnd.randint(1, 6))
+            if class_type == "interface" and rnd.random() < 0.3:
+                node["subInterfaceName"] = rnd.sample(names, rnd.randint(1, 3))
+        elif rnd.random() < 0.2:
+            node["subClassName"] = rnd.sample(names, rnd.randint(1, 4))
+        nodes[name] = node
+    # types without node are skipped by the bfs
+    nodes[names[1]].setdefault("fields", {})["missing"] = "com.example.Missing"
+    roots = [name for name in names if nodes[name]["classType"] == "class"][:3]
+    return {"parameters": {f"arg{i}": root for (i, root) in enumerate(roots)}, "nodes": nodes}
+
+
+def measure(function, runs: int) -> float:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=20000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    mg = synthetic_graph(args.nodes)
+    print(f"{'layer':<8}{'max_sub':>8}{'types':>8}{'legacy(s)':>12}{'indexed(s)':>12}{'reused(s)':>12}{'speedup':>10}")
+    for (layer, max_sub_num) in [(1, 2), (3, 3), (OBTAIN_ALL_PARAM_INFO, 3), (OBTAIN_ALL_PARAM_INFO, sys.maxsize)]:
+        expected = legacy_parameters(mg, layer, max_sub_num)
+        assert parameters(mg, layer, max_sub_num) == expected, f"different result on layer {layer}"
+        graph = MethodGraph(mg)
+        roots = list(mg["parameters"].values())
+        legacy = measure(lambda: legacy_parameters(mg, layer, max_sub_num), args.runs)
+        indexed = measure(lambda: parameters(mg, layer, max_sub_num), args.runs)
+        reused = measure(lambda: graph.parameters(roots, layer, max_sub_num), args.runs)
+        print(f"{layer:<8}{min(max_sub_num, 999):>8}{len(expected):>8}{legacy:>12.4f}{indexed:>12.4f}"
+              f"{reused:>12.4f}{legacy / indexed:>10.2f}")
+
+    # understanding (layer 10) per equivalence class, non-ep understanding (layer 1), non-understanding info (layer 10)
+    calls = [(10, sys.maxsize)] * 4 + [(1, sys.maxsize), (10, sys.maxsize)]
+    cache = ParameterCache()
+    for (layer, max_sub_num) in set(calls):
+        assert parameters(mg, layer, max_sub_num, cache=cache) == legacy_parameters(mg, layer, max_sub_num)
+        assert parameters(mg, layer, max_sub_num, cache=cache) is parameters(mg, layer, max_sub_num, cache=cache)
+    other = synthetic_graph(args.nodes // 10, seed=1)
+    assert parameters(other, 10, cache=cache) == legacy_parameters(other, 10)
+    assert parameter_info(mg, 10, cache=cache) == parameter_info(mg, 10)
+
+    uncached = measure(lambda: [parameters(mg, layer, max_sub_num) for (layer, max_sub_num) in calls], args.runs)
+    def run_cached():
+        # one cache per generation run
+        run_cache = ParameterCache()
+        return [parameters(mg, layer, max_sub_num, cache=run_cache) for (layer, max_sub_num) in calls]
+
+    cached = measure(run_cached, args.runs)
+    print()
+    print(f"{'calls':<8}{'uncached(s)':>12}{'cached(s)':>12}{'speedup':>10}")
+    print(f"{len(calls):<8}{uncached:>12.4f}{cached:>12.4f}{uncached / cached:>10.2f}")
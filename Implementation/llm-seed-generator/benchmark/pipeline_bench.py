@@ -0,0 +1,114 @@
+"""
+Run `python3 -m benchmark.pipeline_bench [--latency SPEC] [--concurrency N] [--repeat N]
+[--times N] [--multi-sample | --single-sample] [--batch K]` in llm-seed-generator to measure the whole pipeline of every generation mode without an endpoint.
+
+The chains answer from `model.replay_llm.ReplayLLM`: responses recorded with `main.py --record`
+(benchmark/corpus/responses.jsonl by default) are replayed after a latency drawn from SPEC,
+e.g. `lognormal:0.5,0.4`. Every mode generates for all method graphs of the corpus with a new
+generator, the response cache is bypassed, the constructor memo and the harvesting of examples are off.
+`--times` generates every equivalence class several times, in one request with `--multi-sample`,
+one request each with `--single-sample`, as `[LLM] MULTI_SAMPLE` says by default.
+`--batch` asks for up to K equivalence classes of an all-primitive method in one request.
+
+Reported per mode: methods per second, LLM calls, the time spent waiting for the model
+and everything else (overhead), and where the overhead goes: prompt formatting,
+response parsing and `mg_util.parameters`. The peak memory is taken in a second run without latency.
+Per stage: calls, waiting, prompt tokens and the share of them in prompt prefixes sent before, see prompt/layout.py.
+A mode that raises is reported as failed and the others are still run, the exit status is 1 if any failed.
+"""
+import argparse
+import contextlib
+import glob
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+import util.trace
+from config import LLM_MULTI_SAMPLE
+from model.accounting import prefix_ratio, summarize
+from model.replay_llm import ReplayLLM
+from model.v2.llm_generator import LLMGenerator
+from util.file_util import read_graph
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+MODES = {"full": None, "skipEP": "skipEP", "skipUnder": "skipUnder", "basic": "basic"}
+
+
+def run_mode(skip, graphs: list, responses: str, latency: str, concurrency: int, repeat: int,
+             times: int = 1, multi_sample: bool = LLM_MULTI_SAMPLE, batch: int = 1) -> dict:
+    generator = LLMGenerator(cache_bypass=True, max_concurrency=concurrency,
+                             client=ReplayLLM(responses, latency=latency), multi_sample=multi_sample,
+                             batch_partitions=batch)
+    generator.memo.enabled = False
+    generator.examples.harvesting = False
+    # the chains print every prompt and response
+    with contextlib.redirect_stdout(io.StringIO()):
+        generator.prepare(skip)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for mg_dict in graphs:
+                generator.generate_by_mode(mg_dict, skip, generate_times=times)
+        elapsed = time.perf_counter() - start
+    records = generator.llm.take()
+    return {"elapsed": elapsed, "methods": len(graphs) * repeat, "records": records}
+
+
+def span_seconds(summary: dict, part: str) -> float:
+    return sum(total["seconds"] for (name, total) in summary.items() if part in name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=os.path.join(ROOT, "corpus"), help="a directory of method graphs")
+    parser.add_argument("--responses", default=os.path.join(ROOT, "corpus", "responses.jsonl"))
+    parser.add_argument("--latency", default="fixed:0.05", help="see model.replay_llm.Latency")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--times", type=int, default=1)
+    parser.add_argument("--multi-sample", dest="multi_sample", action="store_true", default=LLM_MULTI_SAMPLE)
+    parser.add_argument("--single-sample", dest="multi_sample", action="store_false")
+    parser.add_argument("--batch", type=int, default=1)
+    args = parser.parse_args()
+
+    graphs = [read_graph(path) for path in sorted(glob.glob(os.path.join(args.corpus, "*.json")))]
+    print(f"{len(graphs)} method graphs, latency {args.latency}, concurrency {args.concurrency}")
+    print(f"{'mode':<11}{'methods/s':>10}{'calls':>7}{'wall(s)':>9}{'llm(s)':>8}{'other(s)':>9}"
+          f"{'format(ms)':>11}{'parse(ms)':>10}{'params(ms)':>11}{'peak(MiB)':>10}")
+    failed = []
+    for mode in args.modes.split(","):
+        try:
+            util.trace.start()
+            try:
+                result = run_mode(MODES[mode], graphs, args.responses, args.latency, args.concurrency, args.repeat,
+                                  args.times, args.multi_sample, args.batch)
+            finally:
+                summary = util.trace.stop(os.devnull)
+            # tracemalloc slows allocations down, so the peak is taken in a second run
+            tracemalloc.start()
+            try:
+                run_mode(MODES[mode], graphs, args.responses, "fixed:0", args.concurrency, 1,
+                         args.times, args.multi_sample, args.batch)
+                (_, peak) = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+        except Exception as e:
+            print(f"\033[31m{mode:<11}failed: {type(e).__name__}: {e}\033[0m")
+            failed.append(mode)
+            continue
+        # with more than one request in flight, the waiting overlaps and "other" is not meaningful
+        waited = sum(record["latency"] for record in result["records"])
+        print(f"{mode:<11}{result['methods'] / result['elapsed']:>10.2f}{len(result['records']):>7}"
+              f"{result['elapsed']:>9.2f}{waited:>8.2f}{max(0.0, result['elapsed'] - waited):>9.3f}"
+              f"{span_seconds(summary, '.format_messages') * 1000:>11.1f}"
+              f"{span_seconds(summary, '.parse_') * 1000:>10.1f}"
+              f"{span_seconds(summary, 'mg_util.parameters') * 1000:>11.1f}{peak / 2 ** 20:>10.1f}")
+        for (name, totals) in summarize(result["records"])["stages"].items():
+            print(f"    {name:<28}{totals['calls']:>5} calls{totals['latency']:>8.2f}s"
+                  f"{totals['prompt_tokens']:>9} prompt tokens, {prefix_ratio(totals):>6.1%} in prefixes sent before")
+    if failed:
+        print(f"\033[31m> {len(failed)} of {len(args.modes.split(','))} modes failed: {', '.join(failed)}\033[0m")
+        sys.exit(1)
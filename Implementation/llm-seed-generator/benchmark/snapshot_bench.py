@@ -0,0 +1,87 @@
+"""
+Run `python3 -m benchmark.snapshot_bench [--nodes N] [--methods N]` in llm-seed-generator to compare
+one graph.json per method with one snapshot of the whole library, see `util.snapshot`.
+
+The methods of the synthetic library share most of their nodes, as the methods of a real library do.
+Both layouts are measured on their size and on reading one method plus its parameter closure.
+Every method read from the snapshot must be equal to its graph.json.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from benchmark.mg_bench import synthetic_graph
+from util.graph_loader import load_graph
+from util.mg_util import parameters
+from util.snapshot import Snapshot, write_snapshot
+
+
+def library_methods(size: int, methods: int, seed: int = 0) -> dict:
+    """
+    :return: signature -> method graph, each with the nodes of a random half of the library
+    """
+    library = synthetic_graph(size, seed)
+    rnd = random.Random(seed)
+    names = list(library["nodes"])
+    roots = list(library["parameters"].values())
+    graphs = {}
+    for i in range(methods):
+        kept = set(rnd.sample(names, len(names) // 2)) | set(roots)
+        graphs[f"com.example.Api.m{i}(int)"] = {
+            "className": roots[0], "methodName": f"m{i}", "static": True, "code": "{\n    return 0;\n}",
+            "parameters": library["parameters"],
+            "nodes": {name: library["nodes"][name] for name in names if name in kept}
+        }
+    return graphs
+
+
+def median_time(function, runs: int = 5) -> float:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=5000)
+    parser.add_argument("--methods", type=int, default=50)
+    parser.add_argument("--layer", type=int, default=3)
+    args = parser.parse_args()
+
+    graphs = library_methods(args.nodes, args.methods)
+    signatures = list(graphs)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = {}
+        for (i, signature) in enumerate(signatures):
+            paths[signature] = os.path.join(directory, f"{i}.json")
+            with open(paths[signature], "w") as f:
+                json.dump(graphs[signature], f)
+        snapshot_path = os.path.join(directory, "library.snapshot")
+        stats = write_snapshot(snapshot_path, graphs.items())
+        files_size = sum(os.path.getsize(path) for path in paths.values())
+        print(f"graph.json files: {files_size / 2 ** 20:.1f} MiB, "
+              f"{sum(len(graph['nodes']) for graph in graphs.values())} nodes")
+        print(f"snapshot: {os.path.getsize(snapshot_path) / 2 ** 20:.1f} MiB, {stats['nodes']} nodes")
+
+        snapshot = Snapshot(snapshot_path)
+        for signature in signatures:
+            mg = snapshot.method_graph(signature)
+            assert {**mg, "nodes": mg["nodes"].to_dict()} == graphs[signature], f"different graph of {signature}"
+
+        last = signatures[-1]
+        print(f"{'read one method':<28}{'time(ms)':>10}")
+        rows = [
+            ("graph.json", lambda: parameters(load_graph(paths[last]), layer=args.layer)),
+            # a new process opens the snapshot first, which parses its index
+            ("snapshot, cold", lambda: parameters(Snapshot(snapshot_path).method_graph(last), layer=args.layer)),
+            ("snapshot, opened", lambda: parameters(snapshot.method_graph(last), layer=args.layer)),
+        ]
+        for (name, read) in rows:
+            print(f"{name:<28}{median_time(read) * 1000:>10.2f}")
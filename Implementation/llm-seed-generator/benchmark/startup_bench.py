@@ -0,0 +1,64 @@
+"""
+Run `python3 -m benchmark.startup_bench [--runs N]` in llm-seed-generator to measure
+how long a cold process needs before it can send the first request of each mode.
+
+Every run is a fresh interpreter which imports `LLMGenerator`, builds it and
+builds the chains of one mode. `eager` builds all seven chains, which is what
+`LLMGenerator.__init__` used to do.
+The langchain client of an endpoint, about a second of imports, is built by the first request
+(see `model.client_pool.Endpoint.client`) and is not part of the measured time;
+runs answered from the response cache or by a `ReplayLLM` never import it.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from model.v2.llm_generator import CHAINS, MODE_CHAINS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+from model.v2.llm_generator import LLMGenerator
+generator = LLMGenerator(cache_bypass=True)
+for name in {names!r}:
+    generator.chain(name)
+print(json.dumps({{"seconds": time.perf_counter() - start, "modules": len(sys.modules)}}))
+"""
+
+
+def measure(names, runs: int) -> dict:
+    samples = []
+    modules = 0
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", SNIPPET.format(names=list(names))],
+                                cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        samples.append(result["seconds"])
+        modules = result["modules"]
+    return {
+        "median": statistics.median(samples),
+        "min": min(samples),
+        "max": max(samples),
+        "modules": modules
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    cases = {"eager": list(CHAINS)}
+    cases.update({f"{mode or 'default'}": names for (mode, names) in MODE_CHAINS.items()})
+    results = {case: measure(names, args.runs) for (case, names) in cases.items()}
+
+    eager = results["eager"]["median"]
+    print(f"{'mode':<10}{'median(s)':>12}{'min(s)':>10}{'max(s)':>10}{'modules':>10}{'speedup':>10}")
+    for (case, result) in results.items():
+        print(f"{case:<10}{result['median']:>12.3f}{result['min']:>10.3f}{result['max']:>10.3f}"
+              f"{result['modules']:>10}{eager / result['median']:>10.2f}")
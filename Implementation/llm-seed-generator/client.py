@@ -0,0 +1,64 @@
+"""
+Thin client of the resident seed generator (`python3 main.py --serve --socket PATH`).
+
+It only depends on the standard library, so calling it once per method signature
+is cheap compared with starting main.py. It accepts the same arguments as main.py:
+
+    python3 client.py [skipEP|skipUnder|basic] [--socket PATH] [--graph graph.json] [--signature SIG] [--output ../input_generator]
+                     [--format jsonl|text] [--times N]
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+
+DEFAULT_SOCKET_PATH = "/tmp/llm-seed-generator.sock"
+
+
+def request(payload: dict, socket_path: str = DEFAULT_SOCKET_PATH) -> dict:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall((json.dumps(payload) + "\n").encode("utf-8"))
+        with sock.makefile("r", encoding="utf-8") as f:
+            line = f.readline()
+    if not line:
+        return {"status": "error", "message": "server closed the connection"}
+    return json.loads(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Request seed inputs from a running llm-seed-generator server")
+    parser.add_argument("skip", nargs="?", default=None)
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH)
+    parser.add_argument("--graph", default="graph.json")
+    parser.add_argument("--signature", default=None, help="the method to read if --graph is a snapshot")
+    parser.add_argument("--output", default="../input_generator")
+    parser.add_argument("--format", default="jsonl", choices=["jsonl", "text"])
+    parser.add_argument("--times", type=int, default=1,
+                        help="generate the cases of every equivalence class this many times, see main.py")
+    parser.add_argument("--shutdown", action="store_true", help="stop the server")
+    args = parser.parse_args()
+
+    if args.shutdown:
+        payload = {"command": "shutdown"}
+    else:
+        # the server may run in another directory
+        payload = {
+            "graph_path": os.path.abspath(args.graph),
+            "signature": args.signature,
+            "skip": args.skip,
+            "output": os.path.abspath(args.output),
+            "format": args.format,
+            "times": args.times
+        }
+    try:
+        response = request(payload, args.socket)
+    except OSError as e:
+        print(f"Cannot reach the server on {args.socket}: {e}", file=sys.stderr)
+        sys.exit(2)
+    if response.get("status") != "ok":
+        print(response.get("message"), file=sys.stderr)
+        sys.exit(1)
+    if not args.shutdown:
+        print(f"> Generated {len(response['cases'])} groups of cases in {response['elapsed']:.2f}s")
@@ -2,7 +2,14 @@ import configparser
 import os
 
 __all__ = [
-    "CFG_PATH", "LLM_OPENAI_KEY",
+    "CFG_PATH", "LLM_OPENAI_KEY", "LLM_ENDPOINTS", "LLM_MAX_RETRIES", "LLM_MAX_CONCURRENCY",
+    "LLM_MULTI_SAMPLE", "LLM_SAMPLE_TEMPERATURE", "LLM_BATCH_PARTITIONS",
+    "LLM_UNDERSTANDING_CALL_BUDGET",
+    "LLM_CACHE_PATH", "LLM_CACHE_MAX_BYTES", "LLM_CACHE_BYPASS", "LLM_CACHE_SAMPLE_SEED",
+    "LLM_CONSTRUCTOR_MEMO", "EXAMPLES_SHOTS", "EXAMPLES_TOKEN_BUDGET", "EXAMPLES_PATH", "EXAMPLES_HARVEST",
+    "EXAMPLES_MAX_HARVESTED", "EXAMPLES_STATIC_SHOTS",
+    "PROMPT_COMPACT", "PROMPT_MAX_CODE_LINES", "LLM_PRICES", "ACCOUNTING_CAMPAIGN_PATH", "OUTPUT_FORMAT", "OUTPUT_VALIDATE",
+    "COMPILE_ENABLED", "COMPILE_CLASSPATH",
     "JTYPE_PROVIDER_JAR_PATH", "JTYPE_PROVIDER_API_NAME"
 ]
 
@@ -11,9 +18,96 @@ CFG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)),"llm-seed-gen
 CONFIG = configparser.ConfigParser()
 CONFIG.read(CFG_PATH)
 
-LLM_OPENAI_KEY = CONFIG.get("LLM", "OPENAI_KEY")
-os.environ["OPENAI_API_BASE"] = "https://api.kwwai.top/v1"
-os.environ["OPENAI_API_KEY"] = LLM_OPENAI_KEY
+LLM_OPENAI_KEY = CONFIG.get("LLM", "OPENAI_KEY", fallback=None)
+
+
+def read_endpoints() -> list:
+    """
+    Used to read the endpoints of the client pool, see model/client_pool.py.
+    `[LLM] ENDPOINTS` names the sections `[ENDPOINT <name>]`, each with API_BASE, API_KEY and
+    the RPM/TPM limits of one key (0 means unlimited). Several comma-separated keys in API_KEY
+    make one endpoint per key. Without ENDPOINTS, `[LLM] OPENAI_KEY` and `OPENAI_BASE` are used.
+    """
+    names = [name.strip() for name in CONFIG.get("LLM", "ENDPOINTS", fallback="").split(",") if name.strip()]
+    if not names:
+        return [{"name": "default", "api_key": LLM_OPENAI_KEY,
+                 "api_base": CONFIG.get("LLM", "OPENAI_BASE", fallback="https://api.kwwai.top/v1"),
+                 "rpm": CONFIG.getint("LLM", "RPM", fallback=0), "tpm": CONFIG.getint("LLM", "TPM", fallback=0)}]
+    endpoints = []
+    for name in names:
+        section = f"ENDPOINT {name}"
+        keys = [key.strip() for key in CONFIG.get(section, "API_KEY").split(",") if key.strip()]
+        for (i, key) in enumerate(keys):
+            endpoints.append({"name": name if len(keys) == 1 else f"{name}#{i}", "api_key": key,
+                              "api_base": CONFIG.get(section, "API_BASE"),
+                              "rpm": CONFIG.getint(section, "RPM", fallback=0),
+                              "tpm": CONFIG.getint(section, "TPM", fallback=0)})
+    return endpoints
+
+
+# the keys and endpoints LLM requests are spread over
+LLM_ENDPOINTS = read_endpoints()
+# maximum number of endpoints a request is sent to after 429 responses
+LLM_MAX_RETRIES = CONFIG.getint("LLM", "MAX_RETRIES", fallback=6)
+# maximum number of LLM requests in flight when equivalence classes are generated concurrently
+LLM_MAX_CONCURRENCY = CONFIG.getint("LLM", "MAX_CONCURRENCY", fallback=1)
+# repetitions of a generation are asked for as several completions of one request instead of one request each,
+# off by default, the completions are sampled at SAMPLE_TEMPERATURE instead of the temperature of a plain run
+LLM_MULTI_SAMPLE = CONFIG.getboolean("LLM", "MULTI_SAMPLE", fallback=False)
+# temperature of the requests asking for several completions, only used with MULTI_SAMPLE
+LLM_SAMPLE_TEMPERATURE = CONFIG.getfloat("LLM", "SAMPLE_TEMPERATURE", fallback=0.8)
+# maximum number of equivalence classes of an all-primitive method asked for in one request,
+# 1 (the default) means one each as before, more changes the prompts and answers of such methods
+LLM_BATCH_PARTITIONS = CONFIG.getint("LLM", "BATCH_PARTITIONS", fallback=1)
+# maximum number of LLM calls spent on understanding the parameter types of one method and equivalence class
+LLM_UNDERSTANDING_CALL_BUDGET = CONFIG.getint("LLM", "UNDERSTANDING_CALL_BUDGET", fallback=64)
+
+# on-disk cache of LLM responses, shared by all chains
+LLM_CACHE_PATH = os.path.join(os.path.dirname(CFG_PATH),
+                              CONFIG.get("CACHE", "PATH", fallback=".llm_cache/responses.db"))
+LLM_CACHE_MAX_BYTES = CONFIG.getint("CACHE", "MAX_SIZE_MB", fallback=256) * 1024 * 1024
+LLM_CACHE_BYPASS = CONFIG.getboolean("CACHE", "BYPASS", fallback=False)
+# part of the cache key of requests with a temperature above 0, change it to get new samples
+LLM_CACHE_SAMPLE_SEED = CONFIG.getint("CACHE", "SAMPLE_SEED", fallback=0)
+# reuse the constructor LLM picked for a type across equivalence classes and methods
+LLM_CONSTRUCTOR_MEMO = CONFIG.getboolean("CACHE", "CONSTRUCTOR_MEMO", fallback=True)
+
+# few-shot examples most similar to the question put into a prompt, 0 (the default) means all the hard-coded ones
+# as before, see prompt/example_library.py
+EXAMPLES_SHOTS = CONFIG.getint("EXAMPLES", "SHOTS", fallback=0)
+# maximum number of tokens of the examples in a prompt, the most similar example is always used
+EXAMPLES_TOKEN_BUDGET = CONFIG.getint("EXAMPLES", "TOKEN_BUDGET", fallback=2000)
+# with HARVEST, successful answers are kept in this file and used as examples, off by default
+# so that the prompts of a run do not depend on the runs before
+EXAMPLES_PATH = os.path.join(os.path.dirname(CFG_PATH),
+                             CONFIG.get("EXAMPLES", "PATH", fallback=".llm_cache/examples.jsonl"))
+EXAMPLES_HARVEST = CONFIG.getboolean("EXAMPLES", "HARVEST", fallback=False)
+EXAMPLES_MAX_HARVESTED = CONFIG.getint("EXAMPLES", "MAX_HARVESTED", fallback=256)
+# with SHOTS, hard-coded examples every prompt of a chain starts with, so that endpoints can reuse the prompt prefix,
+# see prompt/layout.py
+EXAMPLES_STATIC_SHOTS = CONFIG.getint("EXAMPLES", "STATIC_SHOTS", fallback=1)
+
+# strip comments and whitespace from the method code and prune the parameter information, see prompt/compaction.py,
+# off by default, the prompts then differ from the ones of a plain run
+PROMPT_COMPACT = CONFIG.getboolean("PROMPT", "COMPACT", fallback=False)
+# longer methods are cut down to their branch structure
+PROMPT_MAX_CODE_LINES = CONFIG.getint("PROMPT", "MAX_CODE_LINES", fallback=80)
+
+# model -> (price of 1K prompt tokens, price of 1K completion tokens), e.g. `gpt-3.5-turbo=0.0005,0.0015`
+LLM_PRICES = {model: tuple(float(price) for price in prices.split(","))
+              for (model, prices) in (CONFIG.items("PRICES") if CONFIG.has_section("PRICES") else [])}
+# the usage of every method is added to this file, see model/accounting.py
+ACCOUNTING_CAMPAIGN_PATH = os.path.join(os.path.dirname(CFG_PATH),
+                                        CONFIG.get("ACCOUNTING", "CAMPAIGN_PATH", fallback=".llm_cache/campaign.json"))
+
+# format of ../input_generator: "jsonl" (one case per line) or "text" (the Part1/Part2/Part3 blocks)
+OUTPUT_FORMAT = CONFIG.get("OUTPUT", "FORMAT", fallback="jsonl")
+# drop the cases which can obviously not be compiled before they are written, see driver/snippet_validator.py
+OUTPUT_VALIDATE = CONFIG.getboolean("OUTPUT", "VALIDATE", fallback=True)
+# compile the cases in the JPype JVM before they are written, see driver/compile_validator.py
+COMPILE_ENABLED = CONFIG.getboolean("COMPILE", "ENABLED", fallback=False)
+# the classpath of the drivers: the library under test and the jars of llm-JQF
+COMPILE_CLASSPATH = CONFIG.get("COMPILE", "CLASSPATH", fallback="")
 
 JTYPE_PROVIDER_JAR_PATH = CONFIG.get("JTYPE_PROVIDER", "JAR_PATH")
 JTYPE_PROVIDER_API_NAME = CONFIG.get("JTYPE_PROVIDER", "API_FULL_QUALIFIED_CLASS_NAME")
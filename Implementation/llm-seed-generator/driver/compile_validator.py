@@ -0,0 +1,114 @@
+"""
+Used to drop the cases javac rejects before they are written.
+
+All cases of an equivalence class are put into one driver (see `driver_generator.generate_cases_driver`),
+which is compiled once in the JPype JVM. Every error is mapped back to a case or an import
+through the line intervals of the driver, and all of them are removed at once.
+Removing an import may break other cases, so the driver is compiled again until it is clean.
+An error on an import of the driver itself, or on the import of the class under test, means that the classpath
+lacks llm-JQF or the library, not that a case is wrong, and all cases are kept for llm-JQF.
+"""
+import threading
+from typing import List, Optional
+
+from driver.driver_generator import DRIVER_IMPORTS, generate_cases_driver
+from driver.snippet_validator import SnippetValidator
+
+MAX_ROUNDS = 3
+
+
+class CompileValidator:
+    def __init__(self, mg_dict: dict, compile_service) -> None:
+        """
+        :param compile_service: a `provider.compile_service.CompileService`
+        """
+        self.mg_dict = mg_dict
+        self.compile_service = compile_service
+        self.rejected = 0
+        self.dropped_imports = 0
+        self.compilations = 0
+        self.lock = threading.Lock()
+
+    def bad_lines(self, driver: dict, supplied: set) -> Optional[tuple]:
+        """
+        :param supplied: the imports of the cases
+        :return: (indexes of bad cases, bad imports), None if an error is outside of the cases and their imports
+        """
+        errors = [d for d in self.compile_service.compile(driver["source"], driver["class_name"])
+                  if d.kind == "ERROR"]
+        own_imports = set(DRIVER_IMPORTS) | {f"import {self.mg_dict['className'].replace('$', '.')};"}
+        bad_cases = set()
+        bad_imports = set()
+        for error in errors:
+            if error.line in driver["import_lines"]:
+                imported = driver["import_lines"][error.line]
+                if imported in own_imports or imported not in supplied:
+                    print(f"\033[31m> Driver import error, check [COMPILE] CLASSPATH: {error.message}\033[0m")
+                    return None
+                bad_imports.add(imported)
+                continue
+            case = next((i for (i, (first, last)) in enumerate(driver["case_lines"]) if first <= error.line <= last),
+                        None)
+            if case is None:
+                print(f"\033[31m> Driver error outside of the cases: {error.message}\033[0m")
+                return None
+            bad_cases.add(case)
+        return bad_cases, bad_imports
+
+    def screen(self, key, value: dict) -> dict:
+        """
+        Used to drop the cases of an equivalence class which cannot be compiled
+        :param value: a dict with the lists "java", "cons" and "import"
+        :return: the same dict without them, the lists are kept aligned
+        """
+        is_static = self.mg_dict["static"]
+        kept = list(range(len(value["java"])))
+        imports = {i: [line.strip() for line in value["import"][i].split("\n") if line.strip()]
+                   if i < len(value["import"]) else [] for i in kept}
+        for _ in range(MAX_ROUNDS):
+            if not kept:
+                break
+            cases = [(value["java"][i], value["cons"][i] if not is_static and i < len(value["cons"]) else "")
+                     for i in kept]
+            supplied = [line for i in kept for line in imports[i]]
+            driver = generate_cases_driver(self.mg_dict, cases, supplied)
+            with self.lock:
+                self.compilations += 1
+            result = self.bad_lines(driver, set(supplied))
+            if result is None:
+                # e.g. a wrong classpath, keep the cases for llm-JQF, which compiles them with the right one
+                break
+            (bad_cases, bad_imports) = result
+            if not bad_cases and not bad_imports:
+                break
+            with self.lock:
+                self.rejected += len(bad_cases)
+                self.dropped_imports += sum(1 for i in kept for line in imports[i] if line in bad_imports)
+            print(f"\033[33m> Rejected {len(bad_cases)} cases and {len(bad_imports)} imports of {key}\033[0m")
+            kept = [kept[j] for j in range(len(kept)) if j not in bad_cases]
+            imports = {i: [line for line in imports[i] if line not in bad_imports] for i in kept}
+
+        result = {"java": [], "cons": [], "import": []}
+        for i in kept:
+            result["java"].append(value["java"][i])
+            if i < len(value["cons"]):
+                result["cons"].append(value["cons"][i])
+            if i < len(value["import"]):
+                result["import"].append("\n".join(imports[i]))
+        return {**value, **result}
+
+    def stats(self) -> dict:
+        return {"rejected": self.rejected, "dropped_imports": self.dropped_imports, "compilations": self.compilations}
+
+
+def case_validators(mg_dict: dict, validate: bool = True, compile_service=None) -> List:
+    """
+    Used to build the validators a `util.file_util.CaseWriter` runs on the cases of a method graph,
+    the cheap snippet checks go first
+    """
+    validators = []
+    if validate:
+        validators.append(SnippetValidator(mg_dict))
+    if compile_service is not None:
+        validators.append(CompileValidator(mg_dict, compile_service))
+    return validators
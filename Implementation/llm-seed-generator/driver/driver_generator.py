@@ -2,10 +2,11 @@
 Run `python driver/driver_generator.py` directly to test my functions
 """
 import json
+import os
 import re
 import sys
 
-from typing import Dict
+from typing import Dict, List, Tuple
 
 PRIMITIVE_TYPES = ["byte", "short", "int", "long", "float", "double", "boolean", "char",
                    "byte[]", "short[]", "int[]", "long[]", "float[]", "double[]", "boolean[]", "char[]",
@@ -119,6 +120,67 @@ def generate_driver_file(driver_path: str,
         f.write(content)
 
 
+# imports every driver of llm-JQF has, see LLMFuzzGuidanceImpl.initDriver
+DRIVER_IMPORTS = ["import edu.berkeley.cs.jqf.fuzz.Fuzz;", "import edu.berkeley.cs.jqf.fuzz.JQF;",
+                  "import edu.berkeley.cs.jqf.fuzz.llmfuzz.LLMFuzz;", "import org.junit.runner.RunWith;"]
+
+
+# next to this file, main.py is not always started from llm-seed-generator, e.g. by LLMFuzzGuidanceImpl
+CASES_DRIVER_TMPL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "LLMFuzzCasesDriver.tmpl")
+
+
+def generate_cases_driver(mg: Dict, cases: List[Tuple[str, str]], imports: List[str],
+                          tmpl_path: str = CASES_DRIVER_TMPL_PATH) -> Dict:
+    """
+    Used to generate the driver llm-JQF compiles and fuzzes, with one method per case
+    :param mg: the method graph
+    :param cases: (input statements, receiver statements) of each case
+    :param imports: the import statements of all the cases
+    :return: a dict:
+        source: the source of the driver
+        class_name: its fully qualified name
+        case_lines: (first line, last line) of each case, 1-based like javac diagnostics
+        import_lines: line -> import statement
+    """
+    class_name = mg["className"].replace("$", ".")
+    simple_name = class_name[class_name.rfind(".") + 1:]
+    method_name = re.search(r"(\w+)\s*\(", mg["methodName"]).group(1)
+    arguments = ", ".join(mg["parameters"].keys())
+    if mg["static"]:
+        call_stmt = f"{simple_name}.{method_name}({arguments});"
+    else:
+        call_stmt = f"{simple_name[0].lower()}{simple_name[1:]}.{method_name}({arguments});"
+    imports = list(dict.fromkeys(DRIVER_IMPORTS + [f"import {class_name};"] + imports))
+    package = "edu.univ." + class_name.lower()
+    driver_name = method_name + "Driver"
+
+    bodies = [f"    public void llmInnerTest{i}() {{\n{input_stmts}\n{receiver_stmts}\n{call_stmt}\n    }}\n"
+              for (i, (input_stmts, receiver_stmts)) in enumerate(cases)]
+    with open(tmpl_path, "r") as f:
+        tmpl = f.read()
+    source = tmpl.format(
+        package=package,
+        imports="\n".join(imports),
+        class_name=driver_name,
+        call=" ".join(f"case {i}: llmInnerTest{i}(); break;" for i in range(len(cases))),
+        cases="\n".join(bodies))
+
+    lines = source.split("\n")
+    first_import = lines.index(imports[0]) + 1
+    import_lines = {first_import + i: imports[i] for i in range(len(imports))}
+    case_lines = []
+    line = 1
+    for i in range(len(cases)):
+        line = lines.index(f"    public void llmInnerTest{i}() {{", line - 1) + 1
+        case_lines.append((line, line + bodies[i].count("\n") - 1))
+    return {
+        "source": source,
+        "class_name": f"{package}.{driver_name}",
+        "case_lines": case_lines,
+        "import_lines": import_lines
+    }
+
+
 if __name__ == "__main__":
     method_sig = "com.github.javaparser.Range::strictlyContains(Position)"
     mg = {'static': True, 'returnTypeName': 'boolean', 'methodName': 'boolean strictlyContains(Position position)',
@@ -140,6 +202,11 @@ if __name__ == "__main__":
                     'java.lang.Object': {}, 'java.lang.Comparable': {}, 'int': {}}}
     format_info = get_info_from_mg(method_sig, mg)
     print(format_info)
+    driver = generate_cases_driver(mg, [("int holder = 1;", "BitField bitField = new BitField(1);"),
+                                        ("int holder = -1;", "BitField bitField = new BitField(0);")],
+                                   ["import java.util.List;"])
+    print(driver["source"])
+    print(driver["case_lines"], driver["import_lines"])
 
     method_sig = "org.apache.commons.lang3.StringUtils::lastIndexOfIgnoreCase(final CharSequence, final CharSequence, int)"
     mg = {'static': True, 'returnTypeName': 'int',
@@ -149,6 +216,11 @@ if __name__ == "__main__":
           'nodes': {'java.lang.CharSequence': {}, 'int': {}}}
     format_info = get_info_from_mg(method_sig, mg)
     print(format_info)
+    driver = generate_cases_driver(mg, [("int holder = 1;", "BitField bitField = new BitField(1);"),
+                                        ("int holder = -1;", "BitField bitField = new BitField(0);")],
+                                   ["import java.util.List;"])
+    print(driver["source"])
+    print(driver["case_lines"], driver["import_lines"])
     generate_driver_file("LLMFuzzDriver.java", format_info)
 
     method_sig = "org.apache.commons.lang3.BitField::getValue(final int)"
@@ -158,3 +230,8 @@ if __name__ == "__main__":
           'nodes': {'int': {}}}
     format_info = get_info_from_mg(method_sig, mg)
     print(format_info)
+    driver = generate_cases_driver(mg, [("int holder = 1;", "BitField bitField = new BitField(1);"),
+                                        ("int holder = -1;", "BitField bitField = new BitField(0);")],
+                                   ["import java.util.List;"])
+    print(driver["source"])
+    print(driver["case_lines"], driver["import_lines"])
@@ -0,0 +1,220 @@
+"""
+Run `python3 -m driver.snippet_validator` in llm-seed-generator to test my functions
+
+Used to drop the generated cases which can obviously not be compiled,
+before they are written and llm-JQF compiles its driver once per bad case.
+"""
+import re
+import threading
+from collections import Counter
+from typing import List, Optional, Tuple
+
+TOKEN = re.compile(r'''
+    (?P<space>\s+)
+  | (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<text>""".*?""")
+  | (?P<string>"(?:[^"\\\n]|\\.)*")
+  | (?P<char>'(?:[^'\\\n]|\\.)+')
+  | (?P<name>[A-Za-z_$][\w$]*)
+  | (?P<number>\d[\w.]*(?:[eEpP][+-]\d+)?[fFdDlL]?|\.\d[\w]*)
+  | (?P<op>>>>=|<<=|>>=|>>>|->|::|\.\.\.|[-+*/%&|^!=<>]=|&&|\|\||\+\+|--|<<|>>|[(){}\[\];,.@=<>!~?:+\-*/&|^%])
+''', re.X | re.S)
+
+BRACKETS = {")": "(", "]": "[", "}": "{"}
+
+# keywords which can be followed by a name and `;` without declaring it
+NOT_TYPES = {"return", "throw", "new", "else", "case", "assert", "yield", "break", "continue"}
+
+# packages every JDK has, their imports are not checked against the method graph
+JDK_PACKAGES = ("java.", "javax.", "jdk.", "org.w3c.", "org.xml.", "org.ietf.")
+
+IMPORT = re.compile(r'^import\s+(static\s+)?([A-Za-z_$][\w$]*(?:\s*\.\s*[A-Za-z_$][\w$]*)*)(\s*\.\s*\*)?\s*;$')
+
+
+class SnippetError(Exception):
+    pass
+
+
+def tokenize(code: str) -> List[Tuple[str, str]]:
+    """
+    Used to split a Java snippet into (kind, text) tokens, whitespace and comments are dropped
+    :raise SnippetError: on characters which cannot start a token, e.g. an unterminated string
+    """
+    tokens = []
+    pos = 0
+    while pos < len(code):
+        match = TOKEN.match(code, pos)
+        if match is None:
+            raise SnippetError(f"unexpected {code[pos:pos + 10]!r}")
+        if match.lastgroup not in ("space", "comment"):
+            tokens.append((match.lastgroup, match.group()))
+        pos = match.end()
+    return tokens
+
+
+def check_brackets(tokens: List[Tuple[str, str]]) -> None:
+    stack = []
+    for (kind, text) in tokens:
+        if kind != "op":
+            continue
+        if text in "([{":
+            stack.append(text)
+        elif text in BRACKETS:
+            if not stack or stack.pop() != BRACKETS[text]:
+                raise SnippetError(f"unbalanced {text!r}")
+    if stack:
+        raise SnippetError(f"unclosed {stack[-1]!r}")
+
+
+def declared_names(tokens: List[Tuple[str, str]]) -> Counter:
+    """
+    Used to find the local variables declared outside of any block,
+    i.e. a name after a type, or after a comma in a declaration, and before `=`, `;` or `,`
+    """
+    names = Counter()
+    depth = 0
+    in_declaration = False
+    for i in range(len(tokens)):
+        (kind, text) = tokens[i]
+        if kind == "op" and text in "([{":
+            depth += 1
+        elif kind == "op" and text in ")]}":
+            depth -= 1
+        elif kind == "op" and text == ";" and depth == 0:
+            in_declaration = False
+        elif kind == "name" and depth == 0 and 0 < i < len(tokens) - 1:
+            (prev_kind, prev_text) = tokens[i - 1]
+            following = tokens[i + 1][1]
+            if following not in ("=", ";", ","):
+                continue
+            if (prev_kind == "name" and prev_text not in NOT_TYPES) or prev_text in (">", ">>", ">>>", "]") \
+                    or (prev_text == "," and in_declaration):
+                names[text] += 1
+                in_declaration = True
+    return names
+
+
+def receiver_name(class_name: str) -> str:
+    """
+    The name llm-JQF calls the method under test on, see LLMFuzzGuidanceImpl.initDriver
+    """
+    simple_name = class_name[class_name.rfind(".") + 1:]
+    return simple_name[0].lower() + simple_name[1:]
+
+
+class SnippetValidator:
+    """
+    Used to screen the cases of a method graph:
+        * the input and receiver statements must tokenize and have balanced brackets
+        * every parameter (and the receiver of an instance method) must be declared exactly once
+        * imports must be well-formed and resolve against the method graph or the JDK,
+          unresolved imports are removed from the case instead of rejecting it
+    """
+
+    def __init__(self, mg_dict: dict) -> None:
+        self.params = list(mg_dict["parameters"].keys())
+        self.is_static = mg_dict["static"]
+        self.receiver = receiver_name(mg_dict["className"]) if not self.is_static else None
+        nodes = mg_dict["nodes"]
+        self.types = {name.replace("$", ".") for name in nodes}
+        self.packages = {name[:name.rfind(".")] for name in self.types if "." in name}
+        self.rejections = Counter()
+        self.dropped_imports = 0
+        self.accepted = 0
+        self.lock = threading.Lock()
+
+    def resolves(self, name: str, is_static: bool, wildcard: bool) -> bool:
+        if name.startswith(JDK_PACKAGES):
+            return True
+        if wildcard:
+            return name in self.packages or name in self.types
+        if is_static:
+            # import static a.b.C.member;
+            name = name[:name.rfind(".")]
+        return name in self.types or name[:name.rfind(".")] in self.packages
+
+    def screen_imports(self, imports: str) -> str:
+        kept = []
+        for line in imports.split("\n"):
+            line = line.strip()
+            if not line:
+                continue
+            match = IMPORT.match(line)
+            if match and self.resolves(re.sub(r"\s+", "", match.group(2)), bool(match.group(1)), bool(match.group(3))):
+                kept.append(line)
+            else:
+                with self.lock:
+                    self.dropped_imports += 1
+        return "\n".join(kept)
+
+    def check(self, code: str, receiver: str) -> Optional[Tuple[str, str]]:
+        """
+        :return: (kind, message) telling why the case is rejected, None if it looks fine
+        """
+        try:
+            code_tokens = tokenize(code)
+            receiver_tokens = tokenize(receiver)
+            check_brackets(code_tokens)
+            check_brackets(receiver_tokens)
+        except SnippetError as e:
+            return "syntax", str(e)
+        names = declared_names(code_tokens) + declared_names(receiver_tokens)
+        required = self.params + ([self.receiver] if self.receiver else [])
+        for name in required:
+            if names[name] == 0:
+                return "undeclared", f"{name} is not declared"
+            if names[name] > 1:
+                return "redeclared", f"{name} is declared twice"
+        return None
+
+    def screen(self, key, value: dict) -> dict:
+        """
+        Used to drop the broken cases of an equivalence class
+        :param value: a dict with the lists "java", "cons" and "import"
+        :return: the same dict without them, the lists are kept aligned
+        """
+        result = {"java": [], "cons": [], "import": []}
+        for i in range(len(value["java"])):
+            receiver = value["cons"][i] if not self.is_static and i < len(value["cons"]) else ""
+            reason = self.check(value["java"][i], receiver)
+            with self.lock:
+                if reason is not None:
+                    self.rejections[reason[0]] += 1
+                    print(f"\033[33m> Rejected case of {key}: {reason[1]}\033[0m")
+                    continue
+                self.accepted += 1
+            result["java"].append(value["java"][i])
+            if i < len(value["cons"]):
+                result["cons"].append(value["cons"][i])
+            if i < len(value["import"]):
+                result["import"].append(self.screen_imports(value["import"][i]))
+        return {**value, **result}
+
+    def stats(self) -> dict:
+        return {
+            "accepted": self.accepted,
+            "rejected": sum(self.rejections.values()),
+            "reasons": dict(self.rejections),
+            "dropped_imports": self.dropped_imports
+        }
+
+
+if __name__ == "__main__":
+    mg = {"static": False, "className": "org.apache.commons.lang3.text.StrBuilder",
+          "parameters": {"startIndex": "int", "endIndex": "int"},
+          "nodes": {"org.apache.commons.lang3.text.StrBuilder": {"classType": "class"}, "int": {}}}
+    validator = SnippetValidator(mg)
+    cases = {
+        "java": ["int startIndex = -5;\nint endIndex = 10;",
+                 "int startIndex = 5;\nint endIndex = foo(;",
+                 "int startIndex = 0;",
+                 "int startIndex = 2; // a comment }\nint endIndex = \"(\".length();"],
+        "cons": ["StrBuilder strBuilder = new StrBuilder(20);",
+                 "StrBuilder strBuilder = new StrBuilder();",
+                 "StrBuilder strBuilder = new StrBuilder();",
+                 "StrBuilder strBuilder = new StrBuilder(\"Hello {\");"],
+        "import": ["import org.apache.commons.lang3.text.StrBuilder;\nimport org.example.Missing;",
+                   "", "", "import java.util.*;\nimport static org.apache.commons.lang3.text.StrBuilder.foo;"]
+    }
+    print(validator.screen("example", cases))
+    print(validator.stats())
@@ -1,32 +1,99 @@
 from model.v2.llm_generator import LLMGenerator
+from model.accounting import prefix_ratio
+from config import OUTPUT_FORMAT, OUTPUT_VALIDATE, COMPILE_ENABLED, COMPILE_CLASSPATH
+from driver.compile_validator import case_validators
+import argparse
 import sys
-import json
 import util.file_util
+import util.mg_util
+import util.trace
+
+
+def llm_generator(args) -> LLMGenerator:
+    return LLMGenerator(temperature=0.0, record_path=args.record)
+
+
+def compile_service():
+    if not COMPILE_ENABLED:
+        return None
+    from provider.compile_service import CompileService
+    return CompileService(COMPILE_CLASSPATH)
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate seed inputs of a method graph with LLM")
+    parser.add_argument("skip", nargs="?", default=None,
+                        help="skipEP, skipUnder or basic; the full pipeline is used by default")
+    parser.add_argument("--serve", action="store_true",
+                        help="keep running and answer generation requests, see server.py")
+    parser.add_argument("--socket", default=None,
+                        help="unix socket of the server, requests are read from stdin if it is omitted")
+    parser.add_argument("--graph", default="graph.json",
+                        help="the method graph, or a snapshot of a whole library, see util/snapshot.py")
+    parser.add_argument("--signature", default=None,
+                        help="the method to read from the snapshot given by --graph")
+    parser.add_argument("--batch", default=None,
+                        help="a directory, a manifest or a snapshot of method graphs to process, see batch.py")
+    parser.add_argument("--out-dir", default="../input_generators",
+                        help="where the batch mode writes one output per method graph")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="maximum number of method graphs processed at the same time in batch mode")
+    parser.add_argument("--stream", action="store_true",
+                        help="also print every case as a JSON line on stdout as soon as it is generated, "
+                             "all other output goes to stderr")
+    parser.add_argument("--format", default=OUTPUT_FORMAT, choices=util.file_util.OUTPUT_FORMATS,
+                        help="format of the generated cases, jsonl by default, text is the old Part1/2/3 format")
+    parser.add_argument("--times", type=int, default=1,
+                        help="generate the cases of every equivalence class this many times, "
+                             "in one request with [LLM] MULTI_SAMPLE")
+    parser.add_argument("--record", default=None,
+                        help="append every LLM response to this file, to be replayed by model/replay_llm.py")
+    parser.add_argument("--trace", default=None,
+                        help="write the spans of the run to this file as Chrome trace events, see util/trace.py")
+    args = parser.parse_args()
+
+    if args.trace:
+        util.trace.start()
+    try:
+        if args.serve:
+            import server
+            server.serve(llm_generator(args), args.socket, compile_service())
+        elif args.batch:
+            import batch
+            summary = batch.run_batch(llm_generator(args), args.batch, args.out_dir,
+                                      workers=args.workers, skip=args.skip, output_format=args.format,
+                                      validate=OUTPUT_VALIDATE, compile_service=compile_service(),
+                                      generate_times=args.times)
+            print(f"> Batch: {summary['ok']} ok, {summary['error']} failed in {summary['elapsed']:.2f}s")
+        else:
+            stream = None
+            if args.stream:
+                # stdout only carries the cases, the chains print their prompts to stderr
+                (stream, sys.stdout) = (sys.stdout, sys.stderr)
+            mg_dict = util.file_util.read_graph(args.graph, args.signature)
+            util.mg_util.check_class_object(mg_dict)
 
-    skip = str
-    if len(sys.argv) > 1:
-        skip = sys.argv[1]
-
-    file = open("graph.json", "r")
-    file_content = file.read()
-    file.close()
-    mg_dict = json.loads(file_content.replace("\n", ""))
-
-    if mg_dict["static"] is False:
-        class_name = mg_dict["className"]
-        class_node = mg_dict["nodes"][class_name]
-        if len(class_node.get("constructors", "")) == 0 and len(class_node.get("builders", "")) == 0:
-            raise Exception("Cannot initiate class object.")
-
-    generator = LLMGenerator(temperature=0.0)
-    if skip == "skipEP":
-        output = generator.generate_non_ep(mg_dict)
-    elif skip == "skipUnder":
-        output = generator.generate_non_understanding(mg_dict)
-    elif skip == "basic":
-        output = generator.generate_basic(mg_dict)
-    else:
-        output = generator.generate(mg_dict)
-    util.file_util.write_dict(output, mg_dict["static"])
+            generator = llm_generator(args)
+            # cases are written as soon as an equivalence class is finished
+            validators = case_validators(mg_dict, OUTPUT_VALIDATE, compile_service())
+            with util.file_util.CaseWriter("../input_generator", mg_dict["static"], args.format, stream,
+                                           validators, generator.examples) as writer:
+                generator.generate_by_mode(mg_dict, args.skip, on_result=writer.write_partition,
+                                           generate_times=args.times)
+            usage = generator.account(mg_dict, "../input_generator")
+            print(f"> Tokens: {usage['total']}")
+            for (name, totals) in usage["stages"].items():
+                print(f"    > {name}: {totals}")
+            print(f"> Prompt prefixes sent before: {prefix_ratio(usage['total']):.1%} of the prompt tokens")
+            for validator in validators:
+                print(f"> {type(validator).__name__}: {validator.stats()}")
+            print(f"> Cache: {generator.cache.stats()}")
+            print(f"> Endpoints: {generator.pool.stats()}")
+            print(f"> Constructor memo: {generator.memo.stats()}")
+            print(f"> Parameter cache: {generator.param_cache.stats()}")
+            print(f"> Few-shot examples: {generator.examples.stats()}")
+            print(f"> Compaction: {generator.compactor.stats()}")
+    finally:
+        if args.trace:
+            for (name, total) in util.trace.stop(args.trace).items():
+                print(f"> Span {name}: {total['count']}x, {total['seconds']:.3f}s")
@@ -0,0 +1,263 @@
+"""
+Used to account the tokens, latency and cost of every LLM call.
+
+* Chains mark what they are doing with `stage`, e.g. `@stage("equivalence_partitioning")` on `run`,
+  the innermost stage wins. `LLMGenerator.generate_by_mode` sets the method with `method`,
+  the server and the batch mode set the request being served with `request`, so that concurrent requests
+  for the same method are accounted separately.
+  All are context variables, `LLMGenerator.run_tasks` carries them into its threads.
+* `MeteredLLM` records every call with the stage and method of its caller.
+  Tokens come from the usage reported by the endpoint, or are counted offline when there is none,
+  e.g. for cached responses.
+  It also counts the prompt tokens of the longest run of leading messages that was sent before,
+  the part of the prompt an endpoint caching prompt prefixes can reuse, see prompt/layout.py.
+* `summarize` groups records by stage, `write_usage` writes the summary of one method
+  and `add_to_campaign` adds it to the totals of all runs.
+"""
+import contextlib
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List
+
+from util.trace import span
+
+STAGE = contextvars.ContextVar("stage", default="unknown")
+METHOD = contextvars.ContextVar("method", default=None)
+REQUEST = contextvars.ContextVar("request", default=None)
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    token = STAGE.set(name)
+    try:
+        yield
+    finally:
+        STAGE.reset(token)
+
+
+@contextlib.contextmanager
+def method(signature: str):
+    token = METHOD.set(signature)
+    try:
+        yield
+    finally:
+        METHOD.reset(token)
+
+
+@contextlib.contextmanager
+def request(request_id: str):
+    token = REQUEST.set(request_id)
+    try:
+        yield
+    finally:
+        REQUEST.reset(token)
+
+
+ENCODINGS = {}
+ENCODINGS_LOCK = threading.Lock()
+
+
+def encoding(model: str):
+    """
+    :return: the tiktoken encoding of a model, None if tiktoken is not installed
+    """
+    with ENCODINGS_LOCK:
+        if model not in ENCODINGS:
+            try:
+                import tiktoken
+                try:
+                    ENCODINGS[model] = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    ENCODINGS[model] = tiktoken.get_encoding("cl100k_base")
+            except ImportError:
+                ENCODINGS[model] = None
+        return ENCODINGS[model]
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """
+    Used to count tokens offline, about 4 characters per token without tiktoken
+    """
+    enc = encoding(model)
+    if enc is None:
+        return len(text) // 4
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages, model: str = "gpt-3.5-turbo") -> int:
+    # every message costs a few tokens for its role and separators
+    return sum(count_tokens(message.content, model) + 4 for message in messages)
+
+
+# leading messages `MeteredLLM` remembers to find the prefixes sent before
+MAX_PREFIXES = 65536
+
+
+class MeteredLLM:
+    """
+    Used to wrap the model chains call with the accounting of every call.
+    Chains call `generate([messages])` exactly like on `ChatOpenAI`.
+    """
+
+    def __init__(self, llm, prices: dict = None) -> None:
+        """
+        :param prices: model -> (price of 1K prompt tokens, price of 1K completion tokens)
+        """
+        self.llm = llm
+        self.prices = prices or {}
+        self.records = []
+        # digests of the leading messages of the prompts sent, the least recently sent are forgotten first,
+        # like endpoints evict their cached prefixes
+        self.prefixes = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+    def prefix_tokens(self, messages, model: str) -> int:
+        """
+        :return: the tokens of the longest run of leading messages of a prompt sent before
+        """
+        digest = hashlib.sha256()
+        digests = []
+        for message in messages:
+            digest.update(f"{message.type}\0{message.content}\0".encode("utf-8"))
+            digests.append(digest.digest())
+        with self.lock:
+            sent = next((i + 1 for i in reversed(range(len(digests))) if digests[i] in self.prefixes), 0)
+            for key in digests:
+                self.prefixes[key] = None
+                self.prefixes.move_to_end(key)
+            while len(self.prefixes) > MAX_PREFIXES:
+                self.prefixes.popitem(last=False)
+        return count_message_tokens(messages[:sent], model)
+
+    def generate(self, messages_list, **kwargs):
+        with span("llm.generate", "llm", stage=STAGE.get()) as args:
+            start = time.perf_counter()
+            llm_result = self.llm.generate(messages_list, **kwargs)
+            latency = time.perf_counter() - start
+            args["cached"] = llm_result.llm_output is None
+        model = getattr(self.llm, "model_name", None) or "unknown"
+        usage = (llm_result.llm_output or {}).get("token_usage") or {}
+        if "prompt_tokens" in usage:
+            (prompt_tokens, completion_tokens, counted) = \
+                (usage["prompt_tokens"], usage.get("completion_tokens", 0), "usage")
+        else:
+            prompt_tokens = sum(count_message_tokens(messages, model) for messages in messages_list)
+            completion_tokens = sum(count_tokens(g.text, model) for generation in llm_result.generations
+                                    for g in generation)
+            counted = "offline"
+        cached = llm_result.llm_output is None
+        # a cached response never reaches the endpoint
+        prefix_tokens = 0 if cached else sum(self.prefix_tokens(messages, model) for messages in messages_list)
+        record = {
+            "method": METHOD.get(),
+            "request": REQUEST.get(),
+            "stage": STAGE.get(),
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "latency": latency,
+            # a response from the cache carries no usage
+            "cached": cached,
+            "counted": counted,
+            "prefix_tokens": prefix_tokens,
+        }
+        (prompt_price, completion_price) = self.prices.get(model, (0.0, 0.0))
+        # a cached response is not paid for again
+        record["cost"] = 0.0 if record["cached"] \
+            else (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+        with self.lock:
+            self.records.append(record)
+        return llm_result
+
+    def take(self, signature: str = None, request_id: str = None) -> List[dict]:
+        """
+        Used to remove and return the records of one method, or all records
+        :param request_id: only the records of this request, see `request`
+        """
+        def taken(r) -> bool:
+            return (signature is None or r["method"] == signature) and \
+                (request_id is None or r["request"] == request_id)
+
+        with self.lock:
+            result = [r for r in self.records if taken(r)]
+            self.records = [r for r in self.records if not taken(r)]
+        return result
+
+
+def summarize(records: List[dict]) -> dict:
+    """
+    :return: totals of all records and of every stage
+    """
+    def total(group: List[dict]) -> dict:
+        return {
+            "calls": len(group),
+            "cached": sum(1 for r in group if r["cached"]),
+            "prompt_tokens": sum(r["prompt_tokens"] for r in group),
+            "completion_tokens": sum(r["completion_tokens"] for r in group),
+            # prompt tokens sent to the endpoint, and the ones of them in a prefix sent before
+            "sent_prompt_tokens": sum(r["prompt_tokens"] for r in group if not r["cached"]),
+            "prefix_hits": sum(1 for r in group if r["prefix_tokens"]),
+            "prefix_tokens": sum(r["prefix_tokens"] for r in group),
+            "latency": sum(r["latency"] for r in group),
+            "cost": sum(r["cost"] for r in group),
+        }
+
+    stages = {}
+    for record in records:
+        stages.setdefault(record["stage"], []).append(record)
+    return {
+        "total": total(records),
+        "stages": {name: total(group) for (name, group) in stages.items()},
+        "models": sorted({r["model"] for r in records}),
+    }
+
+
+def prefix_ratio(totals: dict) -> float:
+    """
+    :return: the share of the prompt tokens sent that repeat a prefix sent before, see `summarize`
+    """
+    return totals.get("prefix_tokens", 0) / totals["sent_prompt_tokens"] if totals.get("sent_prompt_tokens") else 0.0
+
+
+def write_usage(path: str, signature: str, records: List[dict]) -> dict:
+    """
+    Used to write the usage of one method, e.g. next to its output
+    """
+    summary = {"method": signature, **summarize(records), "calls": records}
+    with open(path, "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+CAMPAIGN_LOCK = threading.Lock()
+
+
+def add_to_campaign(path: str, summary: dict) -> dict:
+    """
+    Used to add the usage of a method to the totals of a campaign, kept in a JSON file across runs
+    """
+    with CAMPAIGN_LOCK:
+        campaign = {"methods": 0, "total": {}, "stages": {}}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                campaign = json.load(f)
+        campaign["methods"] += 1
+        for (target, source) in [(campaign["total"], summary["total"])] + \
+                [(campaign["stages"].setdefault(name, {}), totals) for (name, totals) in summary["stages"].items()]:
+            for (key, value) in source.items():
+                target[key] = target.get(key, 0) + value
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(campaign, f, indent=2)
+        os.replace(path + ".tmp", path)
+    return campaign
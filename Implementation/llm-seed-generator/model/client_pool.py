@@ -0,0 +1,212 @@
+import random
+import threading
+import time
+from typing import TYPE_CHECKING, List
+
+if TYPE_CHECKING:
+    # langchain is only imported once a request is sent, see `Endpoint.client`
+    from langchain.schema import LLMResult, BaseMessage
+
+# the completion tokens reserved for a request before its usage is known
+EXPECTED_COMPLETION_TOKENS = 512
+
+
+def estimate_tokens(messages: List["BaseMessage"]) -> int:
+    """
+    A rough count of the prompt tokens, about 4 characters per token
+    """
+    return sum(len(message.content) for message in messages) // 4 + 4 * len(messages)
+
+
+def is_rate_limited(error: Exception) -> bool:
+    return type(error).__name__ == "RateLimitError" \
+        or getattr(error, "http_status", None) == 429 or getattr(error, "status_code", None) == 429
+
+
+class TokenBucket:
+    """
+    Used to limit an amount per minute, e.g. requests or tokens.
+    The bucket holds at most `per_minute` and is refilled continuously,
+    taking more than it holds is allowed and is paid back by the following requests.
+    """
+
+    def __init__(self, per_minute: int) -> None:
+        self.per_minute = per_minute
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.per_minute, self.level + (now - self.updated) * self.per_minute / 60)
+        self.updated = now
+
+    def wait_time(self, amount: int) -> float:
+        """
+        :return: seconds until `amount` can be taken, 0 for an unlimited bucket
+        """
+        if self.per_minute <= 0:
+            return 0.0
+        self.refill()
+        missing = min(amount, self.per_minute) - self.level
+        return max(0.0, missing * 60 / self.per_minute)
+
+    def take(self, amount: int) -> None:
+        if self.per_minute > 0:
+            self.refill()
+            self.level -= amount
+
+
+class Endpoint:
+    def __init__(self, name: str, make_client, rpm: int = 0, tpm: int = 0) -> None:
+        """
+        :param make_client: builds the client, on the first request sent to the endpoint
+        """
+        self.name = name
+        self.make_client = make_client
+        self.built_client = None
+        self.client_lock = threading.Lock()
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.failures = 0
+        self.stats = {"requests": 0, "rate_limited": 0, "tokens": 0}
+
+    @property
+    def client(self):
+        if self.built_client is None:
+            with self.client_lock:
+                if self.built_client is None:
+                    self.built_client = self.make_client()
+        return self.built_client
+
+    def wait_time(self, tokens: int) -> float:
+        return max(self.cooldown_until - time.monotonic(), self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+
+class ClientPool:
+    """
+    Used to spread the requests of all chains over several keys and endpoints.
+
+    * Every endpoint has its own requests-per-minute and tokens-per-minute bucket.
+    * A request goes to the endpoint it can be sent to soonest, then to the one with the fewest requests in flight.
+    * A 429 response puts its endpoint on an exponential backoff and the request is sent again,
+      to another endpoint if one is free.
+    * Chains call `generate([messages])` exactly like on `ChatOpenAI`.
+    """
+
+    def __init__(self, endpoints: List[dict], model: str = "gpt-3.5-turbo", temperature: float = 0.0,
+                 max_retries: int = 6, client_factory=None) -> None:
+        """
+        :param endpoints: dicts with name, api_key, api_base, rpm and tpm, see `config.LLM_ENDPOINTS`
+        :param client_factory: builds the client of an endpoint dict, a `ChatOpenAI` by default
+        """
+        if not endpoints:
+            raise ValueError("no LLM endpoint is configured")
+        self.model_name = model
+        self.temperature = temperature
+        self.max_retries = max_retries
+        if client_factory is None:
+            def client_factory(endpoint):
+                # importing langchain.chat_models takes about a second, it is left to the first request
+                from langchain.chat_models import ChatOpenAI
+
+                # the pool retries on 429 itself, the client sends a request once
+                return ChatOpenAI(model=model, temperature=temperature, max_retries=1,
+                                  openai_api_key=endpoint["api_key"], openai_api_base=endpoint["api_base"])
+        self.endpoints = [Endpoint(endpoint["name"], lambda endpoint=endpoint: client_factory(endpoint),
+                                   endpoint.get("rpm", 0), endpoint.get("tpm", 0)) for endpoint in endpoints]
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: int) -> Endpoint:
+        """
+        Used to wait for the least loaded endpoint and take a request and `tokens` from its buckets
+        """
+        while True:
+            with self.lock:
+                (wait, _, endpoint) = self.least_loaded(tokens)
+                if wait <= 0:
+                    endpoint.requests.take(1)
+                    endpoint.tokens.take(tokens)
+                    endpoint.in_flight += 1
+                    endpoint.stats["requests"] += 1
+                    return endpoint
+            time.sleep(min(wait, 1.0))
+
+    def least_loaded(self, tokens: int) -> tuple:
+        return min(((endpoint.wait_time(tokens), endpoint.in_flight, endpoint) for endpoint in self.endpoints),
+                   key=lambda candidate: candidate[:2])
+
+    def release(self, endpoint: Endpoint, reserved: int, llm_result: "LLMResult" = None) -> None:
+        with self.lock:
+            endpoint.in_flight -= 1
+            if llm_result is None:
+                return
+            endpoint.failures = 0
+            usage = (llm_result.llm_output or {}).get("token_usage") or {}
+            used = usage.get("total_tokens")
+            if used is not None:
+                # pay back or take the difference to the reservation
+                endpoint.tokens.take(used - reserved)
+                endpoint.stats["tokens"] += used
+
+    def back_off(self, endpoint: Endpoint) -> None:
+        with self.lock:
+            endpoint.failures += 1
+            endpoint.stats["rate_limited"] += 1
+            delay = min(60.0, 2 ** endpoint.failures) * random.uniform(0.5, 1.0)
+            endpoint.cooldown_until = max(endpoint.cooldown_until, time.monotonic() + delay)
+        print(f"\033[33m> {endpoint.name} is rate limited, backing off for {delay:.1f}s\033[0m")
+
+    def generate(self, messages_list: List[List["BaseMessage"]], **kwargs) -> "LLMResult":
+        completions = kwargs.get("n", 1)
+        tokens = sum(estimate_tokens(messages) + EXPECTED_COMPLETION_TOKENS * completions
+                     for messages in messages_list)
+        for attempt in range(self.max_retries + 1):
+            endpoint = self.acquire(tokens)
+            try:
+                llm_result = endpoint.client.generate(messages_list, **kwargs)
+            except Exception as e:
+                self.release(endpoint, tokens)
+                if not is_rate_limited(e) or attempt == self.max_retries:
+                    raise
+                self.back_off(endpoint)
+                continue
+            self.release(endpoint, tokens, llm_result)
+            return llm_result
+
+    def stats(self) -> dict:
+        return {endpoint.name: dict(endpoint.stats, in_flight=endpoint.in_flight) for endpoint in self.endpoints}
+
+
+class BoundedLLM:
+    """
+    Used to cap the requests in flight to the model, whichever thread sends them:
+    the equivalence classes run by `LLMGenerator.run_tasks`, the understanding calls each of them fans out
+    (`InputUnderstandingChain.run_concurrently`) and the methods of a batch all share the same slots.
+    Chains call `generate([messages])` exactly like on `ChatOpenAI`.
+    """
+
+    def __init__(self, llm, max_in_flight: int) -> None:
+        self.llm = llm
+        self.max_in_flight = max(1, max_in_flight)
+        self.slots = threading.BoundedSemaphore(self.max_in_flight)
+        self.in_flight = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+    def generate(self, messages_list: List[List["BaseMessage"]], **kwargs) -> "LLMResult":
+        with self.slots:
+            with self.lock:
+                self.in_flight += 1
+                self.peak = max(self.peak, self.in_flight)
+            try:
+                return self.llm.generate(messages_list, **kwargs)
+            finally:
+                with self.lock:
+                    self.in_flight -= 1
@@ -0,0 +1,145 @@
+import contextlib
+import contextvars
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, List
+
+from util.cache_util import SqliteLRUStore
+
+if TYPE_CHECKING:
+    # langchain is only imported once a request is sent
+    from langchain.schema import LLMResult, BaseMessage
+
+# the repetition a request is sent for, see `LLMGenerator.run_repeated`
+SAMPLE = contextvars.ContextVar("sample", default=0)
+# responses waiting for `keep`, the oldest are forgotten
+MAX_PENDING = 1024
+
+
+@contextlib.contextmanager
+def sample(index: int):
+    token = SAMPLE.set(index)
+    try:
+        yield
+    finally:
+        SAMPLE.reset(token)
+
+
+def keep(llm, llm_result: "LLMResult") -> None:
+    """
+    Used by the chains to store a response they could parse in the response cache,
+    does nothing if the model has no cache, e.g. a `ClientPool` in the `__main__` of a chain
+    """
+    keep_result = getattr(llm, "keep", None)
+    if keep_result is not None:
+        keep_result(llm_result)
+
+
+class CachedLLM:
+    """
+    Used to wrap a chat model with a persistent, content-addressed response cache.
+
+    * The key of a response is the hash of the model, the temperature,
+      the extra generation arguments and the full message list.
+      With a temperature above 0 it also holds the repetition (`SAMPLE`) and `seed`,
+      so that the repetitions of a generation are not replays of the first one,
+      and a new seed asks for new samples.
+    * Chains call `generate([messages])` exactly like on `ChatOpenAI`.
+      A response is only stored once the chain calls `keep` with it, after parsing it successfully,
+      so an answer that cannot be parsed is asked for again next time.
+    * With `bypass=True` every request goes to the wrapped model and nothing is stored.
+    """
+
+    def __init__(self, llm, store: SqliteLRUStore, bypass: bool = False, seed: int = 0) -> None:
+        self.llm = llm
+        self.store = store
+        self.bypass = bypass
+        self.seed = seed
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        # id of the generation list of a response not kept yet -> (the list, its key),
+        # the list is held so that its id is not reused while it is pending
+        self.pending = OrderedDict()
+
+    def __getattr__(self, name):
+        if name == "llm":
+            raise AttributeError(name)
+        # everything else (model_name, temperature, ...) comes from the wrapped model
+        return getattr(self.llm, name)
+
+    def cache_key(self, messages: List["BaseMessage"], **kwargs) -> str:
+        key = {
+            "model": getattr(self.llm, "model_name", None),
+            "temperature": getattr(self.llm, "temperature", None),
+            "kwargs": kwargs,
+            "messages": [[message.type, message.content] for message in messages],
+        }
+        # the keys of deterministic requests do not change
+        if (kwargs.get("temperature", key["temperature"]) or 0) > 0:
+            key["sample"] = [SAMPLE.get(), self.seed]
+        content = json.dumps(key, sort_keys=True, default=str)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def generate(self, messages_list: List[List["BaseMessage"]], **kwargs) -> "LLMResult":
+        from langchain.schema import LLMResult
+
+        if self.bypass:
+            return self.llm.generate(messages_list, **kwargs)
+
+        keys = [self.cache_key(messages, **kwargs) for messages in messages_list]
+        generations = [self.load(key) for key in keys]
+        missed = [i for (i, generation) in enumerate(generations) if generation is None]
+        with self.lock:
+            self.hits += len(keys) - len(missed)
+            self.misses += len(missed)
+        if not missed:
+            return LLMResult(generations=generations)
+
+        llm_result = self.llm.generate([messages_list[i] for i in missed], **kwargs)
+        for (i, generation) in zip(missed, llm_result.generations):
+            generations[i] = generation
+        result = LLMResult(generations=generations, llm_output=llm_result.llm_output)
+        # identical texts of two requests must not be taken for one another, so the lists of the result
+        # returned are what `keep` is called with
+        with self.lock:
+            for i in missed:
+                generation = result.generations[i]
+                self.pending[id(generation)] = (generation, keys[i])
+            while len(self.pending) > MAX_PENDING:
+                self.pending.popitem(last=False)
+        return result
+
+    def keep(self, llm_result: "LLMResult") -> None:
+        """
+        Used to store the responses of a result returned by `generate`, see `keep` above.
+        Responses that came from the cache are already stored.
+        """
+        for generation in llm_result.generations:
+            with self.lock:
+                (pending, key) = self.pending.pop(id(generation), (None, None))
+            if pending is generation:
+                self.save(key, generation)
+
+    def load(self, key: str):
+        from langchain.schema import AIMessage, ChatGeneration
+
+        value = self.store.get(key)
+        if value is None:
+            return None
+        return [ChatGeneration(message=AIMessage(content=text)) for text in json.loads(value)]
+
+    def save(self, key: str, generation) -> None:
+        self.store.put(key, json.dumps([g.text for g in generation]).encode("utf-8"))
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "entries": len(self.store),
+            "bytes": self.store.size(),
+        }
@@ -0,0 +1,126 @@
+"""
+Used to run the chains without an endpoint, e.g. for `benchmark.pipeline_bench`.
+
+* `RecordingLLM` wraps a real model and appends every response to a JSON Lines file,
+  with the hash of its prompt and the stage it was generated in (see `model.accounting.stage`).
+* `ReplayLLM` answers from such a file: a recorded prompt gets its recorded response,
+  any other prompt gets the next recorded response of the same stage.
+  Every answer is delayed by a latency drawn from a configurable distribution.
+
+Both are passed as `client` to `LLMGenerator` and called with `generate([messages])` like `ChatOpenAI`.
+"""
+import hashlib
+import itertools
+import json
+import random
+import threading
+import time
+from typing import List
+
+from langchain.schema import LLMResult, ChatGeneration, AIMessage, BaseMessage
+
+from model.accounting import STAGE, count_message_tokens, count_tokens
+
+
+def prompt_key(messages: List[BaseMessage]) -> str:
+    content = json.dumps([[message.type, message.content] for message in messages])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class Latency:
+    """
+    Used to draw the latency of a response, in seconds, from a distribution given as
+    `fixed:S`, `uniform:MIN,MAX`, `normal:MEAN,STD` or `lognormal:MU,SIGMA` (of the log of the seconds)
+    """
+
+    def __init__(self, spec: str = "fixed:0", seed: int = 0) -> None:
+        (name, _, args) = spec.partition(":")
+        self.params = [float(arg) for arg in args.split(",") if arg]
+        self.draw = {
+            "fixed": lambda: self.params[0],
+            "uniform": lambda: self.random.uniform(*self.params),
+            "normal": lambda: self.random.gauss(*self.params),
+            "lognormal": lambda: self.random.lognormvariate(*self.params),
+        }.get(name)
+        if self.draw is None:
+            raise ValueError(f"unknown latency distribution: {spec}")
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def sample(self) -> float:
+        with self.lock:
+            return max(0.0, self.draw())
+
+
+class RecordingLLM:
+    def __init__(self, llm, path: str) -> None:
+        self.llm = llm
+        self.path = path
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+    def generate(self, messages_list: List[List[BaseMessage]], **kwargs) -> LLMResult:
+        llm_result = self.llm.generate(messages_list, **kwargs)
+        with self.lock, open(self.path, "a") as f:
+            for (messages, generation) in zip(messages_list, llm_result.generations):
+                for completion in generation:
+                    f.write(json.dumps({"key": prompt_key(messages), "stage": STAGE.get(),
+                                        "text": completion.text}) + "\n")
+        return llm_result
+
+
+class ReplayLLM:
+    def __init__(self, path: str, latency: str = "fixed:0", seed: int = 0, model_name: str = "replay") -> None:
+        """
+        :param path: the JSON Lines file written by `RecordingLLM`, records need no key
+        :param latency: see `Latency`
+        """
+        self.model_name = model_name
+        self.temperature = 0.0
+        self.latency = Latency(latency, seed)
+        self.responses = {}
+        stages = {}
+        with open(path, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.get("key"):
+                    self.responses[record["key"]] = record["text"]
+                stages.setdefault(record["stage"], []).append(record["text"])
+        self.stages = {stage: itertools.cycle(texts) for (stage, texts) in stages.items()}
+        self.calls = 0
+        self.hits = 0
+        self.lock = threading.Lock()
+
+    def respond(self, messages: List[BaseMessage]) -> str:
+        with self.lock:
+            self.calls += 1
+            text = self.responses.get(prompt_key(messages))
+            if text is not None:
+                self.hits += 1
+                return text
+            stage = STAGE.get()
+            if stage not in self.stages:
+                raise KeyError(f"no recorded response of stage {stage}")
+            return next(self.stages[stage])
+
+    def generate(self, messages_list: List[List[BaseMessage]], **kwargs) -> LLMResult:
+        # n completions of a prompt are the next n responses
+        texts = [[self.respond(messages) for _ in range(kwargs.get("n", 1))] for messages in messages_list]
+        time.sleep(self.latency.sample())
+        prompt_tokens = sum(count_message_tokens(messages) for messages in messages_list)
+        completion_tokens = sum(count_tokens(text) for completions in texts for text in completions)
+        return LLMResult(generations=[[ChatGeneration(message=AIMessage(content=text)) for text in completions]
+                                      for completions in texts],
+                         llm_output={"token_usage": {"prompt_tokens": prompt_tokens,
+                                                     "completion_tokens": completion_tokens,
+                                                     "total_tokens": prompt_tokens + completion_tokens},
+                                     "model_name": self.model_name})
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "recorded": self.hits}
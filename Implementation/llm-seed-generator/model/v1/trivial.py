@@ -4,7 +4,7 @@ from langchain.chat_models import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema import HumanMessage, AIMessage, SystemMessage
 
-from util.mg_util import parameter_info
+from util.mg_util import ParameterCache, parameter_info
 
 SYSTEM_MESSAGE_CONTENT = """
 You are an experienced test engineer.
@@ -82,8 +82,9 @@ FINAL_QUESTION_PROMPT_TEMPLATE = """
 
 
 class V1TrivialChatter:
-    def __init__(self, llm: ChatOpenAI) -> None:
+    def __init__(self, llm: ChatOpenAI, param_cache: ParameterCache = None) -> None:
         self.llm = llm
+        self.param_cache = param_cache
         self.system_msg = SystemMessage(content=SYSTEM_MESSAGE_CONTENT)
         self.few_shot_msgs = []
         for eg in FEW_SHOT_EXAMPLES:
@@ -93,7 +94,7 @@ class V1TrivialChatter:
     def format_template(self, mg, method_signature: str) -> str:
         final_question_msg = HumanMessage(content=FINAL_QUESTION_PROMPT_TEMPLATE.format(
             method_signature=method_signature,
-            type_information=parameter_info(mg, layer=5),
+            type_information=parameter_info(mg, layer=5, cache=self.param_cache),
             method_body=mg["code"]
         ))
         final_prompt_tmpl = ChatPromptTemplate.from_messages([
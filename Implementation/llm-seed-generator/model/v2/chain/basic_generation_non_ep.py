@@ -1,15 +1,19 @@
 import json
 import re
 import logging
+from typing import TYPE_CHECKING
 
-from langchain.chat_models import ChatOpenAI
-from langchain.prompts import (
-    FewShotChatMessagePromptTemplate,
-    ChatPromptTemplate,
-)
-from langchain.chains import LLMChain
 from langchain.schema import LLMResult
 import util.mg_util
+from model.accounting import stage
+from model.llm_cache import keep
+from prompt.example_library import ExampleLibrary
+from prompt.layout import chain_prompt
+from .sampling import sample_kwargs, split_samples
+
+if TYPE_CHECKING:
+    # imported by the first request, see model/client_pool.py
+    from langchain.chat_models import ChatOpenAI
 
 SYSTEM_MESSAGE = """
 You are an experienced tester. Now you are expected to write test inputs for the provided API method.
@@ -411,28 +415,17 @@ Example 3:
 ]
 
 class BasicGenerationNonEP:
-    def __init__(self, llm: ChatOpenAI) -> None:
+    def __init__(self, llm: "ChatOpenAI", examples: ExampleLibrary = None) -> None:
+        """
+        :param examples: the few-shot examples are selected from it, see prompt/example_library.py
+        """
         self.llm = llm
-        generator_shot_prompt = FewShotChatMessagePromptTemplate(
-            example_prompt=ChatPromptTemplate.from_messages(EXAMPLE_MESSAGE),
-            examples=EXAMPLES,
-        )
-        self.generator_prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", SYSTEM_MESSAGE),
-                generator_shot_prompt,
-            ] + QUESTION_MESSAGE
-        )
-        generator_non_static_shot_prompt = FewShotChatMessagePromptTemplate(
-            example_prompt=ChatPromptTemplate.from_messages(EXAMPLE_MESSAGE_NON_STATIC),
-            examples=EXAMPLES_NON_STATIC,
-        )
-        self.generator_non_static_prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", SYSTEM_MESSAGE_NON_STATIC),
-                generator_non_static_shot_prompt,
-            ] + QUESTION_MESSAGE_NON_STATIC
-        )
+        self.examples = examples
+        self.generator_prompt = chain_prompt(SYSTEM_MESSAGE, EXAMPLE_MESSAGE, EXAMPLES, QUESTION_MESSAGE, examples,
+                                             "basic_generation_non_ep.generator_prompt")
+        self.generator_non_static_prompt = chain_prompt(SYSTEM_MESSAGE_NON_STATIC, EXAMPLE_MESSAGE_NON_STATIC,
+                                                        EXAMPLES_NON_STATIC, QUESTION_MESSAGE_NON_STATIC, examples,
+                                                        "basic_generation_non_ep.generator_non_static_prompt")
 
     def parse_java(self, result: LLMResult):
         text = result.generations[0][0].text
@@ -449,24 +442,40 @@ class BasicGenerationNonEP:
         print(text)
         return [mobj.group(1).strip() for mobj in re.finditer(r"```import\n(.*?)```", text, re.M|re.S)]
 
-    def run(self, mg_dict: dict):
+    @stage("final_generation")
+    def run(self, mg_dict: dict, samples: int = 1):
+        """
+        :param samples: the number of completions asked for in one request,
+                        a list of results is returned if it is more than 1, see `sampling`
+        """
         class_name = mg_dict["className"]
         # Generate test cases
         if mg_dict["static"]:
-            messages = self.generator_prompt.format_messages(code=mg_dict["code"])
+            prompt_name = "basic_generation_non_ep.generator_prompt"
+            values = dict(code=mg_dict["code"])
+            messages = self.generator_prompt.format_messages(**values)
         else:
-            messages = self.generator_non_static_prompt.format_messages(code=mg_dict["code"], name=class_name)
+            prompt_name = "basic_generation_non_ep.generator_non_static_prompt"
+            values = dict(code=mg_dict["code"], name=class_name)
+            messages = self.generator_non_static_prompt.format_messages(**values)
         for message in messages:
             print(f"\33[32m{message.content}\033[0m\n")
-        llm_result: LLMResult = self.llm.generate([messages])
-        return {
-            "java": self.parse_java(llm_result),
-            "cons": self.parse_cons(llm_result),
-            "import": self.parse_import(llm_result)
-        }
+        llm_result: LLMResult = self.llm.generate([messages], **sample_kwargs(samples))
+        results = [{
+            "java": self.parse_java(sample),
+            "cons": self.parse_cons(sample),
+            "import": self.parse_import(sample)
+        } for sample in split_samples(llm_result)]
+        # an answer without test inputs is asked for again next time
+        if all(result["java"] for result in results):
+            keep(self.llm, llm_result)
+        if self.examples is not None:
+            self.examples.remember(prompt_name, values, llm_result, results)
+        return results if samples > 1 else results[0]
 
 
 if __name__ == "__main__":
     from config import *
+    from model.client_pool import ClientPool
 
-    llm = ChatOpenAI(model='gpt-3.5-turbo', temperature=0.0)
+    llm = ClientPool(LLM_ENDPOINTS, model='gpt-3.5-turbo', temperature=0.0)
@@ -0,0 +1,60 @@
+import hashlib
+import json
+import threading
+from typing import Optional
+
+from util.cache_util import SqliteLRUStore
+
+
+class ConstructorMemo:
+    """
+    Used to remember which constructor LLM has picked for a type.
+
+    * The key is the type, its simplified node (class type, constructors, sub classes, ...)
+      and the dependent types shown to LLM, so the entry is invalidated as soon as
+      the type's node in the method graph changes.
+    * The value is the picked constructor, e.g.
+      `Position(int line, int column): {"line": "int", "column": "int"}`.
+    * Entries are kept in memory and, if a store is given, on disk,
+      so they are shared by equivalence classes, methods and runs.
+    * A disabled memo never remembers anything.
+    """
+
+    def __init__(self, store: Optional[SqliteLRUStore] = None, enabled: bool = True) -> None:
+        self.store = store
+        self.enabled = enabled
+        self.memory = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(typ: str, type_info: dict, deps: str) -> str:
+        content = json.dumps([typ, type_info, deps], sort_keys=True)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        constructor = self.memory.get(key)
+        if constructor is None and self.store is not None:
+            value = self.store.get(key)
+            if value is not None:
+                constructor = value.decode("utf-8")
+                self.memory[key] = constructor
+        with self.lock:
+            if constructor is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return constructor
+
+    def put(self, key: str, constructor: str) -> None:
+        if not self.enabled:
+            return
+        self.memory[key] = constructor
+        if self.store is not None:
+            self.store.put(key, constructor.encode("utf-8"))
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
@@ -1,13 +1,16 @@
 import re
 import logging
+from typing import TYPE_CHECKING
 
-from langchain.chat_models import ChatOpenAI
-from langchain.prompts import (
-    FewShotChatMessagePromptTemplate,
-    ChatPromptTemplate,
-)
-from langchain.chains import LLMChain
 from langchain.schema import LLMResult
+from model.accounting import stage
+from model.llm_cache import keep
+from prompt.example_library import ExampleLibrary
+from prompt.layout import chain_prompt
+
+if TYPE_CHECKING:
+    # imported by the first request, see model/client_pool.py
+    from langchain.chat_models import ChatOpenAI
 
 
 SYSTEM_MESSAGE = """
@@ -148,19 +151,14 @@ Therefore, we can partition the following equivalence classes for `a`, `b`, and
 ]
            
 class EquivalencePartitioningChain:
-    def __init__(self, llm: ChatOpenAI) -> None:
+    def __init__(self, llm: "ChatOpenAI", examples: ExampleLibrary = None) -> None:
+        """
+        :param examples: the few-shot examples are selected from it, see prompt/example_library.py
+        """
         self.llm = llm
-        few_shot_prompt = FewShotChatMessagePromptTemplate(
-            example_prompt=ChatPromptTemplate.from_messages(EXAMPLE_MESSAGE),
-            examples=EXAMPLES,
-            # examples=[]
-        )
-        self.final_prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", SYSTEM_MESSAGE),
-                few_shot_prompt,
-            ] + QUESTION_MESSAGE
-        )
+        self.examples = examples
+        self.final_prompt = chain_prompt(SYSTEM_MESSAGE, EXAMPLE_MESSAGE, EXAMPLES, QUESTION_MESSAGE, examples,
+                                         "equivalence_partitioning.final_prompt")
 
     def parse_result(self, result:LLMResult):
         text = result.generations[0][0].text
@@ -168,18 +166,26 @@ class EquivalencePartitioningChain:
         return [mobj.group(1).strip() for mobj in re.finditer(r"^- class:\n(.*)", text, re.M)]
 
         
+    @stage("equivalence_partitioning")
     def run(self, code):
         messages = self.final_prompt.format_messages(code=code)
         for message in messages:
             print(f"\33[32m{message.content}\033[0m\n")
         llm_result: LLMResult = self.llm.generate([messages])
-        return self.parse_result(llm_result)
+        eq_classes = self.parse_result(llm_result)
+        if eq_classes:
+            keep(self.llm, llm_result)
+        if self.examples is not None and eq_classes:
+            self.examples.harvest("equivalence_partitioning.final_prompt", {"code": code},
+                                  llm_result.generations[0][0].text)
+        return eq_classes
 
 
 
 if __name__ == "__main__":
     from config import *
-    llm = ChatOpenAI(model='gpt-3.5-turbo', temperature=0.0)
+    from model.client_pool import ClientPool
+    llm = ClientPool(LLM_ENDPOINTS, model='gpt-3.5-turbo', temperature=0.0)
     chain = EquivalencePartitioningChain(llm)
 
     code = """
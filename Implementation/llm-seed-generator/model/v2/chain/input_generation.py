@@ -1,14 +1,18 @@
 import json
 import re
 import logging
+from typing import TYPE_CHECKING
 
-from langchain.chat_models import ChatOpenAI
-from langchain.prompts import (
-    FewShotChatMessagePromptTemplate,
-    ChatPromptTemplate,
-)
-from langchain.chains import LLMChain
 from langchain.schema import LLMResult
+from model.accounting import stage
+from model.llm_cache import keep
+from prompt.example_library import ExampleLibrary
+from prompt.layout import chain_prompt
+from .sampling import sample_kwargs, split_samples
+
+if TYPE_CHECKING:
+    # imported by the first request, see model/client_pool.py
+    from langchain.chat_models import ChatOpenAI
 
 
 SYSTEM_MESSAGE = """
@@ -41,6 +45,24 @@ QUESTION_MESSAGE_NON_STATIC = [
     ("ai", "Anwser: Let's do this step by step. "),
 ]
 
+# several equivalence classes in one request, the answer of each one follows its own heading, see `parse_batch`
+BATCH_INSTRUCTION = ("Write the test inputs of every input specification separately. "
+                     "Start the answer of each one with the line `### Specification <number>`, "
+                     "e.g. `### Specification 1`, followed by its examples.")
+
+BATCH_QUESTION_MESSAGE = [
+    ("human",
+     "API Method: ```java {code}```\n\nInput Specifications:\n{specs}\n\n" + BATCH_INSTRUCTION + "\n\n\n"),
+    ("ai", "Anwser: Let's do this step by step. "),
+]
+
+BATCH_QUESTION_MESSAGE_NON_STATIC = [
+    ("human",
+     "API Method: ```java {code}```\n\nInput Specifications:\n{specs}\n\nClass Constructors: {cons}\n\n"
+     + BATCH_INSTRUCTION + "\n\n\n"),
+    ("ai", "Anwser: Let's do this step by step. "),
+]
+
 EXAMPLE_MESSAGE_NON_STATIC = [
     ("human",
      "API Method: ```java {code}```\n\nInput Specification: {spec}\n\nClass Constructors: {cons}\n\n\n"),
@@ -563,77 +585,148 @@ Example 2:
     """}
 ]
            
+def code_blocks(text: str, tag: str) -> list:
+    return [mobj.group(1).strip() for mobj in re.finditer(r"```" + tag + r"\n(.*?)```", text, re.M | re.S)]
+
+
 class InputGenerationChain:
-    def __init__(self, llm: ChatOpenAI) -> None:
+    def __init__(self, llm: "ChatOpenAI", examples: ExampleLibrary = None) -> None:
+        """
+        :param examples: the few-shot examples are selected from it, see prompt/example_library.py
+        """
         self.llm = llm
-        few_shot_prompt = FewShotChatMessagePromptTemplate(
-            example_prompt=ChatPromptTemplate.from_messages(EXAMPLE_MESSAGE),
-            examples=EXAMPLES,
-            # examples=[]
-        )
-        self.final_prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", SYSTEM_MESSAGE),
-                few_shot_prompt,
-            ] + QUESTION_MESSAGE
-        )
-
-        few_shot_prompt_non_static = FewShotChatMessagePromptTemplate(
-            example_prompt=ChatPromptTemplate.from_messages(EXAMPLE_MESSAGE_NON_STATIC),
-            examples=EXAMPLES_NON_STATIC,
-            # examples=[]
-        )
-        self.final_prompt_non_static = ChatPromptTemplate.from_messages(
-            [
-                ("system", SYSTEM_MESSAGE_NON_STATIC),
-                few_shot_prompt_non_static,
-            ] + QUESTION_MESSAGE_NON_STATIC
-        )
+        self.examples = examples
+        self.final_prompt = chain_prompt(SYSTEM_MESSAGE, EXAMPLE_MESSAGE, EXAMPLES, QUESTION_MESSAGE, examples,
+                                         "input_generation.final_prompt")
+        # the same static prefix as a single request, only the question differs
+        self.batch_prompt = chain_prompt(SYSTEM_MESSAGE, EXAMPLE_MESSAGE, EXAMPLES, BATCH_QUESTION_MESSAGE, examples,
+                                         "input_generation.final_prompt")
+
+        self.final_prompt_non_static = chain_prompt(SYSTEM_MESSAGE_NON_STATIC, EXAMPLE_MESSAGE_NON_STATIC,
+                                                    EXAMPLES_NON_STATIC, QUESTION_MESSAGE_NON_STATIC, examples,
+                                                    "input_generation.final_prompt_non_static")
+        self.batch_prompt_non_static = chain_prompt(SYSTEM_MESSAGE_NON_STATIC, EXAMPLE_MESSAGE_NON_STATIC,
+                                                    EXAMPLES_NON_STATIC, BATCH_QUESTION_MESSAGE_NON_STATIC, examples,
+                                                    "input_generation.final_prompt_non_static")
 
     def parse_java(self, result:LLMResult):
         text = result.generations[0][0].text
         print(text)
-        return [mobj.group(1).strip() for mobj in re.finditer(r"```java\n(.*?)```", text, re.M|re.S)]
+        return code_blocks(text, "java")
 
     def parse_cons(self, result:LLMResult):
         text = result.generations[0][0].text
         print(text)
-        return [mobj.group(1).strip() for mobj in re.finditer(r"```class object\n(.*?)```", text, re.M|re.S)]
+        return code_blocks(text, "class object")
 
     def parse_import(self, result:LLMResult):
         text = result.generations[0][0].text
         print(text)
-        return [mobj.group(1).strip() for mobj in re.finditer(r"```import\n(.*?)```", text, re.M|re.S)]
+        return code_blocks(text, "import")
+
+    def parse_batch(self, result: LLMResult, size: int) -> list:
+        """
+        Used to split the answer of a batched request into the answers of its specifications
+        :return: a list with a dict ("java", "cons", "import") per specification,
+                 None for a specification whose answer is missing or has no test inputs
+        """
+        text = result.generations[0][0].text
+        print(text)
+        # [text before the first heading, number, answer, number, answer, ...]
+        parts = re.split(r"^[ \t]*#+[ \t]*Specification[ \t]*(\d+)[^\n]*$", text, flags=re.M)
+        answers = {}
+        for (number, answer) in zip(parts[1::2], parts[2::2]):
+            answers.setdefault(int(number), answer)
+        results = []
+        for number in range(1, size + 1):
+            answer = answers.get(number, "")
+            java = code_blocks(answer, "java")
+            results.append({
+                "java": java,
+                "cons": code_blocks(answer, "class object"),
+                "import": code_blocks(answer, "import")
+            } if java else None)
+        return results
+
+    def class_constructors(self, mg_dict: dict) -> str:
+        class_name = mg_dict["className"]
+        constructor = mg_dict["nodes"][class_name].get("constructors")
+        builders = mg_dict["nodes"][class_name].get("builders")
+        constructor_str = "- class: " + class_name + "\n"
+        if len(constructor) != 0:
+            constructor_str += "\t- Constructors: \n"
+            for k in constructor.keys():
+                constructor_str += "\t\t- " + k + ": " + str(constructor[k]) + "\n"
+        if len(builders) != 0:
+            constructor_str += "\t- Builders: \n"
+            for k in builders.keys():
+                constructor_str += "\t\t- " + k + ": " + str(builders[k]) + "\n"
+        return constructor_str
+
+    @stage("final_generation")
+    def run(self, mg_dict: dict, specification, samples: int = 1):
+        """
+        :param samples: the number of completions asked for in one request,
+                        a list of results is returned if it is more than 1, see `sampling`
+        """
 
-        
-    def run(self, mg_dict: dict, specification) -> dict:
+        if mg_dict["static"]:
+            prompt_name = "input_generation.final_prompt"
+            values = dict(code=mg_dict["code"], spec=specification)
+            messages = self.final_prompt.format_messages(**values)
+        else:
+            prompt_name = "input_generation.final_prompt_non_static"
+            values = dict(code=mg_dict["code"], spec=specification, cons=self.class_constructors(mg_dict))
+            messages = self.final_prompt_non_static.format_messages(**values)
 
+        for message in messages:
+            print(f"\33[32m{message.content}\033[0m\n")
+        llm_result: LLMResult = self.llm.generate([messages], **sample_kwargs(samples))
+        results = [{
+            "java": self.parse_java(sample),
+            "cons": self.parse_cons(sample),
+            "import": self.parse_import(sample)
+        } for sample in split_samples(llm_result)]
+        # an answer without test inputs is asked for again next time
+        if all(result["java"] for result in results):
+            keep(self.llm, llm_result)
+        if self.examples is not None:
+            self.examples.remember(prompt_name, values, llm_result, results)
+        return results if samples > 1 else results[0]
+
+    @stage("batch_generation")
+    def run_batch(self, mg_dict: dict, specifications: list, samples: int = 1) -> list:
+        """
+        Used to generate for several equivalence classes of a method in one request.
+        A specification whose answer cannot be parsed is asked for again on its own, see `run`.
+        :param specifications: the equivalence classes
+        :param samples: see `run`
+        :return: a list with the result of `run` for every specification
+        """
+        if len(specifications) == 1:
+            return [self.run(mg_dict, specifications[0], samples=samples)]
+        specs = "\n".join(f"Specification {i}: {spec.strip()}" for (i, spec) in enumerate(specifications, 1))
         if mg_dict["static"]:
-            messages = self.final_prompt.format_messages(code=mg_dict["code"], spec=specification)
+            messages = self.batch_prompt.format_messages(code=mg_dict["code"], specs=specs)
         else:
-            class_name = mg_dict["className"]
-            constructor = mg_dict["nodes"][class_name].get("constructors")
-            builders = mg_dict["nodes"][class_name].get("builders")
-            constructor_str = "- class: " + class_name + "\n"
-            if len(constructor) != 0:
-                constructor_str += "\t- Constructors: \n"
-                for k in constructor.keys():
-                    constructor_str += "\t\t- " + k + ": " + str(constructor[k]) + "\n"
-            if len(builders) != 0:
-                constructor_str += "\t- Builders: \n"
-                for k in builders.keys():
-                    constructor_str += "\t\t- " + k + ": " + str(builders[k]) + "\n"
-
-            messages = self.final_prompt_non_static.format_messages(code=mg_dict["code"], spec=specification, cons=constructor_str)
+            messages = self.batch_prompt_non_static.format_messages(code=mg_dict["code"], specs=specs,
+                                                                    cons=self.class_constructors(mg_dict))
 
         for message in messages:
             print(f"\33[32m{message.content}\033[0m\n")
-        llm_result: LLMResult = self.llm.generate([messages])
-        return {
-            "java": self.parse_java(llm_result),
-            "cons": self.parse_cons(llm_result),
-            "import": self.parse_import(llm_result)
-        }
+        llm_result: LLMResult = self.llm.generate([messages], **sample_kwargs(samples))
+        # answers[j][i]: the answer of the j-th sample to the i-th specification
+        answers = [self.parse_batch(sample, len(specifications)) for sample in split_samples(llm_result)]
+        if all(answer[i] is not None for answer in answers for i in range(len(specifications))):
+            keep(self.llm, llm_result)
+        results = []
+        for (i, specification) in enumerate(specifications):
+            if any(answer[i] is None for answer in answers):
+                print(f"\033[33m> Batched answer of specification {i + 1} cannot be parsed, asking for it alone\033[0m")
+                results.append(self.run(mg_dict, specification, samples=samples))
+            else:
+                results.append([answer[i] for answer in answers] if samples > 1 else answers[0][i])
+        return results
 
 
 
@@ -641,14 +734,15 @@ class InputGenerationChain:
 
 if __name__ == "__main__":
     from config import *
-    llm = ChatOpenAI(model='gpt-3.5-turbo', temperature=0.0)
+    from model.client_pool import ClientPool
+    llm = ClientPool(LLM_ENDPOINTS, model='gpt-3.5-turbo', temperature=0.0)
     chain = InputGenerationChain(llm)
 
-    file = open("../../../graph.json", "r")
-    file_content = file.read()
-    file.close()
-    mg_dict = json.loads(file_content.replace("\n", ""))
+    from util.graph_loader import load_graph
+
+    mg_dict = load_graph("../../../graph.json")
 
     chain.run(mg_dict, "1. `fieldName`: is not null; 2. `lhs`: is false; 3. `rhs`: is true")
+    chain.run_batch(mg_dict, ["1. `fieldName`: is null", "1. `fieldName`: is not null; 2. `lhs`: is false"])
 
 
@@ -1,11 +1,16 @@
 import re
+from typing import TYPE_CHECKING
 
-from langchain.chat_models import ChatOpenAI
-from langchain.prompts import (
-    FewShotChatMessagePromptTemplate,
-    ChatPromptTemplate,
-)
 from langchain.schema import LLMResult
+from model.accounting import stage
+from model.llm_cache import keep
+from prompt.example_library import ExampleLibrary
+from prompt.layout import chain_prompt
+from .sampling import sample_kwargs, split_samples
+
+if TYPE_CHECKING:
+    # imported by the first request, see model/client_pool.py
+    from langchain.chat_models import ChatOpenAI
 
 
 SYSTEM_MESSAGE = """
@@ -685,31 +690,18 @@ Example 3:
 ]
            
 class InputGenerationNonEPChain:
-    def __init__(self, llm: ChatOpenAI) -> None:
+    def __init__(self, llm: "ChatOpenAI", examples: ExampleLibrary = None) -> None:
+        """
+        :param examples: the few-shot examples are selected from it, see prompt/example_library.py
+        """
         self.llm = llm
-        few_shot_prompt = FewShotChatMessagePromptTemplate(
-            example_prompt=ChatPromptTemplate.from_messages(EXAMPLE_MESSAGE),
-            examples=EXAMPLES,
-            # examples=[]
-        )
-        self.final_prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", SYSTEM_MESSAGE),
-                few_shot_prompt,
-            ] + QUESTION_MESSAGE
-        )
-
-        few_shot_prompt_non_static = FewShotChatMessagePromptTemplate(
-            example_prompt=ChatPromptTemplate.from_messages(EXAMPLE_MESSAGE_NON_STATIC),
-            examples=EXAMPLES_NON_STATIC,
-            # examples=[]
-        )
-        self.final_prompt_non_static = ChatPromptTemplate.from_messages(
-            [
-                ("system", SYSTEM_MESSAGE_NON_STATIC),
-                few_shot_prompt_non_static,
-            ] + QUESTION_MESSAGE_NON_STATIC
-        )
+        self.examples = examples
+        self.final_prompt = chain_prompt(SYSTEM_MESSAGE, EXAMPLE_MESSAGE, EXAMPLES, QUESTION_MESSAGE, examples,
+                                         "input_generation_non_ep.final_prompt")
+
+        self.final_prompt_non_static = chain_prompt(SYSTEM_MESSAGE_NON_STATIC, EXAMPLE_MESSAGE_NON_STATIC,
+                                                    EXAMPLES_NON_STATIC, QUESTION_MESSAGE_NON_STATIC, examples,
+                                                    "input_generation_non_ep.final_prompt_non_static")
 
     def parse_java(self, result: LLMResult):
         text = result.generations[0][0].text
@@ -727,9 +719,16 @@ class InputGenerationNonEPChain:
         return [mobj.group(1).strip() for mobj in re.finditer(r"```import\n(.*?)```", text, re.M|re.S)]
 
         
-    def run(self, mg_dict: dict):
+    @stage("final_generation")
+    def run(self, mg_dict: dict, samples: int = 1):
+        """
+        :param samples: the number of completions asked for in one request,
+                        a list of results is returned if it is more than 1, see `sampling`
+        """
         if mg_dict["static"]:
-            messages = self.final_prompt.format_messages(code=mg_dict["code"])
+            prompt_name = "input_generation_non_ep.final_prompt"
+            values = dict(code=mg_dict["code"])
+            messages = self.final_prompt.format_messages(**values)
         else:
             class_name = mg_dict["className"]
             constructor = mg_dict["nodes"][class_name].get("constructors")
@@ -744,20 +743,33 @@ class InputGenerationNonEPChain:
                 for k in builders.keys():
                     constructor_str += "\t\t- " + k + ": " + str(builders[k]) + "\n"
 
-            messages = self.final_prompt_non_static.format_messages(code=mg_dict["code"], cons=constructor_str)
+            prompt_name = "input_generation_non_ep.final_prompt_non_static"
+
+            values = dict(code=mg_dict["code"], cons=constructor_str)
+
+            messages = self.final_prompt_non_static.format_messages(**values)
         for message in messages:
             print(f"\33[32m{message.content}\033[0m\n")
-        llm_result: LLMResult = self.llm.generate([messages])
-        return {
-            "java": self.parse_java(llm_result),
-            "cons": self.parse_cons(llm_result),
-            "import": self.parse_import(llm_result)
-        }
+        llm_result: LLMResult = self.llm.generate([messages], **sample_kwargs(samples))
+        results = [{
+            "java": self.parse_java(sample),
+            "cons": self.parse_cons(sample),
+            "import": self.parse_import(sample)
+        } for sample in split_samples(llm_result)]
+        # an answer without test inputs is asked for again next time
+        if all(result["java"] for result in results):
+            keep(self.llm, llm_result)
+        if self.examples is not None:
+            self.examples.remember(prompt_name, values, llm_result, results)
+        return results if samples > 1 else results[0]
 
 
 
 
 
 if __name__ == "__main__":
-    llm = ChatOpenAI(model='gpt-3.5-turbo', temperature=0.0)
+    from config import *
+    from model.client_pool import ClientPool
+
+    llm = ClientPool(LLM_ENDPOINTS, model='gpt-3.5-turbo', temperature=0.0)
     chain = InputGenerationNonEPChain(llm)
\ No newline at end of file
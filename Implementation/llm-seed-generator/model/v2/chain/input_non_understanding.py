@@ -1,15 +1,19 @@
 import json
 import re
 import logging
+from typing import TYPE_CHECKING
 
-from langchain.chat_models import ChatOpenAI
-from langchain.prompts import (
-    FewShotChatMessagePromptTemplate,
-    ChatPromptTemplate,
-)
-from langchain.chains import LLMChain
 from langchain.schema import LLMResult
 import util.mg_util
+from model.accounting import stage
+from model.llm_cache import keep
+from prompt.example_library import ExampleLibrary
+from prompt.layout import chain_prompt
+from .sampling import sample_kwargs, split_samples
+
+if TYPE_CHECKING:
+    # imported by the first request, see model/client_pool.py
+    from langchain.chat_models import ChatOpenAI
 
 SYSTEM_MESSAGE = """
 You are an experienced tester. Now you are expected to write test inputs for the provided API method.
@@ -53,6 +57,8 @@ EXAMPLES = [
 TokenRange withBegin(JavaToken begin) {
     return new TokenRange(assertNotNull(begin), end);
 }
+""", "spec": """
+1. `begin`: is not null
 """, "deps": """
 
 """, "answer": """
@@ -110,6 +116,8 @@ Example 3:
 boolean areInOrder(Node a, Node b, boolean ignoringAnnotations) {
     return compare(a, b, ignoringAnnotations) <= 0;
 }
+""", "spec": """
+1. `a`: is not null; 2. `b`: is not null, `a` is in order before `b`; 3. `ignoringAnnotations`: is true
 """, "deps": """
   - abstract class: com.github.javaparser.ast.Node
     - Sub classes name:
@@ -415,7 +423,12 @@ EXAMPLES_NON_STATIC = [
 TokenRange withBegin(JavaToken begin) {
     return new TokenRange(assertNotNull(begin), end);
 }
-    """, "deps": """
+    """, "cons": """
+- class: com.github.javaparser.TokenRange
+    - Constructors:
+        - TokenRange(JavaToken begin, JavaToken end): {'begin': 'com.github.javaparser.JavaToken', 'end': 'com.github.javaparser.JavaToken'}
+    """, "spec": """1. `begin`: is not null""",
+        "deps": """
   - class: com.github.javaparser.JavaToken
     - Constructors:
         - JavaToken(int kind): {'kind': 'int'}
@@ -510,7 +523,8 @@ Example 3:
 ]
 
 class InputNonUnderstandingChain:
-    def __init__(self, llm: ChatOpenAI) -> None:
+    def __init__(self, llm: "ChatOpenAI", param_cache: util.mg_util.ParameterCache = None,
+                 examples: ExampleLibrary = None) -> None:
         """
         Used to initialise LLMChain
         There are three chains:
@@ -518,28 +532,17 @@ class InputNonUnderstandingChain:
             2. further_shot_prompt: a hierarchical understanding of their subclasses for more complex parameters
             3. generator_shot_prompt： integrate the output of the previous times to generate test cases
         1. and 2. can specify a constructor which can be used to initialise parameter
+        :param param_cache: parameter information shared with the other chains of a generator
+        :param examples: the few-shot examples are selected from it, see prompt/example_library.py
         """
         self.llm = llm
-        generator_shot_prompt = FewShotChatMessagePromptTemplate(
-            example_prompt=ChatPromptTemplate.from_messages(EXAMPLE_MESSAGE),
-            examples=EXAMPLES,
-        )
-        self.generator_prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", SYSTEM_MESSAGE),
-                generator_shot_prompt,
-            ] + QUESTION_MESSAGE
-        )
-        generator_non_static_shot_prompt = FewShotChatMessagePromptTemplate(
-            example_prompt=ChatPromptTemplate.from_messages(EXAMPLE_MESSAGE_NON_STATIC),
-            examples=EXAMPLES_NON_STATIC,
-        )
-        self.generator_non_static_prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", SYSTEM_MESSAGE_NON_STATIC),
-                generator_non_static_shot_prompt,
-            ] + QUESTION_MESSAGE_NON_STATIC
-        )
+        self.examples = examples
+        self.param_cache = param_cache
+        self.generator_prompt = chain_prompt(SYSTEM_MESSAGE, EXAMPLE_MESSAGE, EXAMPLES, QUESTION_MESSAGE, examples,
+                                             "input_non_understanding.generator_prompt")
+        self.generator_non_static_prompt = chain_prompt(SYSTEM_MESSAGE_NON_STATIC, EXAMPLE_MESSAGE_NON_STATIC,
+                                                        EXAMPLES_NON_STATIC, QUESTION_MESSAGE_NON_STATIC, examples,
+                                                        "input_non_understanding.generator_non_static_prompt")
         # `types` is a set which record the type LLM has understood
         self.types = set()
         # `cons` is a string which includes the entire constructor generator_shot_prompt need to use
@@ -601,11 +604,16 @@ class InputNonUnderstandingChain:
                     result += f"        - {signature}: {params}\n"
         return result
 
-    def run(self, spec, mg_dict: dict):
+    @stage("final_generation")
+    def run(self, spec, mg_dict: dict, samples: int = 1):
+        """
+        :param samples: the number of completions asked for in one request,
+                        a list of results is returned if it is more than 1, see `sampling`
+        """
         # Clear all cache information
         self.cons = ""
         self.types = set()
-        param_list = util.mg_util.parameter_info(mg_dict, layer=10)
+        param_list = util.mg_util.parameter_info(mg_dict, layer=10, cache=self.param_cache)
 
         class_name = mg_dict["className"]
         constructor = mg_dict["nodes"][class_name]["constructors"]
@@ -622,22 +630,31 @@ class InputNonUnderstandingChain:
 
         # Generate test cases
         if mg_dict["static"]:
-            messages = self.generator_prompt.format_messages(code=mg_dict["code"], spec=spec, deps=param_list)
+            prompt_name = "input_non_understanding.generator_prompt"
+            values = dict(code=mg_dict["code"], spec=spec, deps=param_list)
+            messages = self.generator_prompt.format_messages(**values)
         else:
-            messages = self.generator_non_static_prompt.format_messages(code=mg_dict["code"], spec=spec,
-                                                                        deps=param_list,
-                                                                        cons=constructor_str)
+            prompt_name = "input_non_understanding.generator_non_static_prompt"
+            values = dict(code=mg_dict["code"], spec=spec, deps=param_list, cons=constructor_str)
+            messages = self.generator_non_static_prompt.format_messages(**values)
         for message in messages:
             print(f"\33[32m{message.content}\033[0m\n")
-        llm_result: LLMResult = self.llm.generate([messages])
-        return {
-            "java": self.parse_java(llm_result),
-            "cons": self.parse_cons(llm_result),
-            "import": self.parse_import(llm_result)
-        }
+        llm_result: LLMResult = self.llm.generate([messages], **sample_kwargs(samples))
+        results = [{
+            "java": self.parse_java(sample),
+            "cons": self.parse_cons(sample),
+            "import": self.parse_import(sample)
+        } for sample in split_samples(llm_result)]
+        # an answer without test inputs is asked for again next time
+        if all(result["java"] for result in results):
+            keep(self.llm, llm_result)
+        if self.examples is not None:
+            self.examples.remember(prompt_name, values, llm_result, results)
+        return results if samples > 1 else results[0]
 
 
 if __name__ == "__main__":
     from config import *
+    from model.client_pool import ClientPool
 
-    llm = ChatOpenAI(model='gpt-3.5-turbo', temperature=0.0)
+    llm = ClientPool(LLM_ENDPOINTS, model='gpt-3.5-turbo', temperature=0.0)
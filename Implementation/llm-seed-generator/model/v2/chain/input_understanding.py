@@ -1,16 +1,25 @@
+import contextvars
 import json
 import re
+import sys
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from queue import Queue
+from typing import TYPE_CHECKING
 
-from langchain.chat_models import ChatOpenAI
-from langchain.prompts import (
-    FewShotChatMessagePromptTemplate,
-    ChatPromptTemplate,
-)
-from langchain.chains import LLMChain
 from langchain.schema import LLMResult
 import util.mg_util
+from .constructor_memo import ConstructorMemo
+from model.accounting import stage
+from model.llm_cache import keep
+from prompt.example_library import ExampleLibrary
+from prompt.layout import chain_prompt
+from .sampling import sample_kwargs, split_samples
+
+if TYPE_CHECKING:
+    # imported by the first request, see model/client_pool.py
+    from langchain.chat_models import ChatOpenAI
 
 SYSTEM_MESSAGE_1 = """
 You are an experienced tester. Now you are expected to understand the inputs of the provided API method.
@@ -338,7 +347,9 @@ Example 2:
 
 
 class InputUnderstandingChain:
-    def __init__(self, llm: ChatOpenAI) -> None:
+    def __init__(self, llm: "ChatOpenAI", memo: ConstructorMemo = None,
+                 max_concurrency: int = 1, call_budget: int = sys.maxsize,
+                 param_cache: util.mg_util.ParameterCache = None, examples: ExampleLibrary = None) -> None:
         """
         Used to initialise LLMChain
         There are three chains:
@@ -346,52 +357,60 @@ class InputUnderstandingChain:
             2. further_shot_prompt: a hierarchical understanding of their subclasses for more complex parameters
             3. generator_shot_prompt： integrate the output of the previous times to generate test cases
         1. and 2. can specify a constructor which can be used to initialise parameter
+        :param memo: constructors picked for a type by 1. and 2., reused across classes and methods
+        :param max_concurrency: maximum number of constructor parameters understood at the same time
+        :param call_budget: maximum number of LLM calls 1. and 2. may spend in one run
+        :param param_cache: parameter information shared with the other chains of a generator
+        :param examples: the few-shot examples are selected from it, see prompt/example_library.py
         """
         self.llm = llm
-        preliminary_shot_prompt = FewShotChatMessagePromptTemplate(
-            example_prompt=ChatPromptTemplate.from_messages(EXAMPLE_MESSAGE_1),
-            examples=EXAMPLES_1,
-        )
-        self.preliminary_prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", SYSTEM_MESSAGE_1),
-                preliminary_shot_prompt,
-            ] + QUESTION_MESSAGE_1
-        )
-        further_shot_prompt = FewShotChatMessagePromptTemplate(
-            example_prompt=ChatPromptTemplate.from_messages(EXAMPLE_MESSAGE_2),
-            examples=EXAMPLES_2,
-        )
-        self.further_prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", SYSTEM_MESSAGE_2),
-                further_shot_prompt,
-            ] + QUESTION_MESSAGE_2
-        )
-        generator_shot_prompt = FewShotChatMessagePromptTemplate(
-            example_prompt=ChatPromptTemplate.from_messages(EXAMPLE_MESSAGE_3),
-            examples=EXAMPLES_3,
-        )
-        self.generator_prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", SYSTEM_MESSAGE_3),
-                generator_shot_prompt,
-            ] + QUESTION_MESSAGE_3
-        )
-        generator_non_static_shot_prompt = FewShotChatMessagePromptTemplate(
-            example_prompt=ChatPromptTemplate.from_messages(EXAMPLE_MESSAGE_3_NON_STATIC),
-            examples=EXAMPLES_3_NON_STATIC,
-        )
-        self.generator_non_static_prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", SYSTEM_MESSAGE_3_NON_STATIC),
-                generator_non_static_shot_prompt,
-            ] + QUESTION_MESSAGE_3_NON_STATIC
-        )
+        self.examples = examples
+        self.memo = memo if memo is not None else ConstructorMemo(enabled=False)
+        self.max_concurrency = max(1, max_concurrency)
+        self.call_budget = call_budget
+        self.param_cache = param_cache
+        self.preliminary_prompt = chain_prompt(SYSTEM_MESSAGE_1, EXAMPLE_MESSAGE_1, EXAMPLES_1, QUESTION_MESSAGE_1,
+                                               examples, "input_understanding.preliminary_prompt")
+        self.further_prompt = chain_prompt(SYSTEM_MESSAGE_2, EXAMPLE_MESSAGE_2, EXAMPLES_2, QUESTION_MESSAGE_2,
+                                           examples, "input_understanding.further_prompt")
+        self.generator_prompt = chain_prompt(SYSTEM_MESSAGE_3, EXAMPLE_MESSAGE_3, EXAMPLES_3, QUESTION_MESSAGE_3,
+                                             examples, "input_understanding.generator_prompt")
+        self.generator_non_static_prompt = chain_prompt(SYSTEM_MESSAGE_3_NON_STATIC, EXAMPLE_MESSAGE_3_NON_STATIC,
+                                                        EXAMPLES_3_NON_STATIC, QUESTION_MESSAGE_3_NON_STATIC, examples,
+                                                        "input_understanding.generator_non_static_prompt")
+        # `types` and `cons` belong to one run, keep them per thread
+        # so that several equivalence classes can be understood concurrently
+        self.local = threading.local()
         # `types` is a set which record the type LLM has understood
         self.types = set()
         # `cons` is a string which includes the entire constructor generator_shot_prompt need to use
         self.cons = ""
+        # `calls` is the number of LLM calls spent on understanding in this run
+        self.calls = 0
+
+    @property
+    def types(self) -> set:
+        return self.local.types
+
+    @types.setter
+    def types(self, value: set):
+        self.local.types = value
+
+    @property
+    def calls(self) -> int:
+        return self.local.calls
+
+    @calls.setter
+    def calls(self, value: int):
+        self.local.calls = value
+
+    @property
+    def cons(self) -> str:
+        return self.local.cons
+
+    @cons.setter
+    def cons(self, value: str):
+        self.local.cons = value
 
     def parse_constructor(self, result: LLMResult):
         """
@@ -476,38 +495,86 @@ class InputUnderstandingChain:
                         result = self.init_dict(param_dict, name, layer - 1, result)
         return result
 
+    @stage("further_understanding")
+    def further_constructor(self, node: dict, spec) -> str:
+        """
+        Used to ask LLM for the constructor of one parameter of a constructor
+        :param node: a node of the type-dependency DAG built by `understand_further`
+        :param spec: specification to be satisfied at parsing time
+        """
+        messages = self.further_prompt.format_messages(constructor=node["parent"], param=node["param"],
+                                                       deps=node["deps"],
+                                                       spec=spec)
+        for message in messages:
+            print(f"\33[32m{message.content}\033[0m\n")
+        llm_result: LLMResult = self.llm.generate([messages])
+        constructor = self.parse_constructor(llm_result).pop().replace("'", "\"")
+        keep(self.llm, llm_result)
+        return constructor
+
+    def run_concurrently(self, tasks) -> list:
+        """
+        Used to run independent LLM calls, the results keep the order of `tasks`
+        """
+        if self.max_concurrency == 1 or len(tasks) <= 1:
+            return [task() for task in tasks]
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(tasks))) as executor:
+            futures = [executor.submit(contextvars.copy_context().run, task) for task in tasks]
+            return [future.result() for future in futures]
+
     def understand_further(self, constructor, param_dict: dict, spec):
         """
         Used to parse the parameters of a constructor
+        The parameter types form a DAG which is expanded layer by layer. Types of the same
+        layer do not depend on each other, so their LLM calls are sent concurrently.
+        Every type is resolved at most once, which also breaks cycles, and no more than
+        `call_budget` LLM calls are spent per run. Once the DAG is complete, the constructors
+        are appended to `self.cons` in depth-first order.
         :param constructor: current constructor to be resolved
         :param param_dict: all parameters' info
         :param spec: specification to be satisfied at parsing time
         """
-
-        # c_param is a dict that holds information about the type of the parameter
-
-        c_param = json.loads('{' + constructor.split('{').pop())
-
-        result = ""
-        for t in set(c_param.values()):
-            if param_dict.get(t):
-                result += self.init_dict(param_dict, t, 2, "")
-        for n in c_param.keys():
-            if c_param[n] in self.types:
-                continue
-            if param_dict.get(c_param[n]).get("__is_jdk_type__"):
-                continue
-            messages = self.further_prompt.format_messages(constructor=constructor, param=n,
-                                                           deps=self.init_dict(param_dict, c_param[n], 2, ""),
-                                                           spec=spec)
-            for message in messages:
-                print(f"\33[32m{message.content}\033[0m\n")
-            llm_result: LLMResult = self.llm.generate([messages])
-            self.types.add(c_param[n])
-            cons_result = self.parse_constructor(llm_result).pop().replace("'", "\"")
-
-            parse_type = c_param[n]
-            # Putting the result of parsing into self.cons for subsequent use
+        root = {"constructor": constructor, "children": []}
+        layer = [root]
+        while layer:
+            pending = []
+            for node in layer:
+                # c_param is a dict that holds information about the type of the parameter
+                c_param = json.loads('{' + node["constructor"].split('{').pop())
+                for n in c_param.keys():
+                    if c_param[n] in self.types:
+                        continue
+                    # a jdk type, or one beyond the layers searched, which has nothing to be understood
+                    if not param_dict.get(c_param[n]) or param_dict.get(c_param[n]).get("__is_jdk_type__"):
+                        continue
+                    self.types.add(c_param[n])
+                    deps = self.init_dict(param_dict, c_param[n], 2, "")
+                    memo_key = self.memo.key(c_param[n], param_dict.get(c_param[n]), deps)
+                    child = {"type": c_param[n], "param": n, "parent": node["constructor"], "deps": deps,
+                             "memo_key": memo_key, "constructor": self.memo.get(memo_key), "children": []}
+                    if child["constructor"] is None:
+                        if self.calls >= self.call_budget:
+                            continue
+                        self.calls += 1
+                        pending.append(child)
+                    node["children"].append(child)
+
+            results = self.run_concurrently([lambda child=child: self.further_constructor(child, spec)
+                                             for child in pending])
+            for (child, cons_result) in zip(pending, results):
+                child["constructor"] = cons_result
+                self.memo.put(child["memo_key"], cons_result)
+            layer = [child for node in layer for child in node["children"]]
+
+        self.append_constructors(root, param_dict)
+
+    def append_constructors(self, node: dict, param_dict: dict):
+        """
+        Used to put the constructors of a resolved DAG into self.cons for subsequent use
+        """
+        constructor = node["constructor"]
+        for child in node["children"]:
+            parse_type = child["type"]
             if param_dict.get(parse_type).get("classType") == 'abstract class' or \
                     param_dict.get(parse_type).get("classType") == 'interface':
                 if param_dict.get(parse_type).get("subClassName") is not None:
@@ -524,11 +591,12 @@ class InputUnderstandingChain:
                             if constructor.split(":")[0] in param_dict.get(sub_name).get("constructors"):
                                 self.cons += sub_name + "\nConstructor of " + sub_name + ": "
                                 break
-            self.cons += cons_result + "\n"
+            self.cons += child["constructor"] + "\n"
 
-            # The parameters of the generated constructor need to be parsed again.
-            self.understand_further(cons_result, param_dict, spec)
+            # The parameters of the generated constructor come right after it.
+            self.append_constructors(child, param_dict)
 
+    @stage("preliminary_understanding")
     def understand_param(self, code, spec, mg_dict: dict):
         """
         Used to understand the parameters of the method to be tested
@@ -538,25 +606,34 @@ class InputUnderstandingChain:
         :return:
         """
         # Simplify all the type information and extract what is needed
-        param_dict = util.mg_util.parameters(mg_dict, layer=10)
+        param_dict = util.mg_util.parameters(mg_dict, layer=10, cache=self.param_cache)
 
         if mg_dict.get("parameters"):
             p_type = mg_dict.get("parameters")
             for p in p_type.keys():
                 if p_type.get(p) in self.types:
                     continue
-                if param_dict.get(p_type.get(p)).get("__is_jdk_type__"):
+                # a jdk type, or one beyond the layers searched, which has nothing to be understood
+                if not param_dict.get(p_type.get(p)) or param_dict.get(p_type.get(p)).get("__is_jdk_type__"):
                     continue
                 self.types.add(p_type.get(p))
-                messages = self.preliminary_prompt.format_messages(code=code,
-                                                                   param=p,
-                                                                   deps=self.init_dict(param_dict, p_type.get(p), 2,
-                                                                                       ""),
-                                                                   spec=spec)
-                for message in messages:
-                    print(f"\33[32m{message.content}\033[0m\n")
-                llm_result: LLMResult = self.llm.generate([messages])
-                constructor = self.parse_constructor(llm_result).pop().replace("'", "\"")
+                deps = self.init_dict(param_dict, p_type.get(p), 2, "")
+                memo_key = self.memo.key(p_type.get(p), param_dict.get(p_type.get(p)), deps)
+                constructor = self.memo.get(memo_key)
+                if constructor is None:
+                    if self.calls >= self.call_budget:
+                        continue
+                    self.calls += 1
+                    messages = self.preliminary_prompt.format_messages(code=code,
+                                                                       param=p,
+                                                                       deps=deps,
+                                                                       spec=spec)
+                    for message in messages:
+                        print(f"\33[32m{message.content}\033[0m\n")
+                    llm_result: LLMResult = self.llm.generate([messages])
+                    constructor = self.parse_constructor(llm_result).pop().replace("'", "\"")
+                    keep(self.llm, llm_result)
+                    self.memo.put(memo_key, constructor)
 
                 parse_type = p_type.get(p)
                 # Putting the result of parsing into self.cons for subsequent use
@@ -583,11 +660,17 @@ class InputUnderstandingChain:
                 # The parameters of the generated constructor need to be parsed again.
                 self.understand_further(constructor, param_dict, spec)
 
-    def run(self, spec, mg_dict: dict):
+    @stage("final_generation")
+    def run(self, spec, mg_dict: dict, samples: int = 1):
+        """
+        :param samples: the number of completions asked for in one request,
+                        a list of results is returned if it is more than 1, see `sampling`
+        """
         # Clear all cache information
         try:
             self.cons = ""
             self.types = set()
+            self.calls = 0
             self.understand_param(mg_dict["code"], spec, mg_dict)
 
             class_name = mg_dict["className"]
@@ -605,39 +688,47 @@ class InputUnderstandingChain:
 
             # Generate test cases
             if mg_dict["static"]:
-                messages = self.generator_prompt.format_messages(code=mg_dict["code"], constructors=self.cons,
-                                                                 spec=spec)
+                prompt_name = "input_understanding.generator_prompt"
+                values = dict(code=mg_dict["code"], constructors=self.cons, spec=spec)
+                messages = self.generator_prompt.format_messages(**values)
             else:
-                messages = self.generator_non_static_prompt.format_messages(code=mg_dict["code"],
-                                                                            constructors=self.cons,
-                                                                            cons=constructor_str, spec=spec)
+                prompt_name = "input_understanding.generator_non_static_prompt"
+                values = dict(code=mg_dict["code"], constructors=self.cons, cons=constructor_str, spec=spec)
+                messages = self.generator_non_static_prompt.format_messages(**values)
             for message in messages:
                 print(f"\33[32m{message.content}\033[0m\n")
-            llm_result: LLMResult = self.llm.generate([messages])
-            return {
-                "java": self.parse_java(llm_result),
-                "cons": self.parse_cons(llm_result),
-                "import": self.parse_import(llm_result)
-            }
+            llm_result: LLMResult = self.llm.generate([messages], **sample_kwargs(samples))
+            results = [{
+                "java": self.parse_java(sample),
+                "cons": self.parse_cons(sample),
+                "import": self.parse_import(sample)
+            } for sample in split_samples(llm_result)]
+            # an answer without test inputs is asked for again next time
+            if all(result["java"] for result in results):
+                keep(self.llm, llm_result)
+            if self.examples is not None:
+                self.examples.remember(prompt_name, values, llm_result, results)
+            return results if samples > 1 else results[0]
         except:
-            return {
+            failed = {
                 "java": "",
                 "cons": "",
                 "import": ""
             }
+            return [failed] * samples if samples > 1 else failed
 
 
 if __name__ == "__main__":
     from config import *
+    from model.client_pool import ClientPool
 
-    llm = ChatOpenAI(model='gpt-3.5-turbo', temperature=0.0)
+    llm = ClientPool(LLM_ENDPOINTS, model='gpt-3.5-turbo', temperature=0.0)
     chain = InputUnderstandingChain(llm)
     code = """boolean areInOrder(Node a, Node b){
     return areInOrder(a, b, false);
 }"""
-    file = open("../../../graph.json", "r")
-    file_content = file.read()
-    file.close()
-    mg1 = json.loads(file_content.replace("\n", ""))
+    from util.graph_loader import load_graph
+
+    mg1 = load_graph("../../../graph.json")
     param_dict = util.mg_util.parameters(mg1, layer=3)
     print(param_dict)
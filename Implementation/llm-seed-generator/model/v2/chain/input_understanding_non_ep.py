@@ -1,15 +1,19 @@
 import json
 import re
 import logging
+from typing import TYPE_CHECKING
 
-from langchain.chat_models import ChatOpenAI
-from langchain.prompts import (
-    FewShotChatMessagePromptTemplate,
-    ChatPromptTemplate,
-)
-from langchain.chains import LLMChain
 from langchain.schema import LLMResult
 import util.mg_util
+from model.accounting import stage
+from model.llm_cache import keep
+from prompt.example_library import ExampleLibrary
+from prompt.layout import chain_prompt
+from .sampling import sample_kwargs, split_samples
+
+if TYPE_CHECKING:
+    # imported by the first request, see model/client_pool.py
+    from langchain.chat_models import ChatOpenAI
 
 SYSTEM_MESSAGE_1 = """
 You are an experienced tester. Now you are expected to understand the inputs of the provided API method.
@@ -393,7 +397,8 @@ Example 3:
 ]
 
 class InputUnderstandingNonEPChain:
-    def __init__(self, llm: ChatOpenAI) -> None:
+    def __init__(self, llm: "ChatOpenAI", param_cache: util.mg_util.ParameterCache = None,
+                 examples: ExampleLibrary = None) -> None:
         """
         Used to initialise LLMChain
         There are three chains:
@@ -401,48 +406,21 @@ class InputUnderstandingNonEPChain:
             2. further_shot_prompt: a hierarchical understanding of their subclasses for more complex parameters
             3. generator_shot_prompt： integrate the output of the previous times to generate test cases
         1. and 2. can specify a constructor which can be used to initialise parameter
+        :param param_cache: parameter information shared with the other chains of a generator
+        :param examples: the few-shot examples are selected from it, see prompt/example_library.py
         """
         self.llm = llm
-        preliminary_shot_prompt = FewShotChatMessagePromptTemplate(
-            example_prompt=ChatPromptTemplate.from_messages(EXAMPLE_MESSAGE_1),
-            examples=EXAMPLES_1,
-        )
-        self.preliminary_prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", SYSTEM_MESSAGE_1),
-                preliminary_shot_prompt,
-            ] + QUESTION_MESSAGE_1
-        )
-        further_shot_prompt = FewShotChatMessagePromptTemplate(
-            example_prompt=ChatPromptTemplate.from_messages(EXAMPLE_MESSAGE_2),
-            examples=EXAMPLES_2,
-        )
-        self.further_prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", SYSTEM_MESSAGE_2),
-                further_shot_prompt,
-            ] + QUESTION_MESSAGE_2
-        )
-        generator_shot_prompt = FewShotChatMessagePromptTemplate(
-            example_prompt=ChatPromptTemplate.from_messages(EXAMPLE_MESSAGE_3),
-            examples=EXAMPLES_3,
-        )
-        self.generator_prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", SYSTEM_MESSAGE_3),
-                generator_shot_prompt,
-            ] + QUESTION_MESSAGE_3
-        )
-        generator_non_static_shot_prompt = FewShotChatMessagePromptTemplate(
-            example_prompt=ChatPromptTemplate.from_messages(EXAMPLE_MESSAGE_3_NON_STATIC),
-            examples=EXAMPLES_3_NON_STATIC,
-        )
-        self.generator_non_static_prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", SYSTEM_MESSAGE_3_NON_STATIC),
-                generator_non_static_shot_prompt,
-            ] + QUESTION_MESSAGE_3_NON_STATIC
-        )
+        self.examples = examples
+        self.param_cache = param_cache
+        self.preliminary_prompt = chain_prompt(SYSTEM_MESSAGE_1, EXAMPLE_MESSAGE_1, EXAMPLES_1, QUESTION_MESSAGE_1,
+                                               examples, "input_understanding_non_ep.preliminary_prompt")
+        self.further_prompt = chain_prompt(SYSTEM_MESSAGE_2, EXAMPLE_MESSAGE_2, EXAMPLES_2, QUESTION_MESSAGE_2,
+                                           examples, "input_understanding_non_ep.further_prompt")
+        self.generator_prompt = chain_prompt(SYSTEM_MESSAGE_3, EXAMPLE_MESSAGE_3, EXAMPLES_3, QUESTION_MESSAGE_3,
+                                             examples, "input_understanding_non_ep.generator_prompt")
+        self.generator_non_static_prompt = chain_prompt(SYSTEM_MESSAGE_3_NON_STATIC, EXAMPLE_MESSAGE_3_NON_STATIC,
+                                                        EXAMPLES_3_NON_STATIC, QUESTION_MESSAGE_3_NON_STATIC, examples,
+                                                        "input_understanding_non_ep.generator_non_static_prompt")
         # `types` is a set which record the type LLM has understood
         self.types = set()
         # `cons` is a string which includes the entire constructor generator_shot_prompt need to use
@@ -504,6 +482,7 @@ class InputUnderstandingNonEPChain:
                     result += f"        - {signature}: {params}\n"
         return result
 
+    @stage("further_understanding")
     def understand_further(self, constructor, param_dict: dict):
         """
         Used to parse the parameters of a constructor
@@ -520,7 +499,8 @@ class InputUnderstandingNonEPChain:
         for n in c_param.keys():
             if c_param[n] in self.types:
                 continue
-            if param_dict.get(c_param[n]).get("__is_jdk_type__"):
+            # a jdk type, or one beyond the layers searched, which has nothing to be understood
+            if not param_dict.get(c_param[n]) or param_dict.get(c_param[n]).get("__is_jdk_type__"):
                 continue
             messages = self.further_prompt.format_messages(constructor=constructor, param=n, deps=result)
             for message in messages:
@@ -528,6 +508,7 @@ class InputUnderstandingNonEPChain:
             llm_result: LLMResult = self.llm.generate([messages])
             self.types.add(c_param[n])
             cons_result = self.parse_constructor(llm_result).pop().replace("'", "\"")
+            keep(self.llm, llm_result)
 
             # Putting the result of parsing into self.cons for subsequent use
             if param_dict.get(c_param[n]).get("classType") == 'abstract class' or \
@@ -544,6 +525,7 @@ class InputUnderstandingNonEPChain:
             # The parameters of the generated constructor need to be parsed again.
             self.understand_further(cons_result, param_dict)
 
+    @stage("preliminary_understanding")
     def understand_param(self, code, mg_dict: dict):
         """
         Used to understand the parameters of the method to be tested
@@ -552,14 +534,15 @@ class InputUnderstandingNonEPChain:
         :return:
         """
         # Simplify all the type information and extract what is needed
-        param_dict = util.mg_util.parameters(mg_dict, layer=1)
+        param_dict = util.mg_util.parameters(mg_dict, layer=1, cache=self.param_cache)
 
         if mg_dict.get("parameters"):
             p_type = mg_dict.get("parameters")
             for p in p_type.keys():
                 if p_type.get(p) in self.types:
                     continue
-                if param_dict.get(p_type.get(p)).get("__is_jdk_type__"):
+                # a jdk type, or one beyond the layers searched, which has nothing to be understood
+                if not param_dict.get(p_type.get(p)) or param_dict.get(p_type.get(p)).get("__is_jdk_type__"):
                     continue
                 self.types.add(p_type.get(p))
                 messages = self.preliminary_prompt.format_messages(code=code,
@@ -569,6 +552,7 @@ class InputUnderstandingNonEPChain:
                     print(f"\33[32m{message.content}\033[0m\n")
                 llm_result: LLMResult = self.llm.generate([messages])
                 constructor = self.parse_constructor(llm_result).pop().replace("'", "\"")
+                keep(self.llm, llm_result)
 
                 # Putting the result of parsing into self.cons for subsequent use
                 if param_dict.get(p_type.get(p)).get("classType") == 'abstract class' or \
@@ -585,7 +569,12 @@ class InputUnderstandingNonEPChain:
                 # The parameters of the generated constructor need to be parsed again.
                 self.understand_further(constructor, param_dict)
 
-    def run(self, mg_dict: dict):
+    @stage("final_generation")
+    def run(self, mg_dict: dict, samples: int = 1):
+        """
+        :param samples: the number of completions asked for in one request,
+                        a list of results is returned if it is more than 1, see `sampling`
+        """
         # Clear all cache information
         self.cons = ""
         self.types = set()
@@ -606,22 +595,32 @@ class InputUnderstandingNonEPChain:
 
         # Generate test cases
         if mg_dict["static"]:
-            messages = self.generator_prompt.format_messages(code=mg_dict["code"], constructors=self.cons)
+            prompt_name = "input_understanding_non_ep.generator_prompt"
+            values = dict(code=mg_dict["code"], constructors=self.cons)
+            messages = self.generator_prompt.format_messages(**values)
         else:
-            messages = self.generator_non_static_prompt.format_messages(code=mg_dict["code"], constructors=self.cons,
-                                                                        cons=constructor_str)
+            prompt_name = "input_understanding_non_ep.generator_non_static_prompt"
+            values = dict(code=mg_dict["code"], constructors=self.cons, cons=constructor_str)
+            messages = self.generator_non_static_prompt.format_messages(**values)
         for message in messages:
             print(f"\33[32m{message.content}\033[0m\n")
-        llm_result: LLMResult = self.llm.generate([messages])
-        return {
-            "java": self.parse_java(llm_result),
-            "cons": self.parse_cons(llm_result),
-            "import": self.parse_import(llm_result)
-        }
+        llm_result: LLMResult = self.llm.generate([messages], **sample_kwargs(samples))
+        results = [{
+            "java": self.parse_java(sample),
+            "cons": self.parse_cons(sample),
+            "import": self.parse_import(sample)
+        } for sample in split_samples(llm_result)]
+        # an answer without test inputs is asked for again next time
+        if all(result["java"] for result in results):
+            keep(self.llm, llm_result)
+        if self.examples is not None:
+            self.examples.remember(prompt_name, values, llm_result, results)
+        return results if samples > 1 else results[0]
 
 
 if __name__ == "__main__":
     from config import *
+    from model.client_pool import ClientPool
 
-    llm = ChatOpenAI(model='gpt-3.5-turbo', temperature=0.0)
+    llm = ClientPool(LLM_ENDPOINTS, model='gpt-3.5-turbo', temperature=0.0)
     chain = InputUnderstandingNonEPChain(llm)
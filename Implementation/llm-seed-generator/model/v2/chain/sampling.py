@@ -0,0 +1,27 @@
+"""
+Used to ask for several completions of one prompt in a single request (the `n` of the chat completions API),
+instead of sending the same prompt once per repetition.
+"""
+from typing import List
+
+from langchain.schema import LLMResult
+
+from config import LLM_SAMPLE_TEMPERATURE
+
+
+def sample_kwargs(samples: int) -> dict:
+    """
+    :return: the extra arguments of `llm.generate`, none for a single sample so its cache key does not change
+    """
+    if samples <= 1:
+        return {}
+    # identical completions are useless, the samples need some randomness
+    return {"n": samples, "temperature": LLM_SAMPLE_TEMPERATURE}
+
+
+def split_samples(llm_result: LLMResult) -> List[LLMResult]:
+    """
+    Used to turn the completions of one prompt into results of one completion each,
+    which the `parse_*` methods of the chains read
+    """
+    return [LLMResult(generations=[[generation]]) for generation in llm_result.generations[0]]
@@ -1,35 +1,249 @@
+import contextvars
+import importlib
 import json
 import logging
-from langchain.chat_models import ChatOpenAI
-from langchain.chains import SequentialChain
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from .chain.equivalence_partitioning import EquivalencePartitioningChain
-from .chain.input_understanding import InputUnderstandingChain
-from .chain.input_understanding_non_ep import InputUnderstandingNonEPChain
-from .chain.input_generation import InputGenerationChain
-from .chain.input_generation_non_ep import InputGenerationNonEPChain
-from .chain.input_non_understanding import InputNonUnderstandingChain
-from .chain.basic_generation_non_ep import BasicGenerationNonEP
+from model.accounting import REQUEST, MeteredLLM, method, summarize, write_usage, add_to_campaign
+from model.client_pool import BoundedLLM, ClientPool
+from model.llm_cache import CachedLLM, sample
+from .chain.constructor_memo import ConstructorMemo
+from prompt.compaction import PromptCompactor
+from prompt.example_library import ExampleLibrary
+from util.cache_util import SqliteLRUStore
+from util.mg_util import ParameterCache, signature
+from util.trace import instrument_chain, span
 
 from config import *
 
+# chain attribute -> (module under model.v2.chain, class name, shared objects passed to the chain)
+# the modules, and the langchain prompt machinery they pull in, are only imported when a chain is used
+CHAINS = {
+    "equivalence_partitioning_chain": ("equivalence_partitioning", "EquivalencePartitioningChain", ["examples"]),
+    "input_understanding_chain": ("input_understanding", "InputUnderstandingChain",
+                                  ["memo", "max_concurrency", "call_budget", "param_cache", "examples"]),
+    "input_generation_chain": ("input_generation", "InputGenerationChain", ["examples"]),
+    "input_generation_chain_non_ep": ("input_generation_non_ep", "InputGenerationNonEPChain", ["examples"]),
+    "input_understanding_chain_non_ep": ("input_understanding_non_ep", "InputUnderstandingNonEPChain",
+                                         ["param_cache", "examples"]),
+    "input_non_understanding_chain": ("input_non_understanding", "InputNonUnderstandingChain",
+                                      ["param_cache", "examples"]),
+    "basic_generation_chain": ("basic_generation_non_ep", "BasicGenerationNonEP", ["examples"]),
+}
+
+# the chains each generation mode (the `skip` argument of main.py) can use
+MODE_CHAINS = {
+    None: ["equivalence_partitioning_chain", "input_generation_chain", "input_understanding_chain"],
+    "skipEP": ["input_generation_chain_non_ep", "input_understanding_chain_non_ep"],
+    "skipUnder": ["equivalence_partitioning_chain", "input_generation_chain", "input_non_understanding_chain"],
+    "basic": ["basic_generation_chain"],
+}
+
+
+def repetition(index: int, task, samples: int = 1):
+    """
+    Used to run the `index`-th repetition of a task of `LLMGenerator.run_repeated`
+    """
+    with sample(index):
+        return task(samples)
+
 
 class LLMGenerator:
-    def __init__(self, gpt_version="gpt-3.5-turbo", temperature=0.0) -> None:
-        llm = ChatOpenAI(model=gpt_version, temperature=temperature)
-        self.equivalence_partitioning_chain = EquivalencePartitioningChain(llm)
-        self.input_understanding_chain = InputUnderstandingChain(llm)
-        self.input_generation_chain = InputGenerationChain(llm)
-        self.input_generation_chain_non_ep = InputGenerationNonEPChain(llm)
-        self.input_understanding_chain_non_ep = InputUnderstandingNonEPChain(llm)
-        self.input_non_understanding_chain = InputNonUnderstandingChain(llm)
-        self.basic_generation_chain = BasicGenerationNonEP(llm)
-
-    def generate(self, mg_dict, generate_times: int = 1):
+    def __init__(self, gpt_version="gpt-3.5-turbo", temperature=0.0,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY, cache_bypass: bool = LLM_CACHE_BYPASS,
+                 client=None, record_path: str = None, multi_sample: bool = LLM_MULTI_SAMPLE,
+                 batch_partitions: int = LLM_BATCH_PARTITIONS) -> None:
+        """
+        :param max_concurrency: maximum number of equivalence classes whose chains
+                                are run at the same time, 1 means strictly serial,
+                                and maximum number of requests in flight to the model
+        :param cache_bypass: send every request to the model without using the response cache
+        :param client: the model behind the cache, a `ClientPool` of the configured endpoints by default,
+                       e.g. a `model.replay_llm.ReplayLLM`
+        :param record_path: append every response of the client to this file, see `model.replay_llm.RecordingLLM`
+        :param multi_sample: ask for all repetitions of a generation in one request, see `run_repeated`
+        :param batch_partitions: maximum number of equivalence classes of an all-primitive method
+                                 asked for in one request, see `run_batched`
+        Chains are built on first use, see `CHAINS`.
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.multi_sample = multi_sample
+        self.batch_partitions = max(1, batch_partitions)
+        # maximum number of LLM calls the understanding chain may spend on one method and equivalence class
+        self.call_budget = LLM_UNDERSTANDING_CALL_BUDGET
+        # requests of all chains are spread over the configured endpoints
+        self.pool = client if client is not None else \
+            ClientPool(LLM_ENDPOINTS, model=gpt_version, temperature=temperature, max_retries=LLM_MAX_RETRIES)
+        # at most `max_concurrency` requests in flight, however many threads the chains fan out to
+        self.bounded = BoundedLLM(self.pool, self.max_concurrency)
+        model = self.bounded
+        if record_path is not None:
+            from model.replay_llm import RecordingLLM
+            model = RecordingLLM(self.bounded, record_path)
+        # every chain talks to the model through the same response cache
+        self.cache = CachedLLM(model,
+                               SqliteLRUStore(LLM_CACHE_PATH, max_bytes=LLM_CACHE_MAX_BYTES),
+                               bypass=cache_bypass, seed=LLM_CACHE_SAMPLE_SEED)
+        # tokens, latency and cost of every call, see model/accounting.py
+        self.llm = MeteredLLM(self.cache, LLM_PRICES)
+        # constructors picked by the understanding chain, shared across methods
+        self.memo = ConstructorMemo(
+            SqliteLRUStore(LLM_CACHE_PATH, max_bytes=LLM_CACHE_MAX_BYTES, table="constructors"),
+            enabled=LLM_CONSTRUCTOR_MEMO)
+        # shorter method code and parameter information in the prompts
+        self.compactor = PromptCompactor(PROMPT_COMPACT, max_lines=PROMPT_MAX_CODE_LINES)
+        # parameter information of the method graphs being generated for, shared by the chains
+        self.param_cache = ParameterCache(compactor=self.compactor)
+        # few-shot examples picked per prompt by similarity, see prompt/example_library.py
+        self.examples = ExampleLibrary(EXAMPLES_PATH, shots=EXAMPLES_SHOTS, token_budget=EXAMPLES_TOKEN_BUDGET,
+                                       harvest=EXAMPLES_HARVEST, max_harvested=EXAMPLES_MAX_HARVESTED,
+                                       static_shots=EXAMPLES_STATIC_SHOTS)
+        self.chains = {}
+        self.chains_lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name not in CHAINS:
+            raise AttributeError(name)
+        return self.chain(name)
+
+    def chain(self, name: str):
+        """
+        Used to get a chain by its attribute name, building it on first use
+        """
+        chain = self.chains.get(name)
+        if chain is not None:
+            return chain
+        with self.chains_lock:
+            if name not in self.chains:
+                (module_name, class_name, shared) = CHAINS[name]
+                module = importlib.import_module(f"{__package__}.chain.{module_name}")
+                kwargs = {key: getattr(self, key) for key in shared}
+                self.chains[name] = instrument_chain(getattr(module, class_name)(self.llm, **kwargs), name)
+            return self.chains[name]
+
+    def prepare(self, skip=None) -> None:
+        """
+        Used to build the chains of a generation mode ahead of the first method
+        """
+        for name in MODE_CHAINS.get(skip, MODE_CHAINS[None]):
+            self.chain(name)
+
+    def run_tasks(self, tasks, on_result=None) -> dict:
+        """
+        Used to run the generation of several equivalence classes
+        :param tasks: a list of (key, callable) pairs
+        :param on_result: called with (key, result) as soon as a task is finished
+        :return a dict:
+            key: the key of the task
+            value: the result of its callable, in the same order as `tasks`
+        """
+        if self.max_concurrency == 1 or len(tasks) <= 1:
+            results = {}
+            for (key, task) in tasks:
+                results[key] = task()
+                if on_result is not None:
+                    on_result(key, results[key])
+            return results
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(tasks))) as executor:
+            # the tasks keep the method and stage of the caller, see model/accounting.py
+            futures = [(key, executor.submit(contextvars.copy_context().run, task)) for (key, task) in tasks]
+            if on_result is not None:
+                keys = {future: key for (key, future) in futures}
+                for future in as_completed(keys):
+                    on_result(keys[future], future.result())
+            return {key: future.result() for (key, future) in futures}
+
+    def run_repeated(self, tasks, generate_times: int, on_result=None, key=lambda base, i: base + str(i)) -> dict:
+        """
+        Used to run every task `generate_times` times.
+        With `multi_sample`, a task is run once and asks for `generate_times` completions of its prompt,
+        which are fanned out into the keys of the repetitions.
+        :param tasks: a list of (base, callable) pairs, the callable takes the number of samples
+                      and returns a list of results if it is more than 1, see `chain.sampling`
+        :param key: the key of the i-th repetition of a task
+        :return: see `run_tasks`
+        """
+        if not self.multi_sample or generate_times <= 1:
+            # the repetitions are cached apart, see `model.llm_cache.SAMPLE`
+            return self.run_tasks([(key(base, i), lambda task=task, i=i: repetition(i, task))
+                                   for i in range(generate_times) for (base, task) in tasks], on_result)
+
+        def fan_out(base, results):
+            if on_result is not None:
+                for (i, result) in enumerate(results):
+                    on_result(key(base, i), result)
+
+        samples = self.run_tasks([(base, lambda task=task: task(generate_times)) for (base, task) in tasks], fan_out)
+        return {key(base, i): result for (base, results) in samples.items() for (i, result) in enumerate(results)}
+
+    def run_batched(self, mg_dict, eq_classes, generate_times: int, on_result=None) -> dict:
+        """
+        Used to generate the test cases of the equivalence classes of an all-primitive method,
+        `batch_partitions` classes per request of the input generation chain, see `InputGenerationChain.run_batch`
+        :return: see `run_repeated`, with the same keys
+        """
+        size = self.batch_partitions
+        batches = [eq_classes[i:i + size] for i in range(0, len(eq_classes), size)]
+        # one request per batch, and per repetition unless the repetitions are sampled together
+        (rounds, samples) = (1, generate_times) if self.multi_sample else (generate_times, 1)
+
+        def fan_out(task_key, results):
+            (round_index, batch_index) = task_key
+            for (cls, result) in zip(batches[batch_index], results):
+                for (i, cases) in enumerate(result if samples > 1 else [result]):
+                    yield (cls + str(round_index + i), cases)
+
+        def report(task_key, results):
+            for (key, cases) in fan_out(task_key, results):
+                on_result(key, cases)
+
+        tasks = [((r, j), lambda r=r, batch=batch:
+                   repetition(r, lambda n: self.input_generation_chain.run_batch(mg_dict, batch, samples=n), samples))
+                 for r in range(rounds) for (j, batch) in enumerate(batches)]
+        results = self.run_tasks(tasks, report if on_result is not None else None)
+        return dict(pair for (task_key, batch_results) in results.items() for pair in fan_out(task_key, batch_results))
+
+    def generate_by_mode(self, mg_dict, skip=None, on_result=None, generate_times: int = 1):
+        """
+        Used to generate test cases with the pipeline selected on the command line
+        :param skip: "skipEP", "skipUnder", "basic" or anything else for the full pipeline
+        :param on_result: called with (key, test cases) as soon as the cases of a key are generated
+        :param generate_times: the times for generation
+        The LLM calls are accounted to the signature of the method, see `self.llm.take`.
+        The chains see the method graph with its code compacted, see `self.compactor`.
+        """
+        with method(signature(mg_dict)), span("generate", method=signature(mg_dict), mode=skip or "full"):
+            mg_dict = self.compactor.graph(mg_dict)
+            if skip == "skipEP":
+                return self.generate_non_ep(mg_dict, generate_times, on_result=on_result)
+            elif skip == "skipUnder":
+                return self.generate_non_understanding(mg_dict, generate_times, on_result=on_result)
+            elif skip == "basic":
+                return self.generate_basic(mg_dict, generate_times, on_result=on_result)
+            else:
+                return self.generate(mg_dict, generate_times, on_result=on_result)
+
+    def account(self, mg_dict, output_path: str = None) -> dict:
+        """
+        Used to write the token usage of a method to `<output_path>.usage.json`
+        and add it to the campaign totals, see model/accounting.py
+        :return: the usage of the method
+        """
+        sig = signature(mg_dict)
+        # a concurrent request for the same method has its own records
+        records = self.llm.take(sig, REQUEST.get())
+        usage = write_usage(output_path + ".usage.json", sig, records) if output_path \
+            else {"method": sig, **summarize(records)}
+        add_to_campaign(ACCOUNTING_CAMPAIGN_PATH, usage)
+        return {key: usage[key] for key in ("total", "stages")}
+
+    def generate(self, mg_dict, generate_times: int = 1, on_result=None):
         """
         Used to generate test cases via method graph
         :param generate_times: the times for generation
         :param mg_dict:  dict of the method graph
+        :param on_result: see `generate_by_mode`
         :return a dict:
             key: equivalence partitioning results
             value: test cases of this partitioning
@@ -51,20 +265,25 @@ class LLMGenerator:
                     if len(mg_dict["nodes"][mg_dict["nodes"][mg_dict["parameters"][p_name]].get("innerClassName")]) != 0:
                         all_primitive = False
                         break
-        test_inputs = {}
-        for i in range(generate_times):
-            for cls in eq_classes:
-                print(f"    > For: {cls}")
-                # Code understanding and generation for different equivalence classes
-                if all_primitive:
-                    test_inputs[cls + str(i)] = self.input_generation_chain.run(mg_dict, cls)
-                else:
-                    test_inputs[cls + str(i)] = self.input_understanding_chain.run(cls, mg_dict)
+        if all_primitive and self.batch_partitions > 1:
+            test_inputs = self.run_batched(mg_dict, eq_classes, generate_times, on_result)
+            print(f"> Finish: Input Generation")
+            print(f"> Results: {test_inputs}")
+            return test_inputs
+        tasks = []
+        for cls in eq_classes:
+            print(f"    > For: {cls}")
+            # Code understanding and generation for different equivalence classes
+            if all_primitive:
+                tasks.append((cls, lambda n, cls=cls: self.input_generation_chain.run(mg_dict, cls, samples=n)))
+            else:
+                tasks.append((cls, lambda n, cls=cls: self.input_understanding_chain.run(cls, mg_dict, samples=n)))
+        test_inputs = self.run_repeated(tasks, generate_times, on_result)
         print(f"> Finish: Input Generation")
         print(f"> Results: {test_inputs}")
         return test_inputs
 
-    def generate_non_ep(self, mg_dict, generate_times: int = 1):
+    def generate_non_ep(self, mg_dict, generate_times: int = 1, on_result=None):
         print(f"> Enter: Input Generation")
         all_primitive = True
         for p_name in mg_dict["parameters"]:
@@ -77,17 +296,16 @@ class LLMGenerator:
                                mg_dict["nodes"][mg_dict["parameters"][p_name]].get("innerClassName")]) != 0:
                         all_primitive = False
                         break
-        test_inputs = {}
-        for i in range(generate_times):
-            if all_primitive:
-                test_inputs["result" + str(i)] = self.input_generation_chain_non_ep.run(mg_dict)
-            else:
-                test_inputs["result" + str(i)] = self.input_understanding_chain_non_ep.run(mg_dict)
-            print(f"> Finish: Input Generation")
+        if all_primitive:
+            task = lambda n: self.input_generation_chain_non_ep.run(mg_dict, samples=n)
+        else:
+            task = lambda n: self.input_understanding_chain_non_ep.run(mg_dict, samples=n)
+        test_inputs = self.run_repeated([("result", task)], generate_times, on_result)
+        print(f"> Finish: Input Generation")
         print(f"> Results: {test_inputs}")
         return test_inputs
 
-    def generate_non_understanding(self, mg_dict, generate_times: int = 1):
+    def generate_non_understanding(self, mg_dict, generate_times: int = 1, on_result=None):
         print(f"> Enter: Equivalence Partitioning")
         eq_classes = self.equivalence_partitioning_chain.run(mg_dict["code"])
         print(f"> Finish: Equivalence Partitioning")
@@ -105,32 +323,36 @@ class LLMGenerator:
                                mg_dict["nodes"][mg_dict["parameters"][p_name]].get("innerClassName")]) != 0:
                         all_primitive = False
                         break
-        test_inputs = {}
-        for i in range(generate_times):
-            for cls in eq_classes:
-                print(f"    > For: {cls}")
-                if all_primitive:
-                    test_inputs[cls + str(i)] = self.input_generation_chain.run(mg_dict, cls)
-                else:
-                    test_inputs[cls + str(i)] = self.input_non_understanding_chain.run(cls, mg_dict)
+        if all_primitive and self.batch_partitions > 1:
+            test_inputs = self.run_batched(mg_dict, eq_classes, generate_times, on_result)
+            print(f"> Finish: Input Generation")
+            print(f"> Results: {test_inputs}")
+            return test_inputs
+        tasks = []
+        for cls in eq_classes:
+            print(f"    > For: {cls}")
+            if all_primitive:
+                tasks.append((cls, lambda n, cls=cls: self.input_generation_chain.run(mg_dict, cls, samples=n)))
+            else:
+                tasks.append((cls, lambda n, cls=cls: self.input_non_understanding_chain.run(cls, mg_dict,
+                                                                                           samples=n)))
+        test_inputs = self.run_repeated(tasks, generate_times, on_result)
         print(f"> Finish: Input Generation")
         print(f"> Results: {test_inputs}")
         return test_inputs
 
-    def generate_basic(self, mg_dict, generate_times: int = 1):
-        test_inputs = {}
-        for i in range(generate_times):
-            test_inputs[i] = self.basic_generation_chain.run(mg_dict)
+    def generate_basic(self, mg_dict, generate_times: int = 1, on_result=None):
+        test_inputs = self.run_repeated([(None, lambda n: self.basic_generation_chain.run(mg_dict, samples=n))],
+                                        generate_times, on_result, key=lambda base, i: i)
         print(f"> Finish: Input Generation")
         print(f"> Results: {test_inputs}")
         return test_inputs
 
 
 if __name__ == "__main__":
-    file = open("../../graph.json", "r")
-    file_content = file.read()
-    file.close()
-    mg_dict = json.loads(file_content.replace("\n", ""))
+    from util.graph_loader import load_graph
+
+    mg_dict = load_graph("../../graph.json")
     generator = LLMGenerator()
 
     generator.generate_non_ep(mg_dict)
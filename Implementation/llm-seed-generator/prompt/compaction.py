@@ -0,0 +1,235 @@
+"""
+Used to make the prompts shorter without dropping what the model needs to write the test inputs.
+
+* `compact_code` removes comments, Javadoc, blank lines and trailing whitespace and dedents the method.
+  A body longer than `max_lines` keeps its signature and branch structure
+  (and, while there is room, the statements using the parameters); every run of other lines becomes `...`.
+* `prune_types` cuts the sub class listings of the parameter information down to the classes the method
+  refers to, plus one other, and drops the types no parameter can reach through them, through constructors
+  or through fields, e.g. the other sub classes and what only they refer to.
+
+`PromptCompactor` applies both to the method graphs of a generator and counts the tokens saved.
+`benchmark.compaction_check` checks on a corpus that the compacted prompts still contain what they must.
+"""
+import json
+import re
+import threading
+from typing import Dict, Iterable
+
+from model.accounting import count_tokens
+
+IDENTIFIER = re.compile(r"[A-Za-z_$][A-Za-z0-9_$]*")
+# the lines a truncated body keeps
+BRANCH = re.compile(r"^\s*(?:}\s*)?(?:if|else|for|while|do|switch|case|default|try|catch|finally|return|throw|"
+                    r"break|continue|synchronized)\b|^\s*[{}]+[\s;)]*$")
+ELISION = "..."
+SUB_CLASS_KEYS = ("subClassName", "implementedClassName", "subInterfaceName")
+
+
+def strip_comments(code: str) -> str:
+    """
+    Used to remove `//` and `/* */` comments, string and character literals are kept as they are
+    """
+    result = []
+    i = 0
+    n = len(code)
+    while i < n:
+        if code.startswith('"""', i):
+            end = code.find('"""', i + 3)
+            end = n if end < 0 else end + 3
+            result.append(code[i:end])
+            i = end
+        elif code[i] in "\"'":
+            quote = code[i]
+            j = i + 1
+            while j < n and code[j] != quote and code[j] != "\n":
+                j += 2 if code[j] == "\\" else 1
+            result.append(code[i:j + 1])
+            i = j + 1
+        elif code.startswith("//", i):
+            end = code.find("\n", i)
+            i = n if end < 0 else end
+        elif code.startswith("/*", i):
+            end = code.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            # `a/* */b` must not become `ab`
+            result.append(" ")
+        else:
+            result.append(code[i])
+            i += 1
+    return "".join(result)
+
+
+def strip_whitespace(code: str) -> str:
+    """
+    Used to remove blank lines and trailing whitespace and to dedent the code
+    """
+    lines = [line.rstrip().replace("\t", "    ") for line in code.split("\n")]
+    lines = [line for line in lines if line]
+    # the first line is often the signature without its original indentation
+    body = lines[1:] or lines
+    indent = min((len(line) - len(line.lstrip()) for line in body), default=0)
+    return "\n".join(line.lstrip() if line[:indent].strip() else line[indent:] for line in lines)
+
+
+def truncate(code: str, max_lines: int, names: Iterable[str] = ()) -> str:
+    """
+    Used to cut a long method down to its signature, its branch structure and, while there is room,
+    the lines using `names`
+    :param code: a method without comments and blank lines
+    :param max_lines: the number of lines a method may have without being cut
+    :param names: the parameters of the method
+    """
+    lines = code.split("\n")
+    if len(lines) <= max_lines:
+        return code
+    # the signature ends with the first line opening the body
+    signature = next((i for (i, line) in enumerate(lines) if "{" in line), 0)
+    keep = set(range(signature + 1)) | {len(lines) - 1}
+    for (i, line) in enumerate(lines):
+        if BRANCH.match(line):
+            keep.add(i)
+            # the rest of a condition or statement spanning several lines
+            while not lines[i].rstrip().endswith(("{", "}", ";")) and i + 1 < len(lines):
+                i += 1
+                keep.add(i)
+    names = set(names)
+    for (i, line) in enumerate(lines):
+        if len(keep) >= max_lines:
+            break
+        if i not in keep and names & set(IDENTIFIER.findall(line)):
+            keep.add(i)
+    result = []
+    for (i, line) in enumerate(lines):
+        if i in keep:
+            result.append(line)
+        elif i - 1 in keep:
+            result.append(line[:len(line) - len(line.lstrip())] + ELISION)
+    return "\n".join(result)
+
+
+def compact_code(code: str, max_lines: int = 80, names: Iterable[str] = ()) -> str:
+    """
+    See `truncate` for the parameters
+    """
+    return truncate(strip_whitespace(strip_comments(code)), max_lines, names)
+
+
+def simple_name(type_name: str) -> str:
+    """
+    e.g. java.util.Map<K, V> -> Map, java.util.Map$Entry -> Entry
+    """
+    return re.split(r"[.$]", type_name.split("<")[0])[-1]
+
+
+def prune_types(types: Dict[str, Dict], roots: Iterable[str], code: str,
+                fields: Dict[str, Iterable[str]] = None) -> Dict[str, Dict]:
+    """
+    Used to drop the parts of the parameter information the method does not need, see `mg_util.parameters`
+    :param types: the parameter information, it is not modified
+    :param roots: the parameter types of the method
+    :param code: the method
+    :param fields: the field types of every type, which the parameter information does not list
+    :return: the parameter information with
+        the sub classes of a type cut down to the ones named in `code` and one other, if any is named,
+        only the types reachable from `roots` through the sub classes kept, the constructor parameters
+        and the fields
+    """
+    fields = fields or {}
+    referenced = set(IDENTIFIER.findall(code))
+    pruned = {}
+    for (name, info) in types.items():
+        info = dict(info)
+        for key in SUB_CLASS_KEYS:
+            sub_classes = info.get(key)
+            if not sub_classes:
+                continue
+            named = {k: v for (k, v) in sub_classes.items() if simple_name(v) in referenced}
+            if named:
+                # one more, so that the cases the method does not single out can be covered
+                other = next((k for k in sub_classes if k not in named), None)
+                if other is not None:
+                    named[other] = sub_classes[other]
+                info[key] = {k: v for (k, v) in sub_classes.items() if k in named}
+        pruned[name] = info
+    reachable = set()
+    queue = list(roots)
+    while queue:
+        name = queue.pop()
+        if name in reachable or name not in pruned:
+            continue
+        reachable.add(name)
+        info = pruned[name]
+        for key in SUB_CLASS_KEYS:
+            queue.extend((info.get(key) or {}).values())
+        for params in (info.get("constructors") or {}).values():
+            queue.extend(params.values())
+        # a type with fields only is still needed to build the parameter
+        queue.extend(fields.get(name, ()))
+    return {name: info for (name, info) in pruned.items() if name in reachable}
+
+
+def field_types(mg: dict, types: Dict[str, Dict]) -> Dict[str, Iterable[str]]:
+    """
+    :return: the field types of the types of the parameter information, from the nodes of the method graph
+    """
+    nodes = mg.get("nodes", {})
+    return {name: ((nodes.get(name) or {}).get("fields") or {}).values() for name in types}
+
+
+class PromptCompactor:
+    """
+    Used to compact the method code and the parameter information of the prompts of a generator.
+    Tokens are counted before and after, see `stats`. A disabled compactor changes nothing.
+    """
+
+    def __init__(self, enabled: bool = True, max_lines: int = 80) -> None:
+        self.enabled = enabled
+        self.max_lines = max_lines
+        # part -> [tokens before, tokens after]
+        self.tokens = {"code": [0, 0], "types": [0, 0]}
+        self.lock = threading.Lock()
+
+    def count(self, part: str, before: str, after: str) -> int:
+        (before, after) = (count_tokens(before), count_tokens(after))
+        with self.lock:
+            self.tokens[part][0] += before
+            self.tokens[part][1] += after
+        return before - after
+
+    def graph(self, mg: dict) -> dict:
+        """
+        :return: a copy of the method graph with its code compacted, the nodes are shared
+        """
+        if not self.enabled:
+            return mg
+        code = compact_code(mg["code"], self.max_lines, mg.get("parameters", {}).keys())
+        saved = self.count("code", mg["code"], code)
+        print(f"> Compaction: {saved} tokens less of code in every prompt")
+        return {**mg, "code": code}
+
+    def types(self, mg: dict, types: Dict[str, Dict]) -> Dict[str, Dict]:
+        """
+        See `prune_types`
+        """
+        if not self.enabled:
+            return types
+        pruned = prune_types(types, mg["parameters"].values(), mg["code"], field_types(mg, types))
+        self.count("types", json.dumps(types), json.dumps(pruned))
+        return pruned
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {part: {"before": before, "after": after, "saved": before - after}
+                    for (part, (before, after)) in self.tokens.items()}
+
+
+if __name__ == "__main__":
+    import sys
+    from util.file_util import read_graph
+
+    # python3 -m prompt.compaction [GRAPH_OR_SNAPSHOT [SIGNATURE]]
+    mg1 = read_graph(*(sys.argv[1:3] or ["../graph.json"]))
+    compactor = PromptCompactor(max_lines=40)
+    print(compactor.graph(mg1)["code"])
+    print(compactor.stats())
@@ -0,0 +1,273 @@
+"""
+Used to pick the few-shot examples of a prompt by their similarity to the question, instead of sending all of them.
+
+* An `ExampleLibrary` holds, per prompt, the hard-coded examples of its chain and the examples
+  harvested from successful answers of earlier runs (a JSON Lines file, see `ExampleLibrary.harvest`).
+  A generation chain puts the `Answer` a result was parsed from into it (`ExampleLibrary.remember`),
+  the answer is only harvested once all its cases passed the validators and were written
+  (`util.file_util.CaseWriter`, see `ExampleLibrary.harvest_accepted`).
+* Examples are compared with TF-IDF over the identifiers of their fields, i.e. the method code
+  with its parameter types, the specification, the constructors, ... split at camel case.
+* A prompt gets the `shots` most similar examples whose tokens fit in `token_budget`, the most similar one always.
+
+The chains build their prompts with `prompt.layout.chain_prompt`: the first `static_shots` hard-coded examples
+are the same in every prompt, the others are selected. Without a library the chains keep all their examples.
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, List
+
+from model.accounting import count_tokens
+
+IDENTIFIER = re.compile(r"[A-Za-z_$][A-Za-z0-9_$]*")
+WORD = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+# too common in every example to tell them apart
+STOP_WORDS = {"final", "public", "private", "protected", "static", "return", "new", "if", "else", "for", "while",
+              "int", "void", "this", "null", "true", "false", "is", "the", "a", "an", "and", "of", "to", "be", "in"}
+
+
+def terms(text: str) -> Counter:
+    """
+    Used to turn text into the terms of its identifiers, e.g. `CharSequence str` into
+    charsequence, char, sequence and str
+    """
+    counts = Counter()
+    for identifier in IDENTIFIER.findall(text):
+        words = [word.lower() for word in WORD.findall(identifier)]
+        for term in set(words + [identifier.lower()]):
+            if term not in STOP_WORDS and len(term) > 1:
+                counts[term] += 1
+    return counts
+
+
+class TfIdfIndex:
+    """
+    Used to rank documents by the cosine similarity of their TF-IDF vectors to a query
+    """
+
+    def __init__(self, documents: List[Counter]) -> None:
+        frequency = Counter(term for document in documents for term in document)
+        self.idf = {term: math.log((1 + len(documents)) / (1 + count)) + 1 for (term, count) in frequency.items()}
+        self.vectors = [self.vector(document) for document in documents]
+
+    def vector(self, document: Counter) -> Dict[str, float]:
+        weights = {term: (1 + math.log(count)) * self.idf.get(term, 0.0) for (term, count) in document.items()}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+        return {term: weight / norm for (term, weight) in weights.items() if weight}
+
+    def scores(self, query: Counter) -> List[float]:
+        vector = self.vector(query)
+        return [sum(weight * other.get(term, 0.0) for (term, weight) in vector.items()) for other in self.vectors]
+
+
+# the key of the `Answer` in a parsed result of a generation chain
+ANSWER = "answer"
+
+
+class Answer:
+    """
+    The question and the completion a parsed result of a generation chain came from
+    """
+    __slots__ = ("name", "values", "text")
+
+    def __init__(self, name: str, values: dict, text: str) -> None:
+        self.name = name
+        self.values = values
+        self.text = text
+
+    def __repr__(self) -> str:
+        # results are printed, the question holds the whole method
+        return f"Answer({self.name})"
+
+
+def take_answer(value: dict):
+    """
+    :return: the `Answer` of a parsed result, removed from it, None if it has none
+    """
+    return value.pop(ANSWER, None)
+
+
+class ExampleSet:
+    """
+    The examples of one prompt, `fields` are the ones compared with the question
+    """
+
+    def __init__(self, fields: List[str], examples: List[dict], harvestable: bool) -> None:
+        self.fields = fields
+        self.harvestable = harvestable
+        self.examples = list(examples)
+        self.builtin = len(self.examples)
+        self.keys = {self.key(example) for example in self.examples}
+        self.index = None
+        # tokens of every example, computed with the index
+        self.sizes = []
+
+    def key(self, values: dict) -> str:
+        content = json.dumps([values.get(field, "") for field in self.fields])
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def text(self, values: dict) -> str:
+        return "\n".join(str(values.get(field, "")) for field in self.fields)
+
+    def remove(self, i: int) -> None:
+        self.keys.discard(self.key(self.examples.pop(i)))
+        self.index = None
+
+    def add(self, example: dict) -> bool:
+        key = self.key(example)
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        self.examples.append(example)
+        self.index = None
+        return True
+
+
+class ExampleLibrary:
+    def __init__(self, path: str = None, shots: int = 2, token_budget: int = 2000, harvest: bool = True,
+                 max_harvested: int = 256, static_shots: int = 1) -> None:
+        """
+        :param path: the JSON Lines file of the harvested examples, nothing is kept on disk without it
+        :param shots: maximum number of examples in a prompt
+        :param token_budget: maximum number of tokens of the examples in a prompt
+        :param harvest: keep the successful answers of the chains as examples
+        :param max_harvested: maximum number of harvested examples per prompt
+        :param static_shots: number of hard-coded examples every prompt starts with, before the selected ones,
+            see prompt/layout.py
+        """
+        self.path = path
+        self.shots = shots
+        self.token_budget = token_budget
+        self.harvesting = harvest
+        self.max_harvested = max_harvested
+        self.static_shots = static_shots
+        self.sets: Dict[str, ExampleSet] = {}
+        # examples read from the file before their prompt is registered
+        self.pending: Dict[str, List[dict]] = {}
+        self.harvested = 0
+        self.lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.pending.setdefault(record["prompt"], []).append(record["example"])
+
+    def register(self, name: str, fields: List[str], examples: List[dict], harvestable: bool = True) -> None:
+        """
+        Used to add the hard-coded examples of a prompt, see `prompt.few_shot.few_shot_template`
+        :param name: the prompt, e.g. "input_generation.final_prompt"
+        :param fields: the variables of an example that are also variables of the question
+        :param harvestable: whether an example can be made of the question variables and an answer
+        """
+        with self.lock:
+            if name in self.sets:
+                return
+            example_set = ExampleSet(fields, examples, harvestable)
+            for example in self.pending.pop(name, [])[-self.max_harvested:]:
+                example_set.add(example)
+            self.sets[name] = example_set
+
+    def select(self, name: str, values: dict) -> List[dict]:
+        """
+        :return: the examples of the prompt `name` most similar to the question `values`, the most similar first
+        """
+        with self.lock:
+            example_set = self.sets[name]
+            if example_set.index is None:
+                example_set.index = TfIdfIndex([terms(example_set.text(example)) for example in example_set.examples])
+                example_set.sizes = [count_tokens("\n".join(str(value) for value in example.values()))
+                                     for example in example_set.examples]
+            (examples, index, sizes) = (list(example_set.examples), example_set.index, example_set.sizes)
+        question = example_set.key(values)
+        scores = index.scores(terms(example_set.text(values)))
+        ranked = sorted(range(len(examples)), key=lambda i: -scores[i])
+        selected = []
+        tokens = 0
+        for i in ranked:
+            if len(selected) >= self.shots:
+                break
+            # an earlier answer to the same question
+            if example_set.key(examples[i]) == question:
+                continue
+            if selected and tokens + sizes[i] > self.token_budget:
+                continue
+            selected.append(examples[i])
+            tokens += sizes[i]
+        return selected
+
+    def harvest(self, name: str, values: dict, answer: str) -> None:
+        """
+        Used to keep a successful answer to a question of the prompt `name` as an example
+        :param values: the variables the question was formatted with
+        :param answer: the text of the answer, without the prefix the prompt puts in front of it
+        """
+        if not self.harvesting or name not in self.sets:
+            return
+        with self.lock:
+            example_set = self.sets[name]
+            if not example_set.harvestable:
+                return
+            example = {field: values[field] for field in example_set.fields}
+            example["answer"] = answer.strip()
+            if not example_set.add(example):
+                return
+            if len(example_set.examples) - example_set.builtin > self.max_harvested:
+                # the oldest harvested example makes room, like when the file is read, see `register`
+                example_set.remove(example_set.builtin)
+            self.harvested += 1
+            if self.path is not None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                with open(self.path, "a") as f:
+                    f.write(json.dumps({"prompt": name, "example": example}) + "\n")
+
+    def remember(self, name: str, values: dict, llm_result, results: List[dict]) -> None:
+        """
+        Used to put the `Answer` of every completion of a generation chain into its parsed result
+        :param values: the variables the question was formatted with
+        :param llm_result: the completions of the question
+        :param results: the parsed completions, dicts with the list "java"
+        """
+        if not self.harvesting or name not in self.sets or not self.sets[name].harvestable:
+            return
+        for (generation, result) in zip(llm_result.generations[0], results):
+            result[ANSWER] = Answer(name, values, generation.text)
+
+    def harvest_accepted(self, answer: Answer, value: dict, offered: int) -> None:
+        """
+        Used to keep an answer as an example if the validators accepted all the test inputs parsed from it
+        :param answer: see `take_answer`
+        :param value: the test inputs written, a dict with the list "java"
+        :param offered: the number of test inputs before the validators
+        """
+        if answer is not None and value["java"] and len(value["java"]) == offered:
+            self.harvest(answer.name, answer.values, answer.text)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"prompts": len(self.sets), "examples": sum(len(s.examples) for s in self.sets.values()),
+                    "harvested": self.harvested}
+
+
+if __name__ == "__main__":
+    import sys
+    from model.v2.chain.input_generation import EXAMPLES
+    from util.file_util import read_graph
+
+    # python3 -m prompt.example_library [GRAPH_OR_SNAPSHOT [SIGNATURE]]
+    mg = read_graph(*(sys.argv[1:3] or ["../graph.json"]))
+    library = ExampleLibrary()
+    library.register("input_generation.final_prompt", ["code", "spec"], EXAMPLES)
+    selected = library.select("input_generation.final_prompt", {"code": mg["code"], "spec": ""})
+
+    def tokens(examples: List[dict]) -> int:
+        return sum(count_tokens("\n".join(str(value) for value in example.values())) for example in examples)
+
+    for example in selected:
+        print(example["code"])
+    print(f"{len(selected)} of {len(EXAMPLES)} examples, {tokens(selected)} of {tokens(EXAMPLES)} tokens")
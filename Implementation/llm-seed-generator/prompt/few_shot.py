@@ -0,0 +1,46 @@
+"""
+Used to build the few-shot templates of the chains, with the examples selected from an `ExampleLibrary`
+"""
+from typing import Dict, List
+
+from langchain.prompts import ChatPromptTemplate, FewShotChatMessagePromptTemplate
+from langchain.prompts.example_selector.base import BaseExampleSelector
+
+from prompt.example_library import ExampleLibrary
+
+
+class SimilarExampleSelector(BaseExampleSelector):
+    """
+    Used as the `example_selector` of a langchain few-shot template, see `ExampleLibrary.select`
+    """
+
+    def __init__(self, library: ExampleLibrary, name: str) -> None:
+        self.library = library
+        self.name = name
+
+    def add_example(self, example: Dict[str, str]) -> None:
+        self.library.harvest(self.name, example, example["answer"])
+
+    def select_examples(self, input_variables: Dict[str, str]) -> List[dict]:
+        return self.library.select(self.name, input_variables)
+
+
+def few_shot_template(example_message: list, examples: List[dict], question_message: list,
+                      library: ExampleLibrary = None, name: str = None) -> FewShotChatMessagePromptTemplate:
+    """
+    Used to build the few-shot template of a prompt
+    :param example_message: the messages of an example
+    :param examples: the hard-coded examples
+    :param question_message: the messages of the question, its variables are compared with the examples
+    :param library: if given, the examples are selected from it, otherwise all the hard-coded ones are used
+    :param name: the prompt in the library
+    """
+    example_prompt = ChatPromptTemplate.from_messages(example_message)
+    if library is None or library.shots <= 0:
+        return FewShotChatMessagePromptTemplate(example_prompt=example_prompt, examples=examples)
+    question_variables = ChatPromptTemplate.from_messages(question_message).input_variables
+    fields = [variable for variable in example_prompt.input_variables if variable in question_variables]
+    harvestable = set(example_prompt.input_variables) <= set(fields) | {"answer"}
+    library.register(name, fields, examples, harvestable)
+    return FewShotChatMessagePromptTemplate(example_prompt=example_prompt, input_variables=fields,
+                                            example_selector=SimilarExampleSelector(library, name))
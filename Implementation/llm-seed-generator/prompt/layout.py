@@ -0,0 +1,85 @@
+"""
+Used to assemble the prompts of the chains so that endpoints can reuse their beginning across requests.
+
+Endpoints that cache prompt prefixes only reuse the messages up to the first byte that differs,
+so every prompt is laid out as
+1. the system message and the first `ExampleLibrary.static_shots` hard-coded examples,
+   the static prefix, byte-identical for every method,
+2. the examples selected for the question, see prompt/example_library.py,
+3. the question, the only messages with the method, the specification, the constructors, ...
+
+`chain_prompt` builds such a prompt and refuses a system message with variables,
+`static_prefix` renders its static prefix. `model.accounting.MeteredLLM` measures how many prompt tokens
+repeat a prefix sent before.
+"""
+from typing import List
+
+from langchain.prompts import ChatPromptTemplate, FewShotChatMessagePromptTemplate
+from langchain.schema import BaseMessage
+
+from prompt.example_library import ExampleLibrary
+from prompt.few_shot import few_shot_template
+
+
+def chain_prompt(system_message: str, example_message: list, examples: List[dict], question_message: list,
+                 library: ExampleLibrary = None, name: str = None) -> ChatPromptTemplate:
+    """
+    Used to build the prompt of a chain, see the layout above
+    :param system_message: the instructions, without variables
+    :param example_message: the messages of an example
+    :param examples: the hard-coded examples
+    :param question_message: the messages of the question
+    :param library: if given, the examples after the static ones are selected from it,
+        otherwise all the hard-coded ones are static
+    :param name: the prompt in the library
+    """
+    selecting = library is not None and library.shots > 0
+    static_shots = min(library.static_shots, len(examples)) if selecting else len(examples)
+    messages = [("system", system_message)]
+    if static_shots:
+        messages.append(FewShotChatMessagePromptTemplate(
+            example_prompt=ChatPromptTemplate.from_messages(example_message), examples=examples[:static_shots]))
+    if selecting:
+        messages.append(few_shot_template(example_message, examples[static_shots:], question_message, library, name))
+    prompt = ChatPromptTemplate.from_messages(messages + question_message)
+    if prompt.messages[0].input_variables:
+        raise ValueError(f"The system message of {name} has variables: {prompt.messages[0].input_variables}")
+    return prompt
+
+
+def static_prefix(prompt: ChatPromptTemplate) -> List[BaseMessage]:
+    """
+    :return: the leading messages of the prompt that do not depend on its variables
+    """
+    prefix = []
+    for message in prompt.messages:
+        if isinstance(message, BaseMessage):
+            prefix.append(message)
+        elif getattr(message, "example_selector", None) is None and not message.input_variables:
+            prefix.extend(message.format_messages())
+        else:
+            break
+    return prefix
+
+
+if __name__ == "__main__":
+    import sys
+    from config import EXAMPLES_SHOTS, EXAMPLES_STATIC_SHOTS
+    from model.accounting import count_message_tokens
+    from model.v2.llm_generator import CHAINS
+
+    # python3 -m prompt.layout [CHAIN ...]
+    library = ExampleLibrary(shots=EXAMPLES_SHOTS, static_shots=EXAMPLES_STATIC_SHOTS)
+    for chain_name in sys.argv[1:] or CHAINS:
+        (module_name, class_name, _) = CHAINS[chain_name]
+        module = __import__(f"model.v2.chain.{module_name}", fromlist=[class_name])
+        chain = getattr(module, class_name)(None, examples=library)
+        for (attribute, value) in vars(chain).items():
+            if not isinstance(value, ChatPromptTemplate):
+                continue
+            try:
+                prefix = static_prefix(value)
+            except KeyError as e:
+                print(f"\033[31m{module_name}.{attribute}: an example has no {e}\033[0m")
+                continue
+            print(f"{module_name}.{attribute}: {len(prefix)} static messages, {count_message_tokens(prefix)} tokens")
@@ -0,0 +1,60 @@
+import os
+import tempfile
+import threading
+from collections import namedtuple
+from typing import List
+
+import jpype
+
+from provider.jtype_provider import start_jvm
+
+# kind: ERROR, WARNING, MANDATORY_WARNING, NOTE or OTHER; line: 1-based, -1 if unknown
+Diagnostic = namedtuple("Diagnostic", ["kind", "line", "message"])
+
+
+class CompileService:
+    """
+    Used to compile Java sources with `javax.tools.JavaCompiler` inside the JPype JVM.
+
+    * No javac process is started, the compiler and its file manager are reused.
+    * A compilation reports every diagnostic, not only the first error.
+    * The JVM must be a JDK, a JRE has no system compiler.
+    * Compilations are serialised, the file manager is not thread-safe.
+    """
+
+    def __init__(self, classpath: str = "") -> None:
+        start_jvm()
+        self.classpath = classpath
+        self.compiler = jpype.JClass("javax.tools.ToolProvider").getSystemJavaCompiler()
+        if self.compiler is None:
+            raise RuntimeError("The JVM of JPype has no Java compiler, please use a JDK.")
+        self.ArrayList = jpype.JClass("java.util.ArrayList")
+        self.DiagnosticCollector = jpype.JClass("javax.tools.DiagnosticCollector")
+        self.file_manager = self.compiler.getStandardFileManager(None, None, None)
+        self.output_dir = tempfile.mkdtemp(prefix="llm-driver-classes-")
+        self.lock = threading.Lock()
+
+    def compile(self, source: str, class_name: str) -> List[Diagnostic]:
+        """
+        Used to compile one class
+        :param source: the source of the class
+        :param class_name: its fully qualified name, which decides the file name
+        :return: all diagnostics of javac
+        """
+        with self.lock, tempfile.TemporaryDirectory(prefix="llm-driver-") as directory:
+            path = os.path.join(directory, class_name[class_name.rfind(".") + 1:] + ".java")
+            with open(path, "w") as f:
+                f.write(source)
+            paths = self.ArrayList()
+            paths.add(path)
+            options = self.ArrayList()
+            for option in ["-classpath", self.classpath, "-d", self.output_dir, "-proc:none", "-Xmaxerrs", "10000"]:
+                options.add(option)
+            collector = self.DiagnosticCollector()
+            units = self.file_manager.getJavaFileObjectsFromStrings(paths)
+            self.compiler.getTask(None, self.file_manager, collector, options, None, units).call()
+            return [Diagnostic(str(d.getKind().toString()), int(d.getLineNumber()), str(d.getMessage(None)))
+                    for d in collector.getDiagnostics()]
+
+    def close(self) -> None:
+        self.file_manager.close()
@@ -4,6 +4,17 @@ import jpype
 from config import *
 
 
+def start_jvm() -> None:
+    """
+    Used to start the JVM of llm-jtype-provider, a process can only start one JVM,
+    so it is shared by everything using JPype (e.g. `provider.compile_service`)
+    """
+    if not jpype.isJVMStarted():
+        jpype.startJVM(
+            jpype.getDefaultJVMPath(), "-ea",
+            f"-Djava.class.path={JTYPE_PROVIDER_JAR_PATH}")
+
+
 class JtypeProvider:
     """
     Used to initialize run llm-jtype-provider project.
@@ -12,12 +23,13 @@ class JtypeProvider:
     * LLMFuzz requires an interface to get Dependency-Graph of a Java type.
     """
     def __init__(self):
-        jpype.startJVM(
-            jpype.getDefaultJVMPath(), "-ea",
-            f"-Djava.class.path={JTYPE_PROVIDER_JAR_PATH}")
+        start_jvm()
         self.jp_api = jpype.JClass(JTYPE_PROVIDER_API_NAME)
 
-    def __del__(self):
+    def shutdown(self) -> None:
+        """
+        Used to stop the JVM, it cannot be started again in this process
+        """
         try:
             if jpype.isJVMStarted():
                 jpype.shutdownJVM()
@@ -0,0 +1,198 @@
+"""
+Run `python3 -m provider.jtype_service GAV SIGNATURES [--level N] [--out-dir DIR]` in llm-seed-generator
+to extract the method graphs of many signatures of a library at once.
+
+SIGNATURES is a text file with one method signature per line. Every graph is written to
+`<out-dir>/<n>.json`, and `<out-dir>/manifest.txt` lists them for `main.py --batch`.
+With `--snapshot PATH`, all graphs are written into one snapshot instead, see util/snapshot.py.
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+from config import *
+from util.cache_util import SqliteLRUStore
+from util.snapshot import SnapshotWriter
+
+
+def worker_main(conn, jar_gav: str) -> None:
+    """
+    The loop of a worker process: one JVM, initialised for one jar, answering bulk requests
+    """
+    from provider.jtype_provider import JtypeProvider
+
+    try:
+        provider = JtypeProvider()
+        provider.initialize(jar_gav)
+    except Exception as e:
+        conn.send({"__error__": f"cannot initialize {jar_gav}: {e}"})
+        return
+    conn.send({"status": "ready"})
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        (signatures, level) = request
+        results = {}
+        for signature in signatures:
+            try:
+                method_graph = provider.get_method_graph(signature, level)
+                results[signature] = provider.to_json(method_graph, level)
+            except Exception as e:
+                results[signature] = {"__error__": str(e)}
+        conn.send(results)
+
+
+class JtypeWorker:
+    """
+    A process keeping a warmed JVM for one jar, a process can only start one JVM
+    """
+
+    def __init__(self, jar_gav: str) -> None:
+        context = multiprocessing.get_context("spawn")
+        (self.conn, child_conn) = context.Pipe()
+        self.process = context.Process(target=worker_main, args=(child_conn, jar_gav), daemon=True)
+        self.process.start()
+        self.lock = threading.Lock()
+        ready = self.conn.recv()
+        if "__error__" in ready:
+            self.process.join()
+            raise RuntimeError(ready["__error__"])
+
+    def request(self, signatures: List[str], level: int) -> Dict[str, dict]:
+        with self.lock:
+            self.conn.send((signatures, level))
+            return self.conn.recv()
+
+    def close(self) -> None:
+        with self.lock:
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+        self.process.join(timeout=10)
+
+
+class JtypeProviderService:
+    """
+    Used to get method graphs without booting a JVM and indexing the jar for every signature.
+
+    * Each jar GAV gets its own worker process with a warmed JVM, kept until `max_workers` other jars are used.
+    * Graphs are cached on disk per (GAV, signature, level).
+    * Many signatures of a jar are extracted in one request.
+    """
+
+    def __init__(self, store: SqliteLRUStore = None, max_workers: int = 2) -> None:
+        self.store = store
+        self.max_workers = max_workers
+        self.workers = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(jar_gav: str, signature: str, level: int) -> str:
+        content = json.dumps([jar_gav, signature, level])
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def worker(self, jar_gav: str) -> JtypeWorker:
+        with self.lock:
+            worker = self.workers.get(jar_gav)
+            if worker is None:
+                worker = JtypeWorker(jar_gav)
+                self.workers[jar_gav] = worker
+                if len(self.workers) > self.max_workers:
+                    self.workers.popitem(last=False)[1].close()
+            else:
+                self.workers.move_to_end(jar_gav)
+            return worker
+
+    def method_graphs(self, jar_gav: str, signatures: List[str], level: int = 1) -> Dict[str, dict]:
+        """
+        Used to get the method graphs of many signatures of a jar
+        :return: a dict:
+            key: the signature
+            value: its method graph, or {"__error__": message} if it cannot be extracted
+        """
+        results = {}
+        missing = []
+        for signature in dict.fromkeys(signatures):
+            value = self.store.get(self.key(jar_gav, signature, level)) if self.store is not None else None
+            if value is None:
+                missing.append(signature)
+            else:
+                results[signature] = json.loads(value.decode("utf-8"))
+        with self.lock:
+            self.hits += len(results)
+            self.misses += len(missing)
+        if missing:
+            extracted = self.worker(jar_gav).request(missing, level)
+            for (signature, graph) in extracted.items():
+                # failures are not cached, the jar may be fixed
+                if self.store is not None and "__error__" not in graph:
+                    self.store.put(self.key(jar_gav, signature, level), json.dumps(graph).encode("utf-8"))
+            results.update(extracted)
+        return {signature: results[signature] for signature in signatures}
+
+    def method_graph(self, jar_gav: str, signature: str, level: int = 1) -> dict:
+        graph = self.method_graphs(jar_gav, [signature], level)[signature]
+        if "__error__" in graph:
+            raise RuntimeError(graph["__error__"])
+        return graph
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "workers": list(self.workers)}
+
+    def close(self) -> None:
+        with self.lock:
+            for worker in self.workers.values():
+                worker.close()
+            self.workers.clear()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract the method graphs of many signatures of a jar")
+    parser.add_argument("gav", help="groupId:artifactId:version of the jar")
+    parser.add_argument("signatures", help="a text file with one method signature per line")
+    parser.add_argument("--level", type=int, default=1)
+    parser.add_argument("--out-dir", default="../graphs")
+    parser.add_argument("--snapshot", default=None, help="write one snapshot of all graphs to this path")
+    args = parser.parse_args()
+
+    with open(args.signatures, "r") as f:
+        signature_list = [line.strip() for line in f if line.strip()]
+    service = JtypeProviderService(
+        SqliteLRUStore(LLM_CACHE_PATH, max_bytes=LLM_CACHE_MAX_BYTES, table="method_graphs"))
+    try:
+        graphs = service.method_graphs(args.gav, signature_list, args.level)
+    finally:
+        service.close()
+
+    failed = [signature for signature in signature_list if "__error__" in graphs[signature]]
+    for signature in failed:
+        print(f"\033[31m> {signature}: {graphs[signature]['__error__']}\033[0m")
+    if args.snapshot:
+        writer = SnapshotWriter(args.snapshot)
+        for signature in signature_list:
+            if signature not in failed:
+                writer.add(signature, graphs[signature])
+        writer.close()
+        print(f"> Snapshot {args.snapshot}: {writer.stats()}, cache: {service.stats()}")
+    else:
+        os.makedirs(args.out_dir, exist_ok=True)
+        manifest = []
+        for (i, signature) in enumerate(signature_list):
+            if signature in failed:
+                continue
+            name = f"{i}.json"
+            with open(os.path.join(args.out_dir, name), "w") as f:
+                json.dump(graphs[signature], f)
+            manifest.append(name)
+        with open(os.path.join(args.out_dir, "manifest.txt"), "w") as f:
+            f.write("\n".join(manifest) + "\n")
+        print(f"> {len(manifest)} of {len(signature_list)} method graphs written, cache: {service.stats()}")
@@ -0,0 +1,155 @@
+"""
+Resident mode of llm-seed-generator, started by `python3 main.py --serve [--socket PATH]`.
+
+The server keeps one warmed `LLMGenerator` alive and answers requests,
+one JSON object per line, either on a unix socket or on stdin/stdout:
+
+    request:  {"graph_path": "/abs/graph.json", "skip": "skipEP", "output": "/abs/input_generator", "format": "jsonl",
+               "times": 1}
+              {"graph_path": "/abs/library.snapshot", "signature": "...", "output": "/abs/input_generator"}
+              {"graph": {...method graph...}, "validate": false}
+              {"command": "ping"} / {"command": "shutdown"}
+    response: {"status": "ok", "cases": {...}, "output": "/abs/input_generator", "elapsed": 12.3}
+              {"status": "error", "message": "..."}
+
+`client.py` is a thin client of the unix socket mode.
+"""
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+import traceback
+import uuid
+
+import util.file_util
+import util.mg_util
+from driver.compile_validator import case_validators
+from model import accounting
+from prompt.example_library import take_answer
+
+
+class SeedServer:
+    def __init__(self, generator, compile_service=None) -> None:
+        self.generator = generator
+        self.compile_service = compile_service
+        self.served = 0
+
+    def handle(self, request: dict) -> dict:
+        command = request.get("command")
+        if command == "ping":
+            return {"status": "ok", "served": self.served}
+        if command == "shutdown":
+            return {"status": "ok", "shutdown": True}
+
+        start = time.time()
+        # concurrent requests for the same method are accounted separately, see `LLMGenerator.account`
+        request_id = uuid.uuid4().hex
+        with accounting.request(request_id):
+            try:
+                if request.get("graph") is not None:
+                    mg_dict = request["graph"]
+                else:
+                    mg_dict = util.file_util.read_graph(request.get("graph_path", "graph.json"),
+                                                        request.get("signature"))
+                util.mg_util.check_class_object(mg_dict)
+                validators = case_validators(mg_dict, request.get("validate", True), self.compile_service)
+                if request.get("output"):
+                    with util.file_util.CaseWriter(request["output"], mg_dict["static"],
+                                                   request.get("format", "jsonl"), validators=validators,
+                                                   examples=self.generator.examples) as writer:
+                        output = self.generator.generate_by_mode(mg_dict, request.get("skip"),
+                                                                 on_result=writer.write_partition,
+                                                                 generate_times=request.get("times", 1))
+                else:
+                    output = self.generator.generate_by_mode(mg_dict, request.get("skip"),
+                                                             generate_times=request.get("times", 1))
+                    output = {key: self.screen(key, value, validators) for (key, value) in output.items()}
+                usage = self.generator.account(mg_dict, request.get("output"))
+                self.served += 1
+                return {
+                    "status": "ok",
+                    "cases": output,
+                    "validation": {type(validator).__name__: validator.stats() for validator in validators},
+                    "output": request.get("output"),
+                    "usage": usage,
+                    "elapsed": time.time() - start
+                }
+            except Exception as e:
+                traceback.print_exc(file=sys.stderr)
+                # the calls of a failed request are not accounted
+                self.generator.llm.take(request_id=request_id)
+                return {"status": "error", "message": str(e), "elapsed": time.time() - start}
+
+    def screen(self, key, value: dict, validators) -> dict:
+        """
+        Used to validate the cases of an equivalence class returned instead of written, see `util.file_util.CaseWriter`
+        """
+        answer = take_answer(value)
+        offered = len(value["java"])
+        for validator in validators:
+            value = validator.screen(key, value)
+        if validators:
+            self.generator.examples.harvest_accepted(answer, value, offered)
+        return value
+
+    def handle_line(self, line: str) -> dict:
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            return {"status": "error", "message": f"invalid request: {e}"}
+        return self.handle(request)
+
+
+def serve_stdio(seed_server: SeedServer) -> None:
+    """
+    Used to answer requests from stdin, responses are the only output on stdout
+    """
+    out = sys.stdout
+    # the chains print their prompts, keep them away from the responses
+    sys.stdout = sys.stderr
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        response = seed_server.handle_line(line)
+        out.write(json.dumps(response) + "\n")
+        out.flush()
+        if response.get("shutdown"):
+            break
+
+
+def serve_socket(seed_server: SeedServer, socket_path: str) -> None:
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                line = line.decode("utf-8")
+                if not line.strip():
+                    continue
+                response = seed_server.handle_line(line)
+                self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+                self.wfile.flush()
+                if response.get("shutdown"):
+                    threading.Thread(target=self.server.shutdown).start()
+                    break
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    with socketserver.ThreadingUnixStreamServer(socket_path, Handler) as unix_server:
+        print(f"> Serving on {socket_path}")
+        try:
+            unix_server.serve_forever()
+        finally:
+            os.remove(socket_path)
+
+
+def serve(generator, socket_path: str = None, compile_service=None) -> None:
+    """
+    :param socket_path: unix socket to listen on, requests are read from stdin if it is None
+    :param compile_service: see `batch.run_batch`
+    """
+    seed_server = SeedServer(generator, compile_service)
+    if socket_path is None:
+        serve_stdio(seed_server)
+    else:
+        serve_socket(seed_server, socket_path)
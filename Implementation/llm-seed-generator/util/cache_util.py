@@ -0,0 +1,99 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# an eviction makes room down to this fraction of `max_bytes`, so that it is not needed again on the next put
+EVICT_TO = 0.9
+
+
+class SqliteLRUStore:
+    """
+    A small key-value store persisted in a local SQLite file.
+
+    * Values are bytes, keys are strings (usually a content hash).
+    * When the total size of the values exceeds `max_bytes`,
+      the least recently used entries are evicted, down to `EVICT_TO` of `max_bytes`.
+      The total is kept up to date by `put` and only summed up again before evicting.
+    * One store can be shared by several threads and several processes.
+    """
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES, table: str = "cache") -> None:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.table = table
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ("
+                          "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                          "size INTEGER NOT NULL, accessed REAL NOT NULL)")
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table}(accessed)")
+        self.conn.commit()
+        # total size of the values, other processes sharing the file may have added more
+        self.total = self.sum_sizes()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self.lock:
+            row = self.conn.execute(f"SELECT value FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            return row[0]
+
+    def put(self, key: str, value: bytes) -> None:
+        with self.lock:
+            row = self.conn.execute(f"SELECT size FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(f"INSERT OR REPLACE INTO {self.table} (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                              (key, sqlite3.Binary(value), len(value), time.time()))
+            self.total += len(value) - (row[0] if row is not None else 0)
+            if self.total > self.max_bytes:
+                self.evict()
+            self.conn.commit()
+
+    def evict(self) -> None:
+        """
+        Used to delete the least recently used entries until the store fits in `EVICT_TO` of `max_bytes`
+        """
+        self.total = self.sum_sizes()
+        if self.total <= self.max_bytes:
+            return
+        target = self.max_bytes * EVICT_TO
+        expired = []
+        for (key, size) in self.conn.execute(f"SELECT key, size FROM {self.table} ORDER BY accessed ASC"):
+            if self.total <= target:
+                break
+            expired.append((key,))
+            self.total -= size
+        self.conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", expired)
+
+    def sum_sizes(self) -> int:
+        return self.conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+
+    def size(self) -> int:
+        with self.lock:
+            return self.sum_sizes()
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    store = SqliteLRUStore(os.path.join(tempfile.mkdtemp(), "cache.db"), max_bytes=10)
+    store.put("a", b"12345")
+    store.put("b", b"12345")
+    store.get("a")
+    store.put("c", b"12345")
+    print(store.get("a"), store.get("b"), store.get("c"), len(store), store.size(), store.total)
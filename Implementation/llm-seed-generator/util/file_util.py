@@ -1,25 +1,154 @@
-def write_dict(input_dict: dict, is_static: bool):
-    result = ""
-    for value in input_dict.values():
-        input_generation = value["java"]
-        class_object = value["cons"]
-        import_statement = value["import"]
-        for i in range(len(input_generation)):
-            result += "Part1:"
-            result += input_generation[i]
-            result += "\nPart2:"
-            if not is_static:
-                if i < len(class_object):
-                    result += class_object[i]
-            result += "\nPart3:"
-            if i < len(import_statement):
-                result += import_statement[i]
-            result += "\n---------------\n"
-
-    with open('../input_generator', 'w') as f:
-        f.write(result)
+import json
+import os
+import threading
+
+from prompt.example_library import take_answer
+from util.graph_loader import load_graph
+from util.snapshot import is_snapshot, open_snapshot
+from util.trace import span
+
+OUTPUT_FORMATS = ("jsonl", "text")
+
+
+def read_graph(path: str = "graph.json", signature: str = None) -> dict:
+    """
+    Used to read a method graph, its nodes are decoded lazily, see `util.graph_loader`
+    :param path: a graph.json, or a snapshot of a whole library, see `util.snapshot`
+    :param signature: the method to read from a snapshot
+    """
+    with span("read_graph", "graph", path=path):
+        if is_snapshot(path):
+            if signature is None:
+                raise ValueError(f"{path} is a snapshot, a signature is required")
+            return open_snapshot(path).method_graph(signature)
+        return load_graph(path)
+
+
+def case_records(key, value: dict, is_static: bool):
+    """
+    Used to turn the test cases of one equivalence class into output records
+    :param key: the equivalence class
+    :param value: a dict with the lists "java", "cons" and "import"
+    :return: a generator of dicts:
+        partition: the equivalence class
+        input: the statements initialising the parameters
+        receiver: the statements initialising the object under test, empty for static methods
+        imports: the import statements of this case
+    """
+    input_generation = value["java"]
+    class_object = value["cons"]
+    import_statement = value["import"]
+    for i in range(len(input_generation)):
+        receiver = class_object[i] if not is_static and i < len(class_object) else ""
+        imports = import_statement[i] if i < len(import_statement) else ""
+        yield {
+            "partition": key,
+            "input": input_generation[i],
+            "receiver": receiver,
+            "imports": [line.strip() for line in imports.split("\n") if line.strip()]
+        }
+
+
+def format_partition(key, value: dict, is_static: bool, output_format: str = "jsonl") -> str:
+    """
+    Used to format the test cases of one equivalence class, see `write_dict` for the formats
+    """
+    if output_format == "jsonl":
+        return "".join(json.dumps(record) + "\n" for record in case_records(key, value, is_static))
+    result = []
+    input_generation = value["java"]
+    class_object = value["cons"]
+    import_statement = value["import"]
+    for i in range(len(input_generation)):
+        result.append("Part1:")
+        result.append(input_generation[i])
+        result.append("\nPart2:")
+        if not is_static:
+            if i < len(class_object):
+                result.append(class_object[i])
+        result.append("\nPart3:")
+        if i < len(import_statement):
+            result.append(import_statement[i])
+        result.append("\n---------------\n")
+    return "".join(result)
+
+
+class CaseWriter:
+    """
+    Used to write test cases into the output file as soon as an equivalence class is finished.
+    Cases go to `<path>.tmp` first, which replaces `path` when the writer is closed,
+    so readers never see a partial output; the temporary file is dropped on errors.
+    If a stream is given, every case is also sent to it as a JSON line right away.
+    The cases any of the validators rejects are dropped, see `driver.compile_validator.case_validators`.
+    With an example library and validators, the answers all of whose cases pass become few-shot examples,
+    see `prompt.example_library.ExampleLibrary.harvest_accepted`.
+    """
+
+    def __init__(self, path: str, is_static: bool, output_format: str = "jsonl", stream=None,
+                 validators=(), examples=None) -> None:
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"unknown output format: {output_format}")
+        self.path = path
+        self.is_static = is_static
+        self.output_format = output_format
+        self.stream = stream
+        self.validators = validators
+        self.examples = examples
+        self.tmp_path = path + ".tmp"
+        self.file = open(self.tmp_path, "w")
+        self.cases = 0
+        self.lock = threading.Lock()
+
+    def write_partition(self, key, value: dict) -> None:
+        answer = take_answer(value)
+        offered = len(value["java"])
+        for validator in self.validators:
+            with span(f"{type(validator).__name__}.screen", "validate"):
+                value = validator.screen(key, value)
+        with span("write_partition", "output"):
+            content = format_partition(key, value, self.is_static, self.output_format)
+            with self.lock:
+                self.file.write(content)
+                self.file.flush()
+                if self.stream is not None:
+                    self.stream.write(content if self.output_format == "jsonl"
+                                      else format_partition(key, value, self.is_static))
+                    self.stream.flush()
+                self.cases += len(value["java"])
+        # without validators nothing tells whether the cases are right
+        if self.examples is not None and self.validators:
+            self.examples.harvest_accepted(answer, value, offered)
+
+    def close(self) -> None:
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def discard(self) -> None:
+        self.file.close()
+        os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+def write_dict(input_dict: dict, is_static: bool, path: str = '../input_generator', output_format: str = "jsonl"):
+    """
+    Used to write all the test cases at once
+    :param output_format: "jsonl", one JSON record per case, see `case_records`,
+                          or "text", the Part1/Part2/Part3 blocks separated by dashes
+    """
+    with span("write_dict", "output"), CaseWriter(path, is_static, output_format) as writer:
+        for (key, value) in input_dict.items():
+            writer.write_partition(key, value)
 
 
 if __name__ == "__main__":
     test_dict = {'1. `startIndex`: is negative; 2. `endIndex`: can be any integer': {'java': ['int startIndex = -5;\n        int endIndex = 10;', 'import org.apache.commons.lang3.text.StrBuilder;', 'int startIndex = -3;\n        int endIndex = 5;', 'import java.lang.String;\n        import org.apache.commons.lang3.text.StrBuilder;'], 'cons': ['int initialCapacity = 20;\n        StrBuilder strBuilder = new StrBuilder(initialCapacity);', 'String str = "Hello";\n        StrBuilder strBuilder = new StrBuilder(str);']}, '1. `startIndex`: is greater than or equal to the length of the `StrBuilder` object; 2. `endIndex`: can be any integer': {'java': ['int startIndex = 5;\n        int endIndex = 10;', 'import org.apache.commons.lang3.text.StrBuilder;', 'int startIndex = 0;\n        int endIndex = 15;', 'import java.lang.String;\n        import org.apache.commons.lang3.text.StrBuilder;'], 'cons': ['int initialCapacity = 20;\n        StrBuilder strBuilder = new StrBuilder(initialCapacity);', 'String str = "Hello World";\n        StrBuilder strBuilder = new StrBuilder(str);']}, '1. `startIndex`: is less than the length of the `StrBuilder` object; 2. `endIndex`: is less than or equal to `startIndex`': {'java': ['int startIndex = 2;\n        int endIndex = 2;', 'import org.apache.commons.lang3.text.StrBuilder;', 'int startIndex = 0;\n        int endIndex = 3;', 'import java.lang.String;\n        import org.apache.commons.lang3.text.StrBuilder;'], 'cons': ['int initialCapacity = 10;\n        StrBuilder strBuilder = new StrBuilder(initialCapacity);', 'String str = "Hello";\n        StrBuilder strBuilder = new StrBuilder(str);']}, '1. `startIndex`: is less than the length of the `StrBuilder` object; 2. `endIndex`: is greater than `startIndex` and less than the length of the `StrBuilder` object': {'java': ['int startIndex = 2;\n        int endIndex = 5;', 'import org.apache.commons.lang3.text.StrBuilder;', 'int startIndex = 0;\n        int endIndex = 3;', 'import org.apache.commons.lang3.text.StrBuilder;'], 'cons': ['StrBuilder strBuilder = new StrBuilder("Hello World");', 'StrBuilder strBuilder = new StrBuilder("Java");']}, '1. `startIndex`: is less than the length of the `StrBuilder` object; 2. `endIndex`: is greater than or equal to the length of the `StrBuilder` object': {'java': ['int startIndex = 0;\n        int endIndex = 5;', 'import org.apache.commons.lang3.text.StrBuilder;', 'int startIndex = 2;\n        int endIndex = 10;', 'import org.apache.commons.lang3.text.StrBuilder;'], 'cons': ['StrBuilder strBuilder = new StrBuilder("Hello World");', 'StrBuilder strBuilder = new StrBuilder();']}}
     write_dict(test_dict, False)
+    write_dict(test_dict, False, '../input_generator.txt', output_format="text")
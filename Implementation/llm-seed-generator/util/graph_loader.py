@@ -0,0 +1,152 @@
+import json
+import mmap
+import re
+import threading
+from collections.abc import Mapping
+from typing import List, Tuple
+
+# everything up to the next bracket which is not inside a string (raw newlines included)
+NON_BRACKETS = re.compile(rb'(?:[^"{}\[\]]+|"[^"\\]*(?:\\.[^"\\]*)*")*', re.S)
+STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+SCALAR = re.compile(rb'[^\s,}\]]+')
+WHITESPACE = re.compile(rb'\s*')
+COLON = re.compile(rb'\s*:\s*')
+SEPARATOR = re.compile(rb'\s*([,}])\s*')
+DECODER = json.JSONDecoder(strict=False)
+OPEN_BRACKETS = (ord("{"), ord("["))
+
+
+def decode(buf) -> object:
+    """
+    Used to decode one JSON value of graph.json.
+    The graph is written with raw newlines inside strings (e.g. the code of a method),
+    they are dropped exactly like `json.loads(content.replace("\\n", ""))` used to do.
+    """
+    return DECODER.decode(bytes(buf).replace(b"\n", b"").decode("utf-8"))
+
+
+def decode_key(buf) -> str:
+    raw = bytes(buf)
+    if b"\\" in raw:
+        return decode(raw)
+    return raw[1:-1].replace(b"\n", b"").decode("utf-8")
+
+
+def skip_space(buf, pos: int) -> int:
+    return WHITESPACE.match(buf, pos).end()
+
+
+def value_end(buf, pos: int) -> int:
+    """
+    Used to find where the JSON value starting at `pos` ends, without decoding it
+    """
+    first = buf[pos]
+    if first == ord('"'):
+        return STRING.match(buf, pos).end()
+    if first in OPEN_BRACKETS:
+        (depth, size) = (0, len(buf))
+        while pos < size:
+            depth += 1 if buf[pos] in OPEN_BRACKETS else -1
+            pos += 1
+            if depth == 0:
+                return pos
+            pos = NON_BRACKETS.match(buf, pos).end()
+        raise ValueError(f"unterminated value at {pos}")
+    return SCALAR.match(buf, pos).end()
+
+
+def members(buf, pos: int, index: str = None) -> Tuple[List[Tuple[str, int, int]], int]:
+    """
+    Used to index the members of the JSON object starting at `pos`
+    :param index: a member whose value is an object is indexed too instead of being skipped
+    :return: ([(key, start of value, end of value or its own index)], end of object)
+    """
+    if buf[pos] != ord("{"):
+        raise ValueError(f"expected an object at {pos}")
+    result = []
+    pos = skip_space(buf, pos + 1)
+    if buf[pos] == ord("}"):
+        return result, pos + 1
+    while True:
+        key_end = STRING.match(buf, pos).end()
+        key = decode_key(buf[pos:key_end])
+        colon = COLON.match(buf, key_end)
+        if colon is None:
+            raise ValueError(f"expected ':' at {key_end}")
+        start = colon.end()
+        if key == index and buf[start] == ord("{"):
+            (sub_members, end) = members(buf, start)
+            result.append((key, start, sub_members))
+        else:
+            end = value_end(buf, start)
+            result.append((key, start, end))
+        separator = SEPARATOR.match(buf, end)
+        if separator is None:
+            raise ValueError(f"expected ',' or '}}' at {end}")
+        if separator.group(1) == b"}":
+            return result, separator.start(1) + 1
+        pos = separator.end()
+
+
+class LazyNodes(Mapping):
+    """
+    The `nodes` of a method graph, read only.
+    Only the position of every node in the file is known after loading,
+    a node is decoded when it is looked up for the first time.
+    """
+
+    def __init__(self, buf, spans: dict) -> None:
+        self.buf = buf
+        self.spans = spans
+        self.decoded = {}
+        self.lock = threading.Lock()
+
+    def __getitem__(self, typ: str):
+        node = self.decoded.get(typ)
+        if node is None:
+            (start, end) = self.spans[typ]
+            with self.lock:
+                node = self.decoded.get(typ)
+                if node is None:
+                    node = decode(self.buf[start:end])
+                    self.decoded[typ] = node
+        return node
+
+    def __contains__(self, typ) -> bool:
+        return typ in self.spans
+
+    def __iter__(self):
+        return iter(self.spans)
+
+    def __len__(self) -> int:
+        return len(self.spans)
+
+    def to_dict(self) -> dict:
+        return {typ: self[typ] for typ in self.spans}
+
+
+def load_graph(path: str = "graph.json") -> dict:
+    """
+    Used to load a method graph through an mmap of the file.
+    Every member but `nodes` is decoded right away, `nodes` is a `LazyNodes`.
+    """
+    with open(path, "rb") as file:
+        try:
+            buf = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # an empty file cannot be mapped
+            return decode(file.read())
+    graph = {}
+    (entries, _) = members(buf, skip_space(buf, 0), index="nodes")
+    for (key, start, end) in entries:
+        if isinstance(end, list):
+            graph[key] = LazyNodes(buf, {typ: (s, e) for (typ, s, e) in end})
+        else:
+            graph[key] = decode(buf[start:end])
+    return graph
+
+
+if __name__ == "__main__":
+    mg = load_graph("../graph.json")
+    print(f"{len(mg['nodes'])} nodes, parameters: {mg['parameters']}")
+    print(mg["nodes"][mg["className"]])
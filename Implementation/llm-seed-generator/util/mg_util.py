@@ -1,9 +1,12 @@
 import json
 import random
 import sys
-from queue import Queue
+import threading
+from collections import OrderedDict
 from typing import Dict
 
+from util.trace import span
+
 OBTAIN_ALL_PARAM_INFO = -1
 
 
@@ -19,126 +22,231 @@ def code_block(mg: dict) -> str:
     return mg["code"]
 
 
-def parameters(mg: dict, layer: int = OBTAIN_ALL_PARAM_INFO, max_sub_num: int = sys.maxsize) -> Dict[str, Dict]:
+def signature(mg: dict) -> str:
+    """
+    e.g. org.apache.commons.lang3.StringUtils.abbreviate(java.lang.String,int)
+    """
+    return f"{mg.get('className')}.{mg.get('methodName')}({','.join(mg.get('parameters', {}).values())})"
+
+
+def check_class_object(mg: dict) -> None:
+    """
+    Used to make sure that the receiver of a non-static method can be initiated
+    """
+    if mg["static"] is False:
+        class_name = mg["className"]
+        class_node = mg["nodes"][class_name]
+        if len(class_node.get("constructors", "")) == 0 and len(class_node.get("builders", "")) == 0:
+            raise Exception("Cannot initiate class object.")
+
+
+class TypeNode:
+    """
+    The part of a type's node in the method graph that the parameter BFS needs,
+    with every referenced type interned to its integer id.
+    """
+    __slots__ = ("jdk", "class_type", "constructors", "sub_classes", "implemented_classes",
+                 "sub_interfaces", "field_types", "param_types")
+
+    def __init__(self, t_node: dict, intern) -> None:
+        # an empty node means that it's a jdk-builtin type
+        self.jdk = not t_node
+        t_node = t_node or {}
+        self.class_type = t_node.get("classType")
+        self.constructors = t_node.get("constructors", dict())
+        self.sub_classes = tuple(map(intern, t_node.get("subClassName") or ()))
+        self.implemented_classes = tuple(map(intern, t_node.get("implementedClassName") or ()))
+        self.sub_interfaces = tuple(map(intern, t_node.get("subInterfaceName") or ()))
+        self.field_types = tuple(map(intern, (t_node.get("fields") or {}).values()))
+        if self.class_type == "class" and t_node.get("constructors"):
+            self.param_types = tuple(intern(param_t) for constructor_params in t_node["constructors"].values()
+                                     for param_t in constructor_params.values())
+        else:
+            self.param_types = ()
+
+
+class MethodGraph:
+    """
+    An indexed view of a method graph.
+    Type names are interned to integer ids and the nodes are turned into `TypeNode`
+    records when the BFS reaches them for the first time, so a graph is only parsed once
+    however many times it is searched.
+    """
+
+    def __init__(self, mg: dict) -> None:
+        self.mg = mg
+        self.raw_nodes = mg["nodes"]
+        self.names = []
+        self.ids = {}
+        # records[i] is the TypeNode of names[i], None if the type has no node, False if not built yet
+        self.records = []
+
+    def intern(self, name: str) -> int:
+        tid = self.ids.get(name)
+        if tid is None:
+            tid = len(self.names)
+            self.ids[name] = tid
+            self.names.append(name)
+            self.records.append(False)
+        return tid
+
+    def node(self, tid: int):
+        record = self.records[tid]
+        if record is False:
+            name = self.names[tid]
+            record = TypeNode(self.raw_nodes[name], self.intern) if name in self.raw_nodes else None
+            self.records[tid] = record
+        return record
+
+    def bfs(self, roots, visit, layer: int = OBTAIN_ALL_PARAM_INFO) -> None:
+        """
+        Used to do a layered BFS over type ids
+        :param roots: ids of the first layer
+        :param visit: called with (id, current layer) for every id popped from the queue,
+                      returns the ids to be searched in the next layer
+        :param layer: the last layer to be searched, -1 means to search all layers
+        """
+        current, following, current_layer = list(roots), [], 0
+        while True:
+            for tid in current:
+                following.extend(visit(tid, current_layer))
+            if layer != OBTAIN_ALL_PARAM_INFO and current_layer >= layer:
+                return
+            current_layer += 1
+            if not following:
+                return
+            current, following = following, []
+
+    def parameters(self, roots, layer: int = OBTAIN_ALL_PARAM_INFO, max_sub_num: int = sys.maxsize) -> Dict[str, Dict]:
+        """
+        See `parameters`, `roots` are the type names of the method parameters
+        """
+        types: Dict[str, Dict] = {}
+        visited = set()
+        names = self.names
+
+        def limited(sub_ids, prefix, following) -> dict:
+            # keep at most max_sub_num sub types, numbered like the original implementation
+            result = {}
+            size = max_sub_num if len(sub_ids) > max_sub_num else len(sub_ids)
+            for sid in sub_ids:
+                size -= 1
+                if sid not in visited:
+                    result[prefix + str(max_sub_num - size)] = names[sid]
+                    following.append(sid)
+                if size == 0:
+                    break
+            return result
+
+        def visit(tid, current_layer):
+            node = self.node(tid)
+            if node is None or tid in visited:
+                return ()
+            visited.add(tid)
+            if node.jdk:
+                types[names[tid]] = {"__is_jdk_type__": True}
+                return ()
+            info = {"classType": node.class_type}
+            types[names[tid]] = info
+            following = []
+            if node.class_type == "class":
+                info["constructors"] = dict(node.constructors)
+            if current_layer < layer:
+                if node.sub_classes:
+                    info["subClassName"] = limited(node.sub_classes, "subClass", following)
+                if node.implemented_classes:
+                    info["implementedClassName"] = limited(node.implemented_classes, "implementedClass", following)
+                if node.sub_interfaces:
+                    sub_interfaces = limited(node.sub_interfaces, "subInterface", following)
+                    if sub_interfaces:
+                        info["subInterfaceName"] = sub_interfaces
+            following.extend(node.field_types)
+            following.extend(node.param_types)
+            return following
+
+        self.bfs([self.intern(t) for t in roots], visit, layer)
+        return types
+
+
+class ParameterCache:
+    """
+    Used to share the results of `parameters` between all the chains working on a method graph.
+    Results are keyed by (graph identity, layer, max_sub_num): the graph is the dict object
+    itself, so a graph must not be modified while it is being generated for, and
+    the returned dicts are shared and must not be modified either.
+    Only the `max_graphs` most recently used graphs are kept.
+    If a compactor is given, its `types` is applied to every result, see prompt/compaction.py.
+    """
+
+    def __init__(self, max_graphs: int = 16, compactor=None) -> None:
+        self.max_graphs = max_graphs
+        self.compactor = compactor
+        # id(mg) -> (mg, its MethodGraph, {(layer, max_sub_num): result})
+        self.graphs = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def parameters(self, mg: dict, layer: int = OBTAIN_ALL_PARAM_INFO, max_sub_num: int = sys.maxsize) -> Dict[str, Dict]:
+        with self.lock:
+            entry = self.graphs.get(id(mg))
+            # an id can be reused by a new dict once the old one is freed
+            if entry is None or entry[0] is not mg:
+                entry = (mg, MethodGraph(mg), {})
+                self.graphs[id(mg)] = entry
+                if len(self.graphs) > self.max_graphs:
+                    self.graphs.popitem(last=False)
+            else:
+                self.graphs.move_to_end(id(mg))
+            (_, graph, results) = entry
+            types = results.get((layer, max_sub_num))
+            if types is None:
+                self.misses += 1
+                types = graph.parameters(mg["parameters"].values(), layer=layer, max_sub_num=max_sub_num)
+                if self.compactor is not None:
+                    types = self.compactor.types(mg, types)
+                results[(layer, max_sub_num)] = types
+            else:
+                self.hits += 1
+            return types
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def parameters(mg: dict, layer: int = OBTAIN_ALL_PARAM_INFO, max_sub_num: int = sys.maxsize,
+               cache: ParameterCache = None) -> Dict[str, Dict]:
     """
     Used to get parameter information of method graph
     :param mg: a method graph
     :param layer: the layer this function would search.
                   -1 by default, means to obtain all types
     :param max_sub_num: maximum number of subclasses to be extracted
+    :param cache: if given, the result is taken from and kept in it, see `ParameterCache`
     :return: a dict:
         key: fully qualified name of type,
         value: a dict:
             key: the signature of constructor of this type
             value: a dict (key: param name, value: param type)
     """
-    types: Dict[str, Dict] = {}
-    q1, q2, current_layer = Queue(), Queue(), 0
-    s = set()
-    # initialize, q1 and q2 are both used to do bfs.
-    # q1 is used to pop, while q2 is used to load types of new layer
-    [q1.put_nowait(param_type) for (param_name, param_type) in mg["parameters"].items()]
-    while not q1.empty():
-        typ = q1.get_nowait()
-        if typ in mg["nodes"]:
-
-            t_node = mg["nodes"][typ]
-            if typ not in s:
-                s.add(typ)
-                if not t_node:
-                    # it means that it's a jdk-builtin type
-                    types[typ] = types.get(typ, dict())
-                    types[typ].update({"__is_jdk_type__": True})
-                else:
-                    types[typ] = types.get(typ, dict())
-                    types[typ] = {**types[typ], "classType": t_node.get("classType")}
-                    node = types[typ]
-                    if t_node.get("classType") == "class":
-                        node["constructors"] = node.get("constructors", dict())
-                        node["constructors"] = {**node["constructors"],
-                                                **t_node.get("constructors", dict())}
-                    if t_node.get("subClassName"):
-                        if current_layer < layer:
-                            size = max_sub_num if len(t_node.get("subClassName")) > max_sub_num else len(
-                                t_node.get("subClassName"))
-                            node["subClassName"] = node.get("subClassName", dict())
-
-                            # key = random.choice(list(t_node.get("subClassName")))
-                            # node["subClassName"] = {**node["subClassName"], "subClass0": key}
-                            # q2.put_nowait(key)
-
-                            for subClass_t in t_node["subClassName"]:
-                                size -= 1
-                                if not types.get(subClass_t):
-                                    node["subClassName"] = node.get("subClassName", dict())
-                                    node["subClassName"] = {**node["subClassName"],
-                                                            "subClass" + str(max_sub_num - size): subClass_t}
-                                    q2.put_nowait(subClass_t)
-                                if size == 0:
-                                    break
-                    if t_node.get("implementedClassName"):
-                        if current_layer < layer:
-                            size = max_sub_num if len(t_node.get("implementedClassName")) > max_sub_num else len(
-                                t_node.get("implementedClassName"))
-                            node["implementedClassName"] = node.get("implementedClassName", dict())
-
-                            # key = random.choice(list(t_node.get("subClassName")))
-                            # node["subClassName"] = {**node["subClassName"], "subClass0": key}
-                            # q2.put_nowait(key)
-
-                            for subInterface_t in t_node["implementedClassName"]:
-                                size -= 1
-                                if not types.get(subInterface_t):
-                                    node["implementedClassName"] = node.get("implementedClassName", dict())
-                                    node["implementedClassName"] = {**node["implementedClassName"],
-                                                            "implementedClass" + str(max_sub_num - size): subInterface_t}
-                                    q2.put_nowait(subInterface_t)
-                                if size == 0:
-                                    break
-                    if t_node.get("subInterfaceName"):
-                        if current_layer < layer:
-                            size = max_sub_num if len(t_node.get("subInterfaceName")) > max_sub_num else len(
-                                t_node.get("subInterfaceName"))
-                            for sub_interface_t in t_node["subInterfaceName"]:
-                                size -= 1
-                                if not types.get(sub_interface_t):
-                                    node["subInterfaceName"] = node.get("subInterfaceName", dict())
-                                    node["subInterfaceName"] = {**node["subInterfaceName"],
-                                                                "subInterface" + str(max_sub_num - size): sub_interface_t}
-                                    q2.put_nowait(sub_interface_t)
-                                if size == 0:
-                                    break
-                    if t_node.get("fields"):
-                        for field_t in t_node["fields"].values():
-                            q2.put_nowait(field_t)
-                    if t_node.get("constructors"):
-                        if t_node.get("classType") == "class":
-                            for constructor_params in t_node["constructors"].values():
-                                for param_t in constructor_params.values():
-                                    q2.put_nowait(param_t)
-        # since q1.get_nowait might pop the last element in queue,
-        # to avoid jumping out this loop when q2 is not empty,
-        # push all the elements of q2 into q1
-        if q1.empty():
-            if layer != OBTAIN_ALL_PARAM_INFO and current_layer >= layer:
-                return types
-            current_layer += 1
-            while not q2.empty():
-                q1.put_nowait(q2.get_nowait())
-    return types
+    with span("mg_util.parameters", "graph", layer=layer):
+        if cache is not None:
+            return cache.parameters(mg, layer=layer, max_sub_num=max_sub_num)
+        return MethodGraph(mg).parameters(mg["parameters"].values(), layer=layer, max_sub_num=max_sub_num)
 
 
-def parameter_info(mg: dict, layer: int = OBTAIN_ALL_PARAM_INFO, max_sub_num: int = sys.maxsize) -> str:
+def parameter_info(mg: dict, layer: int = OBTAIN_ALL_PARAM_INFO, max_sub_num: int = sys.maxsize,
+                   cache: ParameterCache = None) -> str:
     """
     Used to compose the information of parameters
     :param max_sub_num: Maximum number of subsequent subclasses of a class
     :param mg: a method graph
     :param layer: the layer this function would search.
                   -1 by default, means to obtain all types
+    :param cache: see `parameters`
     :return: a str with parameter information
     """
-    required_params = parameters(mg, layer=layer, max_sub_num=max_sub_num)
-    print(required_params)
+    required_params = parameters(mg, layer=layer, max_sub_num=max_sub_num, cache=cache)
     result = ""
     for (typ, infos) in required_params.items():
         if "__is_jdk_type__" in infos and infos["__is_jdk_type__"]:
@@ -162,9 +270,9 @@ def parameter_info(mg: dict, layer: int = OBTAIN_ALL_PARAM_INFO, max_sub_num: in
 
 
 if __name__ == "__main__":
-    file = open("../graph.json", "r")
-    file_content = file.read()
-    file.close()
-    mg1 = json.loads(file_content.replace("\n", ""))
+    from util.file_util import read_graph
+
+    # python3 -m util.mg_util [GRAPH_OR_SNAPSHOT [SIGNATURE]]
+    mg1 = read_graph(*(sys.argv[1:3] or ["../graph.json"]))
     result1 = parameter_info(mg1, layer=5, max_sub_num=3)
     print(result1)
@@ -0,0 +1,164 @@
+"""
+Run `python3 -m util.snapshot SNAPSHOT [SIGNATURE]` in llm-seed-generator to list the signatures
+of a snapshot or print the method graph of one of them.
+
+A snapshot holds the method graphs of a whole library in one file:
+
+    MGSNAP1\n | index offset (8 bytes) | index length (8 bytes) | records ... | index
+
+* Type nodes are stored once: two methods share a node record when the type and its node are equal.
+* A method record is its method graph without `nodes`, plus `nodeIds` (type -> node record id).
+* The index (JSON, at the end) holds the offset and length of every node and method record,
+  so one signature is found without reading the records of the others.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+from util.graph_loader import LazyNodes, decode
+
+MAGIC = b"MGSNAP1\n"
+HEADER = struct.Struct("<QQ")
+HEADER_SIZE = len(MAGIC) + HEADER.size
+
+
+def is_snapshot(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class SnapshotWriter:
+    """
+    Used to write a snapshot one method graph at a time, the nodes already written are not written again
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.file = open(self.tmp_path, "wb")
+        self.file.write(MAGIC + HEADER.pack(0, 0))
+        self.offset = HEADER_SIZE
+        # [(offset, length)] of node records, node id -> position in this list
+        self.nodes: List[Tuple[int, int]] = []
+        self.node_ids: Dict[str, int] = {}
+        self.methods: Dict[str, Tuple[int, int]] = {}
+
+    def write_record(self, record) -> Tuple[int, int]:
+        content = json.dumps(record, separators=(",", ":")).encode("utf-8")
+        span = (self.offset, len(content))
+        self.file.write(content)
+        self.offset += len(content)
+        return span
+
+    def node_id(self, typ: str, node: dict) -> int:
+        content = json.dumps([typ, node], sort_keys=True)
+        key = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        node_id = self.node_ids.get(key)
+        if node_id is None:
+            node_id = len(self.nodes)
+            self.nodes.append(self.write_record(node))
+            self.node_ids[key] = node_id
+        return node_id
+
+    def add(self, signature: str, mg: dict) -> None:
+        record = {key: value for (key, value) in mg.items() if key != "nodes"}
+        record["nodeIds"] = {typ: self.node_id(typ, mg["nodes"][typ]) for typ in mg["nodes"]}
+        self.methods[signature] = self.write_record(record)
+
+    def close(self) -> None:
+        (index_offset, index_length) = self.write_record({"nodes": self.nodes, "methods": self.methods})
+        self.file.seek(len(MAGIC))
+        self.file.write(HEADER.pack(index_offset, index_length))
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def stats(self) -> dict:
+        return {"methods": len(self.methods), "nodes": len(self.nodes), "bytes": self.offset}
+
+
+def write_snapshot(path: str, graphs: Iterable[Tuple[str, dict]]) -> dict:
+    """
+    :param graphs: (signature, method graph) pairs
+    """
+    writer = SnapshotWriter(path)
+    for (signature, mg) in graphs:
+        writer.add(signature, mg)
+    writer.close()
+    return writer.stats()
+
+
+class Snapshot:
+    """
+    Used to read method graphs from a snapshot through an mmap of the file,
+    the nodes of a method graph are decoded when they are looked up, see `LazyNodes`
+    """
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as file:
+            self.buf = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            # the file mapped, `SnapshotWriter.close` replaces the file at `path` by a new one
+            self.identity = file_identity(os.fstat(file.fileno()))
+        if self.buf[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a method graph snapshot")
+        (index_offset, index_length) = HEADER.unpack_from(self.buf, len(MAGIC))
+        index = decode(self.buf[index_offset:index_offset + index_length])
+        self.nodes = index["nodes"]
+        self.methods = index["methods"]
+
+    def signatures(self) -> List[str]:
+        return list(self.methods)
+
+    def __contains__(self, signature: str) -> bool:
+        return signature in self.methods
+
+    def method_graph(self, signature: str) -> dict:
+        """
+        :return: the method graph of a signature, like the graph.json of llm-jtype-provider
+        """
+        if signature not in self.methods:
+            raise KeyError(f"{signature} is not in the snapshot")
+        (offset, length) = self.methods[signature]
+        mg = decode(self.buf[offset:offset + length])
+        spans = {typ: (self.nodes[node_id][0], self.nodes[node_id][0] + self.nodes[node_id][1])
+                 for (typ, node_id) in mg.pop("nodeIds").items()}
+        mg["nodes"] = LazyNodes(self.buf, spans)
+        return mg
+
+
+SNAPSHOTS: Dict[str, Snapshot] = {}
+SNAPSHOTS_LOCK = threading.Lock()
+
+
+def file_identity(stat: os.stat_result) -> tuple:
+    return stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def open_snapshot(path: str) -> Snapshot:
+    """
+    Used to open a snapshot once per file, its index is parsed only the first time.
+    A snapshot written again at the same path, e.g. while a server is running, is opened again,
+    the method graphs read from the old file keep its mmap.
+    """
+    path = os.path.abspath(path)
+    identity = file_identity(os.stat(path))
+    with SNAPSHOTS_LOCK:
+        snapshot = SNAPSHOTS.get(path)
+        if snapshot is None or snapshot.identity != identity:
+            snapshot = SNAPSHOTS[path] = Snapshot(path)
+        return snapshot
+
+
+if __name__ == "__main__":
+    snapshot = open_snapshot(sys.argv[1])
+    if len(sys.argv) > 2:
+        graph = snapshot.method_graph(sys.argv[2])
+        print(json.dumps({**graph, "nodes": graph["nodes"].to_dict()}, indent=2))
+    else:
+        print(f"{len(snapshot.methods)} methods, {len(snapshot.nodes)} nodes")
+        for sig in snapshot.signatures():
+            print(sig)
@@ -0,0 +1,136 @@
+"""
+Used to record nested spans of the seed generation and export them as Chrome trace events,
+which chrome://tracing and https://ui.perfetto.dev show as a timeline per thread.
+
+Tracing is off until `start` is called (`python3 main.py --trace PATH`), `span` costs nothing until then.
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+TRACER = None
+
+
+class Tracer:
+    def __init__(self) -> None:
+        self.origin = time.perf_counter_ns()
+        self.events = []
+        self.threads = {}
+        self.lock = threading.Lock()
+
+    def now(self) -> float:
+        # microseconds, the unit of the trace event format
+        return (time.perf_counter_ns() - self.origin) / 1000
+
+    @contextlib.contextmanager
+    def span(self, name: str, cat: str, args: dict):
+        thread = threading.current_thread()
+        start = self.now()
+        try:
+            yield args
+        finally:
+            event = {"name": name, "cat": cat, "ph": "X", "ts": start, "dur": self.now() - start,
+                     "pid": os.getpid(), "tid": thread.ident, "args": args}
+            with self.lock:
+                self.events.append(event)
+                self.threads.setdefault(thread.ident, thread.name)
+
+    def trace_events(self) -> list:
+        with self.lock:
+            names = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                     for (tid, name) in self.threads.items()]
+            return names + sorted(self.events, key=lambda event: event["ts"])
+
+    def summary(self) -> dict:
+        """
+        :return: span name -> number of spans and their total duration in seconds
+        """
+        totals = OrderedDict()
+        with self.lock:
+            for event in self.events:
+                total = totals.setdefault(event["name"], {"count": 0, "seconds": 0.0})
+                total["count"] += 1
+                total["seconds"] += event["dur"] / 1e6
+        return totals
+
+
+def span(name: str, cat: str = "pipeline", **args):
+    """
+    Used as `with span("llm.generate", "llm", stage=...):`, the args are shown with the span
+    and can be added to inside the block
+    """
+    if TRACER is None:
+        return contextlib.nullcontext(args)
+    return TRACER.span(name, cat, args)
+
+
+def traced(obj, name: str, cat: str = "pipeline"):
+    """
+    Used to wrap a callable into a span
+    """
+    def call(*args, **kwargs):
+        with span(name, cat):
+            return obj(*args, **kwargs)
+
+    return call
+
+
+class TracedPrompt:
+    """
+    Used to trace the `format_messages` of a langchain prompt template
+    """
+
+    def __init__(self, prompt, name: str) -> None:
+        self.prompt = prompt
+        self.format_messages = traced(prompt.format_messages, name, "prompt")
+
+    def __getattr__(self, name):
+        if name == "prompt":
+            raise AttributeError(name)
+        return getattr(self.prompt, name)
+
+
+def instrument_chain(chain, chain_name: str):
+    """
+    Used to trace the prompt formatting and the response parsing of a chain,
+    i.e. the `format_messages` of its prompt templates and its `parse_*` methods
+    """
+    if TRACER is None:
+        return chain
+    for (attribute, value) in list(vars(chain).items()):
+        if hasattr(value, "format_messages"):
+            setattr(chain, attribute, TracedPrompt(value, f"{chain_name}.{attribute}.format_messages"))
+    for attribute in dir(type(chain)):
+        if attribute.startswith("parse_") and callable(getattr(chain, attribute)):
+            setattr(chain, attribute, traced(getattr(chain, attribute), f"{chain_name}.{attribute}", "parse"))
+    return chain
+
+
+def start() -> Tracer:
+    global TRACER
+    TRACER = Tracer()
+    return TRACER
+
+
+def stop(path: str) -> dict:
+    """
+    Used to write the trace to `path` and turn tracing off
+    :return: the summary of the spans, see `Tracer.summary`
+    """
+    global TRACER
+    (tracer, TRACER) = (TRACER, None)
+    with open(path, "w") as f:
+        json.dump({"traceEvents": tracer.trace_events(), "displayTimeUnit": "ms"}, f)
+    return tracer.summary()
+
+
+if __name__ == "__main__":
+    start()
+    with span("outer", answer=42):
+        with span("inner", "demo") as args:
+            time.sleep(0.01)
+            args["slept"] = 0.01
+    print(stop("trace.json"))